@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+
+import sys, os, json, argparse, math, time
+
+from collections import namedtuple
+
+import numpy
+
+import evaluate
+
+from common import print_err
+from common import DWIGException
+
+# a simulated annealing baseline, which runs many replicas of a problem at
+# once and measures the effort needed to reach the planted energy
+
+AnnealResult = namedtuple('AnnealResult', ['energies', 'best_energy', 'best_sample', 'target', 'sweeps_to_target', 'time_to_target', 'success_fraction', 'sweeps', 'time'])
+
+schedules = ['geometric', 'linear']
+
+
+def beta_schedule(sweeps, beta_range, schedule='geometric'):
+    '''The inverse temperature of each sweep, from beta_range[0] to
+    beta_range[1].
+    '''
+    assert(sweeps >= 1)
+    assert(schedule in schedules)
+    beta_min, beta_max = beta_range
+    assert(beta_min > 0.0 and beta_max >= beta_min)
+
+    if schedule == 'geometric':
+        return numpy.geomspace(beta_min, beta_max, sweeps)
+    return numpy.linspace(beta_min, beta_max, sweeps)
+
+
+def default_beta_range(model):
+    '''A beta range where the largest possible flip is accepted with
+    probability 1/2 in the first sweep and the smallest coefficient is
+    accepted with probability 1/100 in the last sweep.
+    '''
+    ptr, neighbors, weights = model.adjacency()
+    scale = abs(model.scale)
+
+    field_bound = numpy.abs(model.linear).copy()
+    numpy.add.at(field_bound, numpy.repeat(numpy.arange(len(model.variables)), numpy.diff(ptr)), numpy.abs(weights))
+    max_delta = 2.0*scale*field_bound.max() if len(field_bound) > 0 else 0.0
+
+    coefficients = numpy.abs(numpy.concatenate((model.linear, model.quadratic)))
+    coefficients = coefficients[coefficients > 0.0]
+    if len(coefficients) == 0:
+        return (1.0, 1.0)
+    min_delta = 2.0*scale*coefficients.min()
+
+    return (math.log(2.0)/max_delta, max(math.log(100.0)/min_delta, math.log(2.0)/max_delta))
+
+
+def colour_classes(model):
+    '''Partitions the variables into classes with no couplings inside a
+    class, so that each class can be updated at once.  Chimera problems are
+    bipartite and have two classes, other graphs are coloured greedily.
+    '''
+    ptr, neighbors, weights = model.adjacency()
+    num_variables = len(model.variables)
+
+    # breadth first two colouring
+    colour = -numpy.ones(num_variables, dtype=numpy.int64)
+    bipartite = True
+    for root in range(num_variables):
+        if colour[root] >= 0:
+            continue
+        colour[root] = 0
+        queue = [root]
+        while len(queue) > 0 and bipartite:
+            k = queue.pop()
+            for other in neighbors[ptr[k]:ptr[k+1]].tolist():
+                if colour[other] < 0:
+                    colour[other] = 1 - colour[k]
+                    queue.append(other)
+                elif colour[other] == colour[k]:
+                    bipartite = False
+                    break
+        if not bipartite:
+            break
+
+    if not bipartite:
+        colour = -numpy.ones(num_variables, dtype=numpy.int64)
+        for k in range(num_variables):
+            used = set(colour[neighbors[ptr[k]:ptr[k+1]]].tolist())
+            c = 0
+            while c in used:
+                c += 1
+            colour[k] = c
+
+    return [numpy.flatnonzero(colour == c) for c in range(colour.max()+1)] if num_variables > 0 else []
+
+
+class _ClassFields(object):
+    '''The couplings of one colour class, laid out so that the local fields
+    of all replicas are a single gather and a segmented sum.
+    '''
+    def __init__(self, model, members):
+        ptr, neighbors, weights = model.adjacency()
+        self.members = members
+        self.linear = model.linear[members]
+
+        degrees = ptr[members+1] - ptr[members]
+        self.coupled = numpy.flatnonzero(degrees > 0)
+        coupled_members = members[self.coupled]
+        lengths = degrees[self.coupled]
+
+        positions = numpy.arange(lengths.sum()) - numpy.repeat(numpy.cumsum(lengths) - lengths, lengths) + numpy.repeat(ptr[coupled_members], lengths)
+        self.neighbors = neighbors[positions]
+        self.weights = weights[positions]
+        self.starts = numpy.cumsum(lengths) - lengths
+
+    def fields(self, spins):
+        '''The local fields of the class members, for spins with one row per
+        variable and one column per replica.
+        '''
+        fields = numpy.repeat(self.linear[:, numpy.newaxis], spins.shape[1], axis=1)
+        if len(self.coupled) > 0:
+            fields[self.coupled] += numpy.add.reduceat(spins[self.neighbors]*self.weights[:, numpy.newaxis], self.starts, axis=0)
+        return fields
+
+
+def anneal(model, replicas=64, sweeps=1000, beta_range=None, schedule='geometric', target=None, stop_at_target=True, seed=None, tolerance=1e-9):
+    '''Runs simulated annealing on replicas independent copies of an
+    evaluate.EnergyModel, with Metropolis updates of one colour class at a
+    time.  When a target energy is given, the first sweep and elapsed time at
+    which a replica reaches it are recorded, and the run ends there if
+    stop_at_target is set.  The fraction of replicas that reach the target is
+    only meaningful over the whole schedule, so it is None unless
+    stop_at_target is False.  Energies are scaled like EnergyModel.energies.
+    '''
+    assert(replicas >= 1)
+    rng = numpy.random.RandomState(seed)
+    if beta_range == None:
+        beta_range = default_beta_range(model)
+    betas = beta_schedule(sweeps, beta_range, schedule)
+
+    start_time = time.time()
+    classes = [_ClassFields(model, members) for members in colour_classes(model)]
+
+    # spins are stored with one row per variable, so that the members of a
+    # class are contiguous rows
+    spins = (2*rng.randint(0, 2, size=(len(model.variables), replicas)) - 1).astype(numpy.float64)
+    energies = model.energies(spins.T)
+    best_energies = energies.copy()
+    best_samples = spins.T.copy()
+
+    hits = -numpy.ones(replicas, dtype=numpy.int64)
+    sweeps_to_target = None
+    time_to_target = None
+    threshold = None if target == None else target + tolerance*max(1.0, abs(target))
+
+    sweep = 0
+    for beta in betas.tolist():
+        sweep += 1
+        for fields in classes:
+            if len(fields.members) == 0:
+                continue
+            local_spins = spins[fields.members]
+            delta = -2.0*model.scale*local_spins*fields.fields(spins)
+            accept = numpy.logical_or(delta <= 0.0, rng.random_sample(delta.shape) < numpy.exp(-beta*numpy.maximum(delta, 0.0)))
+            spins[fields.members] = numpy.where(accept, -local_spins, local_spins)
+            energies += numpy.where(accept, delta, 0.0).sum(axis=0)
+
+        improved = energies < best_energies
+        if numpy.any(improved):
+            best_energies[improved] = energies[improved]
+            best_samples[improved] = spins[:, improved].T
+
+        if threshold != None:
+            reached = numpy.logical_and(hits < 0, energies <= threshold)
+            hits[reached] = sweep
+            if sweeps_to_target == None and numpy.any(reached):
+                sweeps_to_target = sweep
+                time_to_target = time.time() - start_time
+                if stop_at_target:
+                    break
+
+    # the incremental energies are refreshed to remove rounding drift
+    best_energies = model.energies(best_samples)
+    best = int(numpy.argmin(best_energies))
+    best_sample = dict(zip(model.variables, best_samples[best].astype(numpy.int8).tolist()))
+    success_fraction = None if target == None or stop_at_target else float(numpy.count_nonzero(hits >= 0))/replicas
+
+    return AnnealResult(best_energies, float(best_energies[best]), best_sample, target, sweeps_to_target, time_to_target, success_fraction, sweep, time.time() - start_time)
+
+
+def anneal_assignment(assignment, replicas=64, sweeps=1000, beta_range=None, schedule='geometric', stop_at_target=True, seed=None):
+    '''Anneals the problem of a QPUAssignment with its planted energy,
+    assignment.eval(), as the target.
+    '''
+    model = evaluate.from_configuration(assignment.qpu_config)
+    return anneal(model, replicas, sweeps, beta_range, schedule, assignment.eval(), stop_at_target, seed)
+
+
+def load_cases(path):
+    '''Yields (name, data) for a bqpjson file, a JSON lines file with one
+    problem per line, or every such file in a directory, in name order.
+    '''
+    if os.path.isdir(path):
+        for file_name in sorted(os.listdir(path)):
+            if file_name.endswith('.json') or file_name.endswith('.jsonl'):
+                for case in load_cases(os.path.join(path, file_name)):
+                    yield case
+    elif path.endswith('.jsonl'):
+        with open(path) as file:
+            for k, line in enumerate(file):
+                if len(line.strip()) > 0:
+                    yield '{}:{}'.format(path, k+1), json.loads(line)
+    else:
+        with open(path) as file:
+            yield path, json.load(file)
+
+
+def main(args, output_stream=sys.stdout):
+    beta_range = tuple(args.beta_range) if args.beta_range != None else None
+
+    for path in args.inputs:
+        if not os.path.exists(path):
+            raise DWIGException('input {} does not exist'.format(path))
+
+        for name, data in load_cases(path):
+            if data['variable_domain'] != 'spin':
+                raise DWIGException('annealing requires a spin domain problem, {} is {}'.format(name, data['variable_domain']))
+
+            model = evaluate.from_bqp(data)
+            target = None
+            if 'solutions' in data and len(data['solutions']) > 0:
+                planted = {term['id']: term['value'] for term in data['solutions'][0]['assignment']}
+                target = float(model.energies(model.sample_matrix([planted]))[0])
+            else:
+                print_err('warning: {} does not include a planted solution, reporting the best energy only'.format(name))
+
+            result = anneal(model, args.replicas, args.sweeps, beta_range, args.schedule, target, not args.full_schedule, args.seed)
+
+            summary = {
+                'file': name,
+                'variables': len(model.variables),
+                'replicas': args.replicas,
+                'sweeps': result.sweeps,
+                'time': result.time,
+                'min_energy': result.best_energy
+            }
+            if target != None:
+                summary['planted_energy'] = target
+                summary['sweeps_to_target'] = result.sweeps_to_target
+                summary['time_to_target'] = result.time_to_target
+                if args.full_schedule:
+                    summary['success_fraction'] = result.success_fraction
+
+            print(json.dumps(summary, sort_keys=True), file=output_stream)
+
+
+def build_cli_parser():
+    parser = argparse.ArgumentParser(description='runs a vectorized simulated annealing baseline on bqpjson problems and reports the sweeps and time needed to reach the planted energy')
+
+    parser.add_argument('inputs', help='bqpjson files, JSON lines files with one problem per line, or directories of these', nargs='+')
+    parser.add_argument('-r', '--replicas', help='the number of replicas annealed together', type=int, default=64)
+    parser.add_argument('-sw', '--sweeps', help='the number of sweeps in the schedule', type=int, default=1000)
+    parser.add_argument('-br', '--beta-range', help='the initial and final inverse temperatures, by default these are derived from the problem coefficients', nargs=2, type=float)
+    parser.add_argument('-sc', '--schedule', help='the spacing of the inverse temperatures', choices=schedules, default='geometric')
+    parser.add_argument('-fs', '--full-schedule', help='run every sweep instead of stopping when the planted energy is reached, and report the fraction of replicas that reach it', action='store_true', default=False)
+    parser.add_argument('-rs', '--seed', help='the random seed of the annealer', type=int)
+
+    return parser
+
+
+if __name__ == '__main__':
+    parser = build_cli_parser()
+    main(parser.parse_args())
@@ -0,0 +1,124 @@
+import json
+
+from common import json_dumps_kwargs
+
+# writes bqpjson documents whose term lists are generated while they are
+# written, so that the terms of large problems are never held as lists of
+# dicts or as one json string.  The output is identical to json.dumps with
+# sort_keys=True, or with json_dumps_kwargs when pretty printing.
+
+default_chunk_size = 4096
+
+_indent = ' '*json_dumps_kwargs['indent']
+
+
+class TermList(object):
+    '''A list of bqpjson terms that is generated on demand.  Each row of
+    rows() is a tuple of values matching keys, which are sorted.  Iterating
+    yields the terms as dicts, so consumers of plain term lists also work.
+    '''
+    def __init__(self, keys, rows, length):
+        assert(list(keys) == sorted(keys))
+        self.keys = tuple(keys)
+        self.rows = rows
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        for row in self.rows():
+            yield dict(zip(self.keys, row))
+
+
+def _encode_value(value):
+    # matches the json module, which uses the float and int repr
+    if type(value) == float and value == value and value not in (float('inf'), float('-inf')):
+        return float.__repr__(value)
+    if type(value) == int:
+        return int.__repr__(value)
+    return json.dumps(value)
+
+
+def _contains_terms(value):
+    if isinstance(value, TermList):
+        return True
+    if isinstance(value, dict):
+        return any(_contains_terms(item) for item in value.values())
+    if isinstance(value, list):
+        return any(_contains_terms(item) for item in value)
+    return False
+
+
+def _dumps(value, pretty, depth):
+    if pretty:
+        return json.dumps(value, **json_dumps_kwargs).replace('\n', '\n'+_indent*depth)
+    return json.dumps(value, sort_keys=True)
+
+
+def _write_terms(terms, stream, pretty, depth, chunk_size):
+    if len(terms) == 0:
+        stream.write('[]')
+        return
+
+    names = [json.dumps(key) for key in terms.keys]
+    if pretty:
+        outer = '\n' + _indent*(depth+1)
+        inner = '\n' + _indent*(depth+2)
+        template = '{' + ','.join(inner + name + ': %s' for name in names) + outer + '}'
+        opening, separator, closing = '[' + outer, ',' + outer, '\n' + _indent*depth + ']'
+    else:
+        template = '{' + ', '.join(name + ': %s' for name in names) + '}'
+        opening, separator, closing = '[', ', ', ']'
+
+    stream.write(opening)
+    chunk = []
+    first = True
+    for row in terms.rows():
+        chunk.append(template % tuple(_encode_value(value) for value in row))
+        if len(chunk) >= chunk_size:
+            if not first:
+                stream.write(separator)
+            stream.write(separator.join(chunk))
+            chunk = []
+            first = False
+    if len(chunk) > 0:
+        if not first:
+            stream.write(separator)
+        stream.write(separator.join(chunk))
+    stream.write(closing)
+
+
+def _write_value(value, stream, pretty, depth, chunk_size):
+    if isinstance(value, TermList):
+        _write_terms(value, stream, pretty, depth, chunk_size)
+        return
+    if not _contains_terms(value):
+        stream.write(_dumps(value, pretty, depth))
+        return
+
+    if isinstance(value, dict):
+        items = [(json.dumps(key) + ': ', value[key]) for key in sorted(value)]
+        opening, closing = '{', '}'
+    else:
+        items = [('', item) for item in value]
+        opening, closing = '[', ']'
+
+    stream.write(opening)
+    for k, (prefix, item) in enumerate(items):
+        if pretty:
+            stream.write((',' if k > 0 else '') + '\n' + _indent*(depth+1) + prefix)
+        else:
+            stream.write((', ' if k > 0 else '') + prefix)
+        _write_value(item, stream, pretty, depth+1, chunk_size)
+    if pretty:
+        stream.write('\n' + _indent*depth)
+    stream.write(closing)
+
+
+def write_bqp(data, stream, pretty=False, chunk_size=default_chunk_size):
+    '''Writes bqpjson data to a text stream, TermList values are written in
+    chunks of chunk_size terms.  The output is the same as json.dumps of the
+    data with the term lists expanded, without a trailing new line.
+    '''
+    _write_value(data, stream, pretty, 0, chunk_size)
@@ -0,0 +1,262 @@
+from collections import namedtuple
+
+from common import DWIGException
+
+# planted solution certificates of frustrated loop problems.  A certificate
+# splits the Hamiltonian into frustrated loops, gadgets and a residual, the
+# minimum of each part is known, so their sum is a lower bound on the ground
+# state energy that is computed in time linear in the size of the certificate.
+
+# a cycle of couplers, given in the generator's units before the gauge
+# transformation and rescaling, every coupler contributes -1 except the
+# frustrated one, which contributes +1
+FrustratedLoop = namedtuple('FrustratedLoop', ['couplers', 'frustrated'])
+
+# a small set of fields and couplings, given in the same units as the loops,
+# whose minimum is found by enumeration
+Gadget = namedtuple('Gadget', ['fields', 'couplings'])
+
+LoopCertificate = namedtuple('LoopCertificate', ['loops', 'gadgets'])
+
+CertificateResult = namedtuple('CertificateResult', ['lower_bound', 'energy', 'optimal'])
+
+max_gadget_size = 16
+
+
+def loop_couplings(loop):
+    '''The couplings of a FrustratedLoop, before the gauge transformation.'''
+    return {coupler : (1.0 if coupler == loop.frustrated else -1.0) for coupler in loop.couplers}
+
+
+def is_simple_cycle(couplers):
+    '''True when the couplers form a single cycle that visits each of its
+    sites once.
+    '''
+    if len(couplers) < 3:
+        return False
+
+    neighbors = {}
+    for site_i, site_j in couplers:
+        if site_i == site_j:
+            return False
+        neighbors.setdefault(site_i, []).append(site_j)
+        neighbors.setdefault(site_j, []).append(site_i)
+
+    if len(neighbors) != len(couplers) or any(len(others) != 2 for others in neighbors.values()):
+        return False
+
+    start = couplers[0][0]
+    previous, site = start, neighbors[start][0]
+    length = 1
+    while site != start:
+        others = neighbors[site]
+        previous, site = site, (others[1] if others[0] == previous else others[0])
+        length += 1
+
+    return length == len(couplers)
+
+
+def cycle_minimum(values):
+    '''The minimum energy of couplings along a simple cycle.  When the cycle
+    is frustrated, an odd number of its couplings are antiferromagnetic, and
+    the weakest coupling is left unsatisfied.
+    '''
+    magnitudes = [abs(value) for value in values]
+    antiferromagnetic = sum(1 for value in values if value > 0.0)
+    if antiferromagnetic % 2 == 1:
+        return -sum(magnitudes) + 2.0*min(magnitudes)
+    return -sum(magnitudes)
+
+
+def gadget_minimum(fields, couplings):
+    '''The minimum energy of a gadget, by enumerating all of its states.'''
+    import numpy
+
+    sites = sorted(set(fields) | set(site for coupler in couplings for site in coupler))
+    if len(sites) > max_gadget_size:
+        raise DWIGException('gadgets are limited to {} sites, given {}'.format(max_gadget_size, len(sites)))
+    position = {site : k for k, site in enumerate(sites)}
+
+    states = numpy.arange(2**len(sites), dtype=numpy.int64)
+    spins = 1 - 2*((states[:, numpy.newaxis] >> numpy.arange(len(sites))) & 1)
+
+    energies = numpy.zeros(len(states))
+    for site, value in fields.items():
+        energies += value*spins[:, position[site]]
+    for (site_i, site_j), value in couplings.items():
+        energies += value*spins[:, position[site_i]]*spins[:, position[site_j]]
+
+    return float(energies.min())
+
+
+def verify(assignment, certificate=None, tolerance=1e-9):
+    '''Checks that a QPUAssignment is a ground state, using the loop
+    decomposition recorded by the generator (see generate_fl and
+    generate_fclg).  The loops and gadgets are moved into the gauge of the
+    assignment and scaled like the configuration, whatever remains of the
+    fields and couplings is the residual, whose minimum is minus the sum of its
+    magnitudes.  Returns the lower bound, the energy of the assignment and
+    whether it reaches the bound.
+    '''
+    if certificate == None:
+        certificate = assignment.certificate
+    if certificate == None:
+        raise DWIGException('the assignment does not have a loop certificate, generate it with record_loops')
+
+    config = assignment.qpu_config
+    factor = config.scaling_factor
+
+    # sites that are inactive in the final problem take the spin +1
+    spins = assignment.spins
+    def gauge(site):
+        return spins.get(site, 1)
+
+    residual_fields = dict(config.fields)
+    residual_couplings = dict(config.couplings)
+    bound = 0.0
+
+    for loop in certificate.loops:
+        if not is_simple_cycle(loop.couplers):
+            raise DWIGException('the certificate loop {} is not a simple cycle'.format([(i.index, j.index) for i,j in loop.couplers]))
+        if not loop.frustrated in loop.couplers:
+            raise DWIGException('the frustrated coupler of a certificate loop is not on the loop')
+
+        values = []
+        for coupler, value in loop_couplings(loop).items():
+            value = factor*value*gauge(coupler[0])*gauge(coupler[1])
+            residual_couplings[coupler] = residual_couplings.get(coupler, 0.0) - value
+            values.append(value)
+        bound += cycle_minimum(values)
+
+    for gadget in certificate.gadgets:
+        fields = {site : factor*value*gauge(site) for site, value in gadget.fields.items()}
+        couplings = {coupler : factor*value*gauge(coupler[0])*gauge(coupler[1]) for coupler, value in gadget.couplings.items()}
+        for site, value in fields.items():
+            residual_fields[site] = residual_fields.get(site, 0.0) - value
+        for coupler, value in couplings.items():
+            residual_couplings[coupler] = residual_couplings.get(coupler, 0.0) - value
+        bound += gadget_minimum(fields, couplings)
+
+    bound -= sum(abs(value) for value in residual_fields.values())
+    bound -= sum(abs(value) for value in residual_couplings.values())
+
+    lower_bound = config.scale*(bound + config.offset)
+    energy = assignment.eval()
+    optimal = energy <= lower_bound + tolerance*max(1.0, abs(lower_bound))
+
+    return CertificateResult(lower_bound, energy, optimal)
+
+
+def cell_loop_strands(cell_graph, cell_loop, frustrated, cell_size=8, turn_load=None):
+    '''Expands a loop over chimera cells, whose cells are joined by all of
+    the couplers between them and held together by intra cell couplings, into
+    the site level loops of its strands.  Strand k follows the k-th site of
+    each shore, and where the loop turns from one shore to the other it uses
+    the intra cell couplers of a shifted matching, (0,k)-(1,k+m).  The shifts
+    of the turns cancel, so each strand closes after one lap and crosses the
+    frustrated cell edge once.  turn_load counts the turns given to each
+    (cell, shift), which are spread out because every turn takes one unit of
+    the intra cell coupling.  Returns None when a coupler is missing.
+    '''
+    shore_size = cell_size//2
+    if turn_load == None:
+        turn_load = {}
+
+    # order the cells along the loop
+    cell_edges = {}
+    for edge in cell_loop:
+        for cell in edge:
+            cell_edges.setdefault(cell, []).append(edge)
+    if any(len(edges) != 2 for edges in cell_edges.values()):
+        return None
+
+    order = [cell_loop[0][0]]
+    edge_order = [cell_loop[0]]
+    while len(edge_order) < len(cell_loop):
+        edge = edge_order[-1]
+        cell = edge[1] if edge[0] == order[-1] else edge[0]
+        order.append(cell)
+        edges = cell_edges[cell]
+        edge_order.append(edges[1] if edges[0] == edge else edges[0])
+
+    # the couplers of each cell edge, by strand
+    strand_couplers = {}
+    shore = {}
+    for edge in cell_loop:
+        couplers = cell_graph.cell_couplers.get(edge, [])
+        if len(couplers) != shore_size:
+            return None
+        strand_couplers[edge] = {coupler[0].index % shore_size : coupler for coupler in couplers}
+        shore[edge] = couplers[0][0].chimera_cell_row
+        if len(strand_couplers[edge]) != shore_size:
+            return None
+
+    # shifts of the turns, the last one cancels the others
+    turns = []
+    for k, cell in enumerate(order):
+        incoming, outgoing = edge_order[k-1], edge_order[k]
+        if shore[incoming] != shore[outgoing]:
+            turns.append((cell, 1 if shore[incoming] == 0 else -1))
+
+    intra = {}
+    for cell, direction in turns:
+        if not cell in intra:
+            intra[cell] = {(coupler[0].index % shore_size, coupler[1].index % shore_size) : coupler for coupler in cell_graph.intra_couplers.get(cell, [])}
+
+    def available(cell, shift):
+        return all((k, (k+shift) % shore_size) in intra[cell] for k in range(shore_size))
+
+    shifts = []
+    total = 0
+    for position, (cell, direction) in enumerate(turns):
+        if position < len(turns)-1:
+            options = [shift for shift in range(shore_size) if available(cell, shift)]
+            if len(options) == 0:
+                return None
+            shift = min(options, key=lambda shift: turn_load.get((cell, shift), 0))
+        else:
+            shift = (-direction*total) % shore_size
+            if not available(cell, shift):
+                return None
+        shifts.append(shift)
+        total += direction*shift
+
+    for (cell, direction), shift in zip(turns, shifts):
+        turn_load[(cell, shift)] = turn_load.get((cell, shift), 0) + 1
+
+    # the site level couplers of the loop, split into cycles
+    couplers = []
+    for edge in cell_loop:
+        couplers.extend(strand_couplers[edge].values())
+    for (cell, direction), shift in zip(turns, shifts):
+        couplers.extend(intra[cell][(k, (k+shift) % shore_size)] for k in range(shore_size))
+
+    incident = {}
+    for coupler in couplers:
+        for site in coupler:
+            incident.setdefault(site, []).append(coupler)
+
+    frustrated_couplers = set(strand_couplers[frustrated].values())
+    strands = []
+    used = set()
+    for coupler in strand_couplers[edge_order[0]].values():
+        if coupler in used:
+            continue
+        cycle = [coupler]
+        used.add(coupler)
+        site = coupler[1]
+        while True:
+            first, second = incident[site]
+            coupler = second if first == cycle[-1] else first
+            if coupler in used:
+                break
+            cycle.append(coupler)
+            used.add(coupler)
+            site = coupler[1] if coupler[0] == site else coupler[0]
+
+        cycle_frustrated = [coupler for coupler in cycle if coupler in frustrated_couplers]
+        assert(len(cycle_frustrated) == 1)
+        strands.append(FrustratedLoop(cycle, cycle_frustrated[0]))
+
+    assert(len(used) == len(couplers))
+    return strands
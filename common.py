@@ -1,4 +1,4 @@
-import os, sys, json, bqpjson
+import os, sys, json, hashlib
 
 class DWIGException(Exception):
     pass
@@ -16,5 +16,15 @@ json_dumps_kwargs = {
 bqpjson_version = '1.0.0'
 
 def validate_bqp_data(data):
+    # imported here, bqpjson loads jsonschema which is slow to import
+    import bqpjson
     bqpjson.validate(data)
     return True
+
+
+def derive_seed(seed, index):
+    '''The seed of instance index in a batch generated from seed.  A hash
+    is used so that the instances of nearby batch seeds are unrelated.
+    '''
+    digest = hashlib.sha256('{}/{}'.format(seed, index).encode('utf-8')).digest()
+    return int.from_bytes(digest[:4], 'big') >> 1
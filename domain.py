@@ -0,0 +1,69 @@
+import copy
+
+# conversions of bqpjson data between the spin and boolean variable domains
+
+variable_domains = ['spin', 'boolean']
+
+
+def spin_to_bool(ising_data):
+    '''Converts spin domain bqpjson data into the boolean domain, using the
+    substitution s = 2x - 1.  The result is identical to bqpjson.spin_to_bool,
+    including the order of the floating point operations, but the terms are
+    processed as arrays.  The scale is unchanged, the offset absorbs the
+    constant terms and the solutions are mapped to 0/1 values.
+    '''
+    import numpy
+
+    assert(ising_data['variable_domain'] == 'spin')
+
+    variable_ids = numpy.array(ising_data['variable_ids'], dtype=numpy.int64)
+    position = {v_id : k for k, v_id in enumerate(ising_data['variable_ids'])}
+
+    linear_terms = ising_data['linear_terms']
+    quadratic_terms = ising_data['quadratic_terms']
+
+    h_pos = numpy.array([position[term['id']] for term in linear_terms], dtype=numpy.int64)
+    h = numpy.array([term['coeff'] for term in linear_terms], dtype=numpy.float64)
+    j_tail = numpy.array([position[term['id_tail']] for term in quadratic_terms], dtype=numpy.int64)
+    j_head = numpy.array([position[term['id_head']] for term in quadratic_terms], dtype=numpy.int64)
+    j = numpy.array([term['coeff'] for term in quadratic_terms], dtype=numpy.float64)
+
+    # linear coefficients, 2h - 2J for every incident coupler in term order
+    linear = numpy.zeros(len(variable_ids))
+    linear[h_pos] = 2.0*h
+    numpy.subtract.at(linear, numpy.column_stack((j_tail, j_head)).ravel(), numpy.repeat(2.0*j, 2))
+
+    # quadratic coefficients, merging repeated pairs in term order
+    pairs = numpy.column_stack((variable_ids[j_tail], variable_ids[j_head])) if len(j) > 0 else numpy.zeros((0, 2), dtype=numpy.int64)
+    unique_pairs, pair_index = numpy.unique(pairs, axis=0, return_inverse=True)
+    quadratic = numpy.zeros(len(unique_pairs))
+    numpy.add.at(quadratic, pair_index.reshape(-1), 4.0*j)
+
+    # the offset is accumulated sequentially, as a cumulative sum
+    offset_terms = numpy.concatenate(([ising_data['offset']], -h, j))
+    offset = numpy.cumsum(offset_terms)[-1].item()
+
+    order = numpy.argsort(variable_ids, kind='mergesort')
+    linear_ids = variable_ids[order]
+    linear = linear[order]
+
+    keep = linear != 0.0
+    bool_linear_terms = [{'id':i, 'coeff':v} for i, v in zip(linear_ids[keep].tolist(), linear[keep].tolist())]
+    keep = quadratic != 0.0
+    bool_quadratic_terms = [{'id_tail':i, 'id_head':j, 'coeff':v} for (i, j), v in zip(unique_pairs[keep].tolist(), quadratic[keep].tolist())]
+
+    bool_data = {k:v for k,v in ising_data.items() if not k in ['linear_terms', 'quadratic_terms', 'solutions']}
+    bool_data = copy.deepcopy(bool_data)
+    bool_data['variable_domain'] = 'boolean'
+    bool_data['offset'] = offset
+    bool_data['linear_terms'] = bool_linear_terms
+    bool_data['quadratic_terms'] = bool_quadratic_terms
+
+    if 'solutions' in ising_data:
+        bool_data['solutions'] = copy.deepcopy(ising_data['solutions'])
+        for solution in bool_data['solutions']:
+            for assign in solution['assignment']:
+                if assign['value'] == -1:
+                    assign['value'] = 0
+
+    return bool_data
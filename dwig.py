@@ -4,28 +4,79 @@ from __future__ import print_function
 
 import sys, os, json, argparse, random, math, datetime
 
-from dwave.cloud import Client
-import dwave_networkx
-
-from structure import QPUAssignment
 from structure import ChimeraQPU
 from structure import Range
+from structure import chimera_graph
+from structure import load_chimera_snapshot
+from structure import save_chimera_snapshot
+
+from session import Session
+from domain import variable_domains
 
-import generator
+import ensemble
+import qpu_cache
 from common import print_err
 from common import validate_bqp_data
 from common import json_dumps_kwargs
+from bqp_stream import write_bqp
 
 # caches remote qpu info when making multiple calls to build_case
 _qpu_remote = None
 
 def main(args, output_stream=sys.stdout):
-    case = build_case(args)
-    validate_bqp_data(case)
-    if args.pretty_print:
-        print(json.dumps(case, **json_dumps_kwargs), file=output_stream)
-    else:
-        print(json.dumps(case, sort_keys=True), file=output_stream)
+    if args.count == None and args.output_dir == None and args.ensemble_file == None:
+        case = build_case(args)
+        if args.stream:
+            # the terms are generated while they are written
+            print_err('info: skipping bqpjson validation of the streamed output')
+            write_bqp(case, output_stream, args.pretty_print)
+            print('', file=output_stream)
+            return
+        if not args.no_validation:
+            validate_bqp_data(case)
+        if args.pretty_print:
+            print(json.dumps(case, **json_dumps_kwargs), file=output_stream)
+        else:
+            print(json.dumps(case, sort_keys=True), file=output_stream)
+        return
+
+    if args.stream:
+        print_err('streaming only applies to a single instance, it cannot be combined with a count, an output directory or an ensemble file.')
+        quit()
+
+    count = 1 if args.count == None else args.count
+    if args.output_dir != None and not os.path.isdir(args.output_dir):
+        os.makedirs(args.output_dir)
+
+    # the qpu is loaded and filtered once and shared by all instances
+    qpu = build_qpu(args)
+
+    base_seed = args.seed
+    if base_seed is None:
+        base_seed = random.getrandbits(31)
+    print_err('deriving instance seeds from: {}'.format(base_seed))
+
+    if args.ensemble_file != None:
+        if args.output_dir != None:
+            print_err('an ensemble file cannot be combined with an output directory.')
+            quit()
+        # imported here, the binary format needs numpy, which is slow to import
+        from ensemble_file import EnsembleWriter
+        from ensemble_file import qpu_topology
+        with EnsembleWriter(args.ensemble_file, *qpu_topology(qpu)) as writer:
+            for index, case in ensemble.generate_ensemble(args, qpu, count, base_seed, args.processes, encode=False):
+                writer.write(case)
+        return
+
+    for index, text in ensemble.generate_ensemble(args, qpu, count, base_seed, args.processes):
+        if args.output_dir != None:
+            file_name = os.path.join(args.output_dir, '{}_{:0{}d}.json'.format(args.generator, index, len(str(count-1))))
+            with open(file_name, 'w') as file:
+                print(text, file=file)
+        else:
+            # one instance per line, written as soon as it is available
+            print(text, file=output_stream)
+            output_stream.flush()
 
 
 def build_case(args):
@@ -33,45 +84,46 @@ def build_case(args):
         print_err('setting random seed to: {}'.format(args.seed))
         random.seed(args.seed)
 
+    qpu = build_qpu(args)
+    return build_instance(args, qpu, args.seed, reseed=False, stream=args.stream)
+
+
+def build_qpu(args):
+    '''Loads the QPU and applies the filters given in args, the resulting QPU
+    can be reused to build any number of instances.
+    '''
     #print_err(args.chimera_edge_set)
 
-    qpu = get_qpu(args.profile, args.ignore_connection, args.hardware_chimera_degree)
+    qpu = get_qpu(args.profile, args.ignore_connection, args.hardware_chimera_degree, args.solver, args.qpu_cache, args.cache_ttl, args.refresh_cache, topology_snapshot=args.topology_snapshot)
     #print_err(qpu)
 
+    view = qpu.view()
+
     if args.chimera_degree != None:
         print_err('filtering QPU to chimera of degree {}'.format(args.chimera_degree))
-        qpu = qpu.chimera_degree_filter(args.chimera_degree)
+        view = view.chimera_degree_filter(args.chimera_degree)
 
     if args.chimera_cell_limit != None:
         print_err('filtering QPU to the first {} chimera cells'.format(args.chimera_cell_limit))
-        qpu = qpu.cell_filter(args.chimera_cell_limit)
+        view = view.cell_filter(args.chimera_cell_limit)
 
     if args.chimera_cell_box != None:
         chimera_cell_1 = tuple(args.chimera_cell_box[0:2])
         chimera_cell_2 = tuple(args.chimera_cell_box[2:4])
         print_err('filtering QPU to the chimera cell box {} by {}'.format(chimera_cell_1, chimera_cell_2))
-        qpu = qpu.chimera_cell_box_filter(chimera_cell_1, chimera_cell_2)
+        view = view.chimera_cell_box_filter(chimera_cell_1, chimera_cell_2)
 
     if args.spin_set != None:
         print_err('filtering QPU to the spin set {}'.format(args.spin_set))
-        qpu = qpu.spin_filter(args.spin_set)
+        view = view.spin_filter(args.spin_set)
 
     if args.coupler_set != None:
         print_err('filtering QPU to the coupler set {}'.format(args.coupler_set))
-        qpu = qpu.coupler_filter(args.coupler_set)
+        view = view.coupler_filter(args.coupler_set)
 
+    qpu = view.materialize()
 
-    if args.generator == 'const':
-        qpu_config = generator.generate_disordered(qpu, [args.coupling], [1.0], [args.field], [1.0], args.random_gauge_transformation)
-    elif args.generator == 'ran':
-        qpu_config = generator.generate_ran(qpu, args.probability, args.steps, args.field, args.scale, args.simple_ground_state)
-    elif args.generator == 'gd':
-        qpu_config = generator.generate_disordered(qpu, args.coupling_values, args.coupling_probabilities, args.field_values, args.field_probabilities, args.random_gauge_transformation)
-    elif args.generator == 'cbfm':
-        qpu_config = generator.generate_disordered(qpu, [args.j1_val, args.j2_val], [args.j1_pr, args.j2_pr], [args.h1_val, args.h2_val], [args.h1_pr, args.h2_pr], args.random_gauge_transformation)
-    elif args.generator == 'fl':
-        qpu_config = generator.generate_fl(qpu, args.steps, args.alpha, args.multicell, args.cluster_chimera_cells, args.simple_ground_state, args.min_loop_length, args.loop_reject_limit, args.loop_sample_limit)
-    elif args.generator == 'wscn':
+    if args.generator == 'wscn':
         if args.chimera_cell_limit != None:
             print_err('weak-strong cluster networks cannot be constricted with a cell limit.')
             quit()
@@ -85,35 +137,43 @@ def build_case(args):
             print_err('the weak-strong cluster network will occupy a space of chimera degree {}.'.format(effective_chimera_degree))
         qpu = qpu.chimera_degree_filter(effective_chimera_degree)
 
-        qpu_config = generator.generate_wscn(qpu, args.weak_field, args.strong_field)
-    elif args.generator == 'fclg':
-        qpu_config = generator.generate_fclg(qpu, args.steps, args.alpha, args.gadget_fraction, args.simple_ground_state, args.min_loop_length, args.loop_reject_limit, args.loop_sample_limit)
-    else:
-        assert(False) # CLI failed
+    return qpu
 
-    if args.include_zeros:
-        config = qpu_config
-        if isinstance(qpu_config, QPUAssignment):
-            config = qpu_config.qpu_config
-        for site in config.qpu.sites:
-            if not site in config.fields:
-                config.fields[site] = 0.0
-        for coupler in config.qpu.couplers:
-            if not coupler in config.couplings:
-                config.couplings[coupler] = 0.0
 
-    #print_err(qpu_config)
-    if args.omit_solution:
-        if isinstance(qpu_config, QPUAssignment):
-            qpu_config = qpu_config.qpu_config
+def build_instance(args, qpu, seed=None, reseed=True, stream=False, executor=None):
+    '''Builds one bqpjson instance on the given QPU, seeding the random 
+    number generator with seed first when reseed is set.  When stream is set
+    the terms are left to bqp_stream.write_bqp (see Session.build_dict).  The
+    loop generators propose loops on executor when it is given.
+    '''
+    if reseed and not seed is None:
+        random.seed(seed)
 
+    session = Session(qpu, rng=random, executor=executor)
 
+    if args.generator == 'const':
+        qpu_config = session.const(args.coupling, args.field, args.random_gauge_transformation)
+    elif args.generator == 'ran':
+        qpu_config = session.ran(args.probability, args.steps, args.field, args.scale, args.simple_ground_state)
+    elif args.generator == 'gd':
+        qpu_config = session.gd(args.coupling_values, args.coupling_probabilities, args.field_values, args.field_probabilities, args.random_gauge_transformation)
+    elif args.generator == 'cbfm':
+        qpu_config = session.cbfm(args.j1_val, args.j1_pr, args.j2_val, args.j2_pr, args.h1_val, args.h1_pr, args.h2_val, args.h2_pr, args.random_gauge_transformation)
+    elif args.generator == 'fl':
+        qpu_config = session.fl(args.steps, args.alpha, args.multicell, args.cluster_chimera_cells, args.simple_ground_state, args.min_loop_length, args.loop_reject_limit, args.loop_sample_limit, args.workers)
+    elif args.generator == 'wscn':
+        qpu_config = session.wscn(args.weak_field, args.strong_field)
+    elif args.generator == 'fclg':
+        qpu_config = session.fclg(args.steps, args.alpha, args.gadget_fraction, args.simple_ground_state, args.min_loop_length, args.loop_reject_limit, args.loop_sample_limit, args.workers)
+    else:
+        assert(False) # CLI failed
 
-    data = qpu_config.build_dict(args.include_zeros)
+    #print_err(qpu_config)
+    data = session.build_dict(qpu_config, args.include_zeros, args.omit_solution, args.variable_domain, stream)
 
     data['description'] = 'This is a randomly generated B-QP built by D-WIG (https://github.com/lanl-ansi/dwig) using the {} algorithm.'.format(args.generator)
-    if not args.seed is None:
-        data['description'] = data['description'] + '  A random number seed of {} was used.'.format(args.seed)
+    if not seed is None:
+        data['description'] = data['description'] + '  A random number seed of {} was used.'.format(seed)
 
     data['metadata'] = build_metadata(args, qpu)
 
@@ -140,39 +200,56 @@ def build_metadata(args, qpu):
     return metadata
 
 
-def get_qpu(profile, ignore_connection, hardware_chimera_degree):
+def get_qpu(profile, ignore_connection, hardware_chimera_degree, solver_name=None, cache_file=None, cache_ttl=qpu_cache.default_cache_ttl, refresh_cache=False, client_factory=None, topology_snapshot=None):
     chip_id = None
     endpoint = None
-    solver_name = None
     cell_size = 8
 
     global _qpu_remote
 
     if not ignore_connection:
         if _qpu_remote == None:
-            try:
-                with Client.from_config(config_file=os.getenv("HOME")+"/dwave.conf", profile=profile) as client:
-                    endpoint = client.endpoint
-                    solver = client.get_solver()
-                    solver_name = solver.name
-                    couplers = solver.undirected_edges
-                    sites = solver.nodes
-
-                    solver_chimera_degree = int(math.ceil(math.sqrt(len(sites)/cell_size)))
-                    if hardware_chimera_degree != solver_chimera_degree:
-                        print_err('Warning: the hardware chimera degree was specified as {}, while the solver {} has a degree of {}'.format(hardware_chimera_degree, solver_name, solver_chimera_degree))
-                        hardware_chimera_degree = solver_chimera_degree
-
-                    site_range = Range(*solver.properties['h_range'])
-                    coupler_range = Range(*solver.properties['j_range'])
-                    chip_id = solver.properties['chip_id']
-
-            #TODO remove try/except logic, if there is a better way to check the connection
-            except Exception as e:
-               print_err('QPU connection details not found or there was a connection error')
-               print_err('  '+str(e))
-               print_err('assuming full yield square chimera of degree {}'.format(hardware_chimera_degree))
-               ignore_connection = True
+            key = qpu_cache.cache_key(profile, solver_name)
+
+            details = None
+            if cache_file != None and not refresh_cache:
+                details = qpu_cache.load_qpu_details(cache_file, key, cache_ttl)
+                if details != None:
+                    print_err('info: using QPU details cached in {}'.format(cache_file))
+
+            if details == None:
+                if client_factory == None:
+                    client_factory = _client_from_config
+                try:
+                    details = _fetch_qpu_details(client_factory, profile, solver_name)
+                    if cache_file != None:
+                        details = qpu_cache.store_qpu_details(cache_file, key, details)
+
+                #TODO remove try/except logic, if there is a better way to check the connection
+                except Exception as e:
+                   print_err('QPU connection details not found or there was a connection error')
+                   print_err('  '+str(e))
+                   if cache_file != None:
+                       details = qpu_cache.load_qpu_details(cache_file, key)
+                   if details != None:
+                       print_err('using the last known QPU details cached in {}'.format(cache_file))
+                   else:
+                       print_err('assuming full yield square chimera of degree {}'.format(hardware_chimera_degree))
+                       ignore_connection = True
+
+            if details != None:
+                endpoint = details['endpoint']
+                solver_name = details['solver_name']
+                chip_id = details['chip_id']
+                sites = set(details['sites'])
+                couplers = set(tuple(coupler) for coupler in details['couplers'])
+                site_range = Range(*details['h_range'])
+                coupler_range = Range(*details['j_range'])
+
+                solver_chimera_degree = int(math.ceil(math.sqrt(len(sites)/cell_size)))
+                if hardware_chimera_degree != solver_chimera_degree:
+                    print_err('Warning: the hardware chimera degree was specified as {}, while the solver {} has a degree of {}'.format(hardware_chimera_degree, solver_name, solver_chimera_degree))
+                    hardware_chimera_degree = solver_chimera_degree
         else:
             print_err('info: using cached QPU details')
             return _qpu_remote
@@ -181,34 +258,56 @@ def get_qpu(profile, ignore_connection, hardware_chimera_degree):
         site_range = Range(-2.0, 2.0)
         coupler_range = Range(-1.0, 1.0)
 
-        # the hard coded 4 here assumes an 4x2 unit cell
-        graph = dwave_networkx.chimera_graph(hardware_chimera_degree, hardware_chimera_degree, cell_size//2)
-        edges = graph.edges()
-        #arcs = get_chimera_adjacency(hardware_chimera_degree, hardware_chimera_degree, cell_size//2)
-        #print(arcs)
-
-        # turn arcs into couplers
-        # this step is nessisary to be consistent with the solver.properties['couplers'] data
-        couplers = []
-        for i,j in edges:
-            assert(i != j)
-            if i < j:
-                couplers.append((i,j))
-            else:
-                couplers.append((j,i))
-        couplers = set(couplers)
-
-        sites = set([coupler[0] for coupler in couplers]+[coupler[1] for coupler in couplers])
-
-        # sanity check on coupler consistency across both branches
-        for i,j in couplers:
-            assert(i < j)
+        if topology_snapshot != None:
+            _chimera_snapshot(topology_snapshot, hardware_chimera_degree, cell_size)
+
+        site_array, coupler_array = chimera_graph(hardware_chimera_degree, cell_size)
+        sites = set(site_array.tolist())
+        couplers = [tuple(coupler) for coupler in coupler_array.tolist()]
 
     if _qpu_remote == None:
         _qpu_remote = ChimeraQPU(sites, couplers, cell_size, hardware_chimera_degree, site_range, coupler_range, chip_id=chip_id, endpoint=endpoint, solver_name=solver_name)
     return _qpu_remote
 
 
+def _chimera_snapshot(file_name, chimera_degree, cell_size):
+    '''Loads the offline chimera graph from a binary snapshot, the snapshot 
+    is (re)written when it is missing or covers a different graph size.
+    '''
+    if os.path.isfile(file_name):
+        if load_chimera_snapshot(file_name) == (chimera_degree, cell_size):
+            return
+        print_err('info: topology snapshot {} does not match a chimera graph of degree {}, rebuilding it'.format(file_name, chimera_degree))
+    save_chimera_snapshot(file_name, chimera_degree, cell_size)
+
+
+def _client_from_config(profile):
+    # imported here, the cloud client is slow to import and only needed when connecting
+    from dwave.cloud import Client
+    return Client.from_config(config_file=os.getenv("HOME")+"/dwave.conf", profile=profile)
+
+
+def _fetch_qpu_details(client_factory, profile, solver_name=None):
+    '''Connects to the solver and returns the details needed to build a 
+    ChimeraQPU, in a form that can be stored in the QPU cache.
+    '''
+    with client_factory(profile) as client:
+        if solver_name == None:
+            solver = client.get_solver()
+        else:
+            solver = client.get_solver(name=solver_name)
+
+        return {
+            'endpoint': client.endpoint,
+            'solver_name': solver.name,
+            'chip_id': solver.properties['chip_id'],
+            'sites': sorted(solver.nodes),
+            'couplers': sorted([min(i,j), max(i,j)] for i,j in solver.undirected_edges),
+            'h_range': list(solver.properties['h_range']),
+            'j_range': list(solver.properties['j_range'])
+        }
+
+
 def spin_pair(s):
     try:
         x, y = map(int, s.split(','))
@@ -222,13 +321,25 @@ def build_cli_parser():
 
     parser.add_argument('-p', '--profile', help='connection details to load from dwave.conf', default=None)
     parser.add_argument('-ic', '--ignore-connection', help='force .dwrc connection details to be ignored', action='store_true', default=False)
+    parser.add_argument('--solver', help='the name of the solver to connect to, defaults to the solver given in dwave.conf', default=None)
+    parser.add_argument('-qc', '--qpu-cache', help='cache the solver topology and properties in the given file (default: {})'.format(qpu_cache.default_cache_file), nargs='?', const=qpu_cache.default_cache_file, default=None)
+    parser.add_argument('-ct', '--cache-ttl', help='the number of seconds before cached solver details are reloaded', type=float, default=qpu_cache.default_cache_ttl)
+    parser.add_argument('-ts', '--topology-snapshot', help='a binary snapshot file of the full yield chimera graph used when the connection is ignored, it is created if it does not exist', default=None)
+    parser.add_argument('-rc', '--refresh-cache', help='reload the cached solver details from the solver', action='store_true', default=False)
 
     parser.add_argument('-tl', '--timeless', help='omit generation timestamp', action='store_true', default=False)
     parser.add_argument('-rs', '--seed', help='seed for the random number generator', type=int)
     parser.add_argument('-cd', '--chimera-degree', help='the size of a square chimera graph to utilize', type=int)
     parser.add_argument('-hcd', '--hardware-chimera-degree', help='the size of the square chimera graph on the hardware', type=int, default=16)
+    parser.add_argument('-n', '--count', help='the number of instances to generate, written as one json document per line', type=int)
+    parser.add_argument('-pc', '--processes', help='the number of processes used to generate instances, the output does not depend on this number', type=int, default=1)
+    parser.add_argument('-od', '--output-dir', help='write each instance to a separate file in the given directory', default=None)
+    parser.add_argument('-ef', '--ensemble-file', help='write the instances to a binary ensemble file, which stores the topology once (see ensemble_file.py)', default=None)
     parser.add_argument('-pp', '--pretty-print', help='pretty print json output', action='store_true', default=False)
+    parser.add_argument('--stream', help='write the terms of a single instance while they are generated, which bounds the memory used by large problems, the output is not validated', action='store_true', default=False)
+    parser.add_argument('-nv', '--no-validation', help='skip the bqpjson validation of the output, which avoids loading bqpjson and jsonschema', action='store_true', default=False)
     parser.add_argument('-os', '--omit-solution', help='omit any solutions produced by the problem generator', action='store_true', default=False)
+    parser.add_argument('-vd', '--variable-domain', help='the variable domain of the output, boolean problems are converted from the spin problem', choices=variable_domains, default='spin')
     parser.add_argument('-iz', '--include-zeros', help='include zero values in output', action='store_true', default=False)
     parser.add_argument('-ccl', '--chimera-cell-limit', help='a limit the number of chimera cells used in the problem', type=int)
 
@@ -283,6 +394,7 @@ def build_cli_parser():
     parser_fl.add_argument('-mll', '--min-loop-length', help='the minimum length of a loop', type=int, default=7)
     parser_fl.add_argument('-lrl', '--loop-reject-limit', help='the maximum amount of loops to be reject', type=int, default=1000)
     parser_fl.add_argument('-lsl', '--loop-sample-limit', help='the maximum amount of random walk samples', type=int, default=10000)
+    parser_fl.add_argument('-w', '--workers', help='the number of processes proposing loops, results are reproducible for a given seed and number of workers', type=int, default=1)
 
     parser_wscn = subparsers.add_parser('wscn', help='generates a weak-strong cluster network problem')
     parser_wscn.set_defaults(generator='wscn')
@@ -298,6 +410,7 @@ def build_cli_parser():
     parser_fclg.add_argument('-mll', '--min-loop-length', help='the minimum length of a loop', type=int, default=7)
     parser_fclg.add_argument('-lrl', '--loop-reject-limit', help='the maximum amount of loops to be reject', type=int, default=5000)
     parser_fclg.add_argument('-lsl', '--loop-sample-limit', help='the maximum amount of random walk samples', type=int, default=10000)
+    parser_fclg.add_argument('-w', '--workers', help='the number of processes proposing loops, results are reproducible for a given seed and number of workers', type=int, default=1)
 
     return parser
 
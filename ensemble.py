@@ -0,0 +1,104 @@
+import json, pickle
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from common import derive_seed
+from common import validate_bqp_data
+from common import json_dumps_kwargs
+
+# builds ensembles of instances on a pool of processes, the instances are
+# returned in index order and only depend on the base seed and their index
+
+
+def generate_ensemble(args, qpu, count, base_seed, processes=1, window=None, chunk_size=None, encode=True):
+    '''Yields (index, text) for count instances built on qpu, where text is
+    the json encoding of the instance, or the bqpjson data itself when encode
+    is not set.  The seed of each instance is derived from base_seed and its
+    index, so the output is identical for any number of processes.  The loop
+    generators of the instances built by one process share a pool of
+    args.workers processes.  At most window chunks of chunk_size instances
+    are in flight at a time, which bounds the memory used for out of order
+    results.
+    '''
+    if processes <= 1:
+        executor = _loop_executor(args)
+        try:
+            for index in range(count):
+                yield index, _build_cases(args, qpu, [index], base_seed, encode, executor)[0]
+        finally:
+            if executor != None:
+                executor.shutdown()
+        return
+
+    if window == None:
+        window = 2*processes
+    if chunk_size == None:
+        chunk_size = max(1, min(16, count//(4*processes)))
+
+    # the qpu is pickled once and unpickled once per worker process
+    snapshot = pickle.dumps((args, qpu))
+    token = '{}/{}'.format(id(snapshot), base_seed)
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        pending = deque()
+        for start in range(0, count, chunk_size):
+            indices = list(range(start, min(start+chunk_size, count)))
+            pending.append((indices, executor.submit(_build_chunk, token, snapshot, indices, base_seed, encode)))
+            if len(pending) >= window:
+                indices, future = pending.popleft()
+                for item in zip(indices, future.result()):
+                    yield item
+
+        while len(pending) > 0:
+            indices, future = pending.popleft()
+            for item in zip(indices, future.result()):
+                yield item
+
+
+def encode_case(args, case, lines=True):
+    '''The json text of an instance, pretty printing is only used when each
+    instance has its own file.
+    '''
+    if args.pretty_print and not lines:
+        return json.dumps(case, **json_dumps_kwargs)
+    return json.dumps(case, sort_keys=True)
+
+
+def _loop_executor(args):
+    # a pool for the loop proposals of fl and fclg, when they use workers
+    if getattr(args, 'workers', 1) > 1:
+        return ProcessPoolExecutor(max_workers=args.workers)
+    return None
+
+
+def _build_cases(args, qpu, indices, base_seed, encode=True, executor=None):
+    # imported here, dwig is the command line entry point
+    from dwig import build_instance
+
+    cases = []
+    for index in indices:
+        case = build_instance(args, qpu, derive_seed(base_seed, index), executor=executor)
+        if not args.no_validation:
+            validate_bqp_data(case)
+        if encode:
+            case = encode_case(args, case, args.output_dir == None)
+        cases.append(case)
+    return cases
+
+
+# the unpickled args and qpu of the current ensemble, in each worker process
+_worker_state = {}
+
+def _build_chunk(token, snapshot, indices, base_seed, encode=True):
+    if token not in _worker_state:
+        _worker_state.clear()
+        _worker_state[token] = pickle.loads(snapshot)
+    args, qpu = _worker_state[token]
+
+    executor = _loop_executor(args)
+    try:
+        return _build_cases(args, qpu, indices, base_seed, encode, executor)
+    finally:
+        if executor != None:
+            executor.shutdown()
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+
+import sys, os, json, argparse, mmap
+
+from collections import namedtuple
+
+import numpy
+
+from common import print_err
+from common import DWIGException
+from common import json_dumps_kwargs
+
+# a binary container for ensembles of bqpjson instances on one topology.
+#
+# The file starts with the magic bytes and the topology, the sorted site ids
+# and the coupler endpoints, followed by one record per instance and ends
+# with an index of the record offsets and a trailer.  A record holds the
+# json of the fields that are not terms, bit masks of the variables, linear
+# terms and quadratic terms present on the topology, bit masks of the
+# coefficients that are json integers, the bit packed solutions and the
+# packed coefficients, as float32 when this is exact and float64 otherwise.
+# Terms and solutions are stored in topology order, when an instance lists
+# them in another order the record ends with the permutations that restore
+# it.  All sections are aligned to 8 bytes and little endian, so the arrays
+# can be read directly from a memory map.
+
+magic = b'DWIGENS1'
+
+_record_header = numpy.dtype([
+    ('json_length', '<u4'),
+    ('num_variables', '<u4'),
+    ('num_linear', '<u4'),
+    ('num_quadratic', '<u4'),
+    ('num_solutions', '<u4'),
+    ('coefficient_size', '<u4'),
+    ('num_orders', '<u4'),
+    ('reserved', '<u4')
+])
+
+_trailer = numpy.dtype([('index_offset', '<u8'), ('count', '<u8')])
+
+_term_keys = ['variable_ids', 'linear_terms', 'quadratic_terms']
+
+EnsembleRecord = namedtuple('EnsembleRecord', ['fields', 'variables', 'linear', 'linear_coefficients', 'linear_integral', 'quadratic', 'quadratic_coefficients', 'quadratic_integral', 'solutions', 'orders'])
+
+# the sequences of a record that can be permuted, the k-th solution is
+# sequence solution_order+k
+variable_order = 0
+linear_order = 1
+quadratic_order = 2
+solution_order = 3
+
+
+def _padding(length):
+    return (-length) % 8
+
+
+def qpu_topology(qpu):
+    '''The sorted site ids and coupler endpoints of a ChimeraQPU.'''
+    site_ids = [site.index for site in qpu.sorted_sites()]
+    couplers = [(i.index, j.index) for i, j in qpu.sorted_couplers()]
+    return site_ids, couplers
+
+
+def bqp_topology(cases):
+    '''The union of the variables and quadratic terms of bqpjson cases.'''
+    site_ids = set()
+    couplers = set()
+    for data in cases:
+        site_ids.update(data['variable_ids'])
+        couplers.update((term['id_tail'], term['id_head']) for term in data['quadratic_terms'])
+    return sorted(site_ids), sorted(couplers)
+
+
+class EnsembleWriter(object):
+    '''Writes bqpjson instances on a fixed topology to an ensemble file.  The
+    variables, terms and solutions of an instance may be in any order, the
+    order is only stored when it differs from the topology, which is never
+    the case for the output of D-WIG.  Every solution must assign each of
+    the variables once.
+    '''
+    def __init__(self, file_name, site_ids, couplers):
+        self.site_ids = numpy.array(site_ids, dtype='<i8')
+        self.couplers = numpy.array(couplers, dtype='<i8').reshape(-1, 2)
+        assert(numpy.all(numpy.diff(self.site_ids) > 0))
+
+        self.site_position = {site : k for k, site in enumerate(self.site_ids.tolist())}
+        self.coupler_position = {(i, j) : k for k, (i, j) in enumerate(self.couplers.tolist())}
+        assert(len(self.coupler_position) == len(self.couplers))
+
+        self.file = open(file_name, 'wb')
+        self.offsets = []
+
+        self.file.write(magic)
+        self.file.write(numpy.array([len(self.site_ids), len(self.couplers)], dtype='<u8').tobytes())
+        self.file.write(self.site_ids.tobytes())
+        self.file.write(self.couplers.tobytes())
+        self.position = len(magic) + 16 + self.site_ids.nbytes + self.couplers.nbytes
+
+    def _positions(self, lookup, keys, name):
+        # the sorted positions of the keys and the order that sorts them
+        try:
+            positions = numpy.array([lookup[key] for key in keys], dtype=numpy.int64)
+        except KeyError as error:
+            raise DWIGException('the {} entry {} is not part of the ensemble topology'.format(name, error.args[0]))
+        order = numpy.argsort(positions, kind='mergesort')
+        positions = positions[order]
+        if numpy.any(numpy.diff(positions) == 0):
+            raise DWIGException('the {} include an entry more than once'.format(name))
+        return positions, order
+
+    def _mask(self, positions, size):
+        mask = numpy.zeros(size, dtype=bool)
+        mask[positions] = True
+        return numpy.packbits(mask)
+
+    def write(self, data):
+        '''Appends a bqpjson instance and returns its index.'''
+        variables, variable_sort = self._positions(self.site_position, data['variable_ids'], 'variable_ids')
+        linear, linear_sort = self._positions(self.site_position, [term['id'] for term in data['linear_terms']], 'linear_terms')
+        quadratic, quadratic_sort = self._positions(self.coupler_position, [(term['id_tail'], term['id_head']) for term in data['quadratic_terms']], 'quadratic_terms')
+        sorts = [variable_sort, linear_sort, quadratic_sort]
+
+        coefficients = [data['linear_terms'][k]['coeff'] for k in linear_sort.tolist()] + [data['quadratic_terms'][k]['coeff'] for k in quadratic_sort.tolist()]
+        integral = numpy.array([type(coeff) == int for coeff in coefficients], dtype=bool)
+        coefficients = numpy.array(coefficients, dtype='<f8')
+        if numpy.array_equal(coefficients.astype('<f4').astype('<f8'), coefficients):
+            coefficients = coefficients.astype('<f4')
+
+        fields = {k:v for k,v in data.items() if not k in _term_keys}
+        solution_bits = []
+        if 'solutions' in data:
+            fields['solutions'] = []
+            for solution in data['solutions']:
+                assignment = solution['assignment']
+                assigned, assignment_sort = self._positions(self.site_position, [term['id'] for term in assignment], 'solution assignment')
+                if not numpy.array_equal(assigned, variables):
+                    raise DWIGException('solution {} does not assign the variables of variable_ids'.format(solution.get('id')))
+                solution_bits.append(numpy.array([term['value'] == 1 for term in assignment], dtype=bool)[assignment_sort])
+                sorts.append(assignment_sort)
+                fields['solutions'].append({k:v for k,v in solution.items() if k != 'assignment'})
+        fields = json.dumps(fields, sort_keys=True).encode('utf-8')
+
+        # the position in topology order of each entry, for the sequences
+        # that are not given in topology order
+        order_ids = []
+        orders = []
+        for sequence, sort in enumerate(sorts):
+            if numpy.any(sort != numpy.arange(len(sort))):
+                rank = numpy.empty(len(sort), dtype='<u4')
+                rank[sort] = numpy.arange(len(sort))
+                order_ids.append(sequence)
+                orders.append(rank)
+        orders = numpy.concatenate([numpy.array(order_ids, dtype='<u4')] + orders)
+
+        header = numpy.zeros(1, dtype=_record_header)
+        header['json_length'] = len(fields)
+        header['num_variables'] = len(variables)
+        header['num_linear'] = len(linear)
+        header['num_quadratic'] = len(quadratic)
+        header['num_solutions'] = len(solution_bits)
+        header['coefficient_size'] = coefficients.itemsize
+        header['num_orders'] = len(order_ids)
+
+        masks = [
+            self._mask(variables, len(self.site_ids)),
+            self._mask(linear, len(self.site_ids)),
+            self._mask(quadratic, len(self.couplers)),
+            numpy.packbits(integral[:len(linear)]),
+            numpy.packbits(integral[len(linear):])
+        ] + [numpy.packbits(bits) for bits in solution_bits]
+        masks = numpy.concatenate(masks).astype(numpy.uint8)
+
+        parts = [header.tobytes(), fields, b'\0'*_padding(len(fields)), masks.tobytes(), b'\0'*_padding(len(masks)), coefficients.tobytes(), b'\0'*_padding(coefficients.nbytes), orders.tobytes()]
+        record = b''.join(parts)
+        record = record + b'\0'*_padding(len(record))
+
+        self.offsets.append(self.position)
+        self.file.write(record)
+        self.position += len(record)
+        return len(self.offsets)-1
+
+    def close(self):
+        if self.file == None:
+            return
+        index_offset = self.position
+        self.file.write(numpy.array(self.offsets + [self.position], dtype='<u8').tobytes())
+        trailer = numpy.zeros(1, dtype=_trailer)
+        trailer['index_offset'] = index_offset
+        trailer['count'] = len(self.offsets)
+        self.file.write(trailer.tobytes())
+        self.file.write(magic)
+        self.file.close()
+        self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class EnsembleReader(object):
+    '''Reads an ensemble file through a memory map.  Instances are read by
+    index, either as bqpjson data or as an EnsembleRecord of arrays.
+    '''
+    def __init__(self, file_name):
+        self.file = open(file_name, 'rb')
+        self.buffer = None
+
+        # the smallest file has an empty topology and index
+        size = os.fstat(self.file.fileno()).st_size
+        if size < 2*len(magic) + 16 + 8 + _trailer.itemsize:
+            self.close()
+            raise DWIGException('{} is not a D-WIG ensemble file'.format(file_name))
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.buffer[:len(magic)] != magic or self.buffer[-len(magic):] != magic:
+            self.close()
+            raise DWIGException('{} is not a D-WIG ensemble file'.format(file_name))
+
+        num_sites, num_couplers = numpy.frombuffer(self.buffer, dtype='<u8', count=2, offset=len(magic)).tolist()
+        trailer = numpy.frombuffer(self.buffer, dtype=_trailer, count=1, offset=size-len(magic)-_trailer.itemsize).copy()[0]
+        index_offset = int(trailer['index_offset'])
+        self.count = int(trailer['count'])
+
+        topology_end = len(magic) + 16 + 8*num_sites + 16*num_couplers
+        if topology_end > index_offset or index_offset + 8*(self.count+1) != size - len(magic) - _trailer.itemsize:
+            self.close()
+            raise DWIGException('{} is a truncated or damaged D-WIG ensemble file'.format(file_name))
+
+        offset = len(magic) + 16
+        self.site_ids = numpy.frombuffer(self.buffer, dtype='<i8', count=num_sites, offset=offset).copy()
+        offset += 8*num_sites
+        self.couplers = numpy.frombuffer(self.buffer, dtype='<i8', count=2*num_couplers, offset=offset).reshape(-1, 2).copy()
+
+        self.offsets = numpy.frombuffer(self.buffer, dtype='<u8', count=self.count+1, offset=index_offset).copy()
+        if self.count > 0 and (int(self.offsets[0]) < topology_end or numpy.any(numpy.diff(self.offsets.astype(numpy.int64)) <= 0) or int(self.offsets[-1]) != index_offset):
+            self.close()
+            raise DWIGException('{} is a truncated or damaged D-WIG ensemble file'.format(file_name))
+
+    def __len__(self):
+        return self.count
+
+    def record(self, index):
+        '''The EnsembleRecord of an instance, variables, linear and quadratic
+        are positions in site_ids and couplers, and all arrays are in topology
+        order.  orders maps each sequence that the instance lists in another
+        order, see variable_order and the following constants, to the position
+        in topology order of each of its entries.
+        '''
+        if index < 0 or index >= self.count:
+            raise IndexError('ensemble index {} out of range'.format(index))
+        offset = int(self.offsets[index])
+
+        header = numpy.frombuffer(self.buffer, dtype=_record_header, count=1, offset=offset)[0]
+        json_length = int(header['json_length'])
+        num_linear = int(header['num_linear'])
+        num_quadratic = int(header['num_quadratic'])
+        num_variables = int(header['num_variables'])
+        num_solutions = int(header['num_solutions'])
+        num_orders = int(header['num_orders'])
+
+        offset += _record_header.itemsize
+        fields = json.loads(self.buffer[offset:offset+json_length].decode('utf-8'))
+        offset += json_length + _padding(json_length)
+
+        sizes = [len(self.site_ids), len(self.site_ids), len(self.couplers), num_linear, num_quadratic] + [num_variables]*num_solutions
+        masks = []
+        for size in sizes:
+            length = (size+7)//8
+            masks.append(numpy.unpackbits(numpy.frombuffer(self.buffer, dtype=numpy.uint8, count=length, offset=offset))[:size].astype(bool))
+            offset += length
+        offset += _padding(sum((size+7)//8 for size in sizes))
+
+        dtype = '<f4' if int(header['coefficient_size']) == 4 else '<f8'
+        coefficients = numpy.frombuffer(self.buffer, dtype=dtype, count=num_linear+num_quadratic, offset=offset).astype(numpy.float64)
+        offset += coefficients.size*int(header['coefficient_size'])
+        offset += _padding(coefficients.size*int(header['coefficient_size']))
+
+        orders = {}
+        order_ids = numpy.frombuffer(self.buffer, dtype='<u4', count=num_orders, offset=offset).tolist()
+        offset += 4*num_orders
+        for sequence in order_ids:
+            length = {variable_order: num_variables, linear_order: num_linear, quadratic_order: num_quadratic}.get(sequence, num_variables)
+            orders[sequence] = numpy.frombuffer(self.buffer, dtype='<u4', count=length, offset=offset).astype(numpy.int64)
+            offset += 4*length
+
+        return EnsembleRecord(fields,
+            numpy.flatnonzero(masks[0]), numpy.flatnonzero(masks[1]), coefficients[:num_linear], masks[3],
+            numpy.flatnonzero(masks[2]), coefficients[num_linear:], masks[4], masks[5:], orders)
+
+    def __getitem__(self, index):
+        '''The bqpjson data of an instance.'''
+        record = self.record(index)
+        data = record.fields
+
+        def coefficient(value, integral):
+            return int(value) if integral else value
+
+        def ordered(values, sequence):
+            if sequence in record.orders:
+                return [values[k] for k in record.orders[sequence].tolist()]
+            return values
+
+        variable_ids = self.site_ids[record.variables].tolist()
+        data['variable_ids'] = ordered(variable_ids, variable_order)
+        data['linear_terms'] = ordered([{'id':i, 'coeff':coefficient(c, b)} for i, c, b in
+            zip(self.site_ids[record.linear].tolist(), record.linear_coefficients.tolist(), record.linear_integral.tolist())], linear_order)
+        data['quadratic_terms'] = ordered([{'id_tail':i, 'id_head':j, 'coeff':coefficient(c, b)} for (i, j), c, b in
+            zip(self.couplers[record.quadratic].tolist(), record.quadratic_coefficients.tolist(), record.quadratic_integral.tolist())], quadratic_order)
+
+        if 'solutions' in data:
+            low = -1 if data['variable_domain'] == 'spin' else 0
+            for k, (solution, bits) in enumerate(zip(data['solutions'], record.solutions)):
+                solution['assignment'] = ordered([{'id':i, 'value':(1 if bit else low)} for i, bit in zip(variable_ids, bits.tolist())], solution_order+k)
+
+        return data
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+    def close(self):
+        if self.buffer != None:
+            self.buffer.close()
+            self.buffer = None
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def main(args, output_stream=sys.stdout):
+    # imported here, anneal is only needed for reading bqpjson inputs
+    from anneal import load_cases
+
+    if args.command == 'pack':
+        site_ids, couplers = bqp_topology(data for path in args.inputs for name, data in load_cases(path))
+        with EnsembleWriter(args.ensemble_file, site_ids, couplers) as writer:
+            for path in args.inputs:
+                for name, data in load_cases(path):
+                    writer.write(data)
+            print_err('info: wrote {} instances to {}'.format(len(writer.offsets), args.ensemble_file))
+        return
+
+    with EnsembleReader(args.ensemble_file) as reader:
+        indices = args.indices if args.indices != None else range(len(reader))
+        if args.output_dir != None and not os.path.isdir(args.output_dir):
+            os.makedirs(args.output_dir)
+
+        for index in indices:
+            data = reader[index]
+            if args.output_dir != None:
+                file_name = os.path.join(args.output_dir, '{:0{}d}.json'.format(index, len(str(len(reader)-1))))
+                with open(file_name, 'w') as file:
+                    if args.pretty_print:
+                        print(json.dumps(data, **json_dumps_kwargs), file=file)
+                    else:
+                        print(json.dumps(data, sort_keys=True), file=file)
+            else:
+                print(json.dumps(data, sort_keys=True), file=output_stream)
+
+
+def build_cli_parser():
+    parser = argparse.ArgumentParser(description='converts between D-WIG ensemble files and bqpjson instances')
+    subparsers = parser.add_subparsers()
+
+    parser_pack = subparsers.add_parser('pack', help='writes bqpjson instances to an ensemble file')
+    parser_pack.set_defaults(command='pack')
+    parser_pack.add_argument('ensemble_file', help='the ensemble file to write')
+    parser_pack.add_argument('inputs', help='bqpjson files, JSON lines files with one problem per line, or directories of these', nargs='+')
+
+    parser_unpack = subparsers.add_parser('unpack', help='writes the instances of an ensemble file as bqpjson, one per line or one file each')
+    parser_unpack.set_defaults(command='unpack')
+    parser_unpack.add_argument('ensemble_file', help='the ensemble file to read')
+    parser_unpack.add_argument('-i', '--indices', help='the indices of the instances to write', type=int, nargs='+')
+    parser_unpack.add_argument('-od', '--output-dir', help='write each instance to a separate file in the given directory', default=None)
+    parser_unpack.add_argument('-pp', '--pretty-print', help='pretty print the json files', action='store_true', default=False)
+
+    return parser
+
+
+if __name__ == '__main__':
+    parser = build_cli_parser()
+    main(parser.parse_args())
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+
+import sys, json, argparse
+
+import numpy
+
+from common import print_err
+from common import DWIGException
+
+# evaluates the energy of many samples of a problem at once
+
+
+class EnergyModel(object):
+    '''The linear and quadratic terms of a problem, indexed by the position
+    of each variable in variables.  Samples are given as rows of a matrix
+    with one column per variable, and energies are computed the same way as
+    QPUAssignment.eval, scale*(energy + offset).
+    '''
+    def __init__(self, variables, linear, coupler_i, coupler_j, quadratic, scale=1.0, offset=0.0):
+        self.variables = list(variables)
+        self.linear = numpy.asarray(linear, dtype=numpy.float64)
+        self.coupler_i = numpy.asarray(coupler_i, dtype=numpy.int64)
+        self.coupler_j = numpy.asarray(coupler_j, dtype=numpy.int64)
+        self.quadratic = numpy.asarray(quadratic, dtype=numpy.float64)
+        self.scale = scale
+        self.offset = offset
+        self._adjacency = None
+
+        assert(len(self.linear) == len(self.variables))
+        assert(len(self.coupler_i) == len(self.quadratic) and len(self.coupler_j) == len(self.quadratic))
+
+    def energies(self, samples, chunk_size=4096):
+        '''Returns the energy of each row of samples.  Rows are processed in
+        chunks so that the gathered coupler products stay small.
+        '''
+        samples = numpy.asarray(samples)
+        if samples.ndim == 1:
+            samples = samples.reshape(1, -1)
+        assert(samples.shape[1] == len(self.variables))
+
+        energies = numpy.empty(samples.shape[0], dtype=numpy.float64)
+        for start in range(0, samples.shape[0], chunk_size):
+            chunk = samples[start:start+chunk_size].astype(numpy.float64)
+            energy = chunk.dot(self.linear)
+            energy += (chunk[:, self.coupler_i]*chunk[:, self.coupler_j]).dot(self.quadratic)
+            energies[start:start+chunk_size] = energy
+
+        return self.scale*(energies + self.offset)
+
+    def adjacency(self):
+        '''Returns the CSR adjacency (ptr, neighbors, weights) of the 
+        quadratic terms, where the neighbors of variable k and the matching 
+        coefficients are stored in positions ptr[k] to ptr[k+1].  It is built 
+        on the first call.
+        '''
+        if self._adjacency is None:
+            endpoints = numpy.concatenate((self.coupler_i, self.coupler_j))
+            others = numpy.concatenate((self.coupler_j, self.coupler_i))
+            weights = numpy.concatenate((self.quadratic, self.quadratic))
+
+            order = numpy.argsort(endpoints, kind='mergesort')
+            ptr = numpy.zeros(len(self.variables)+1, dtype=numpy.int64)
+            numpy.cumsum(numpy.bincount(endpoints, minlength=len(self.variables)), out=ptr[1:])
+            self._adjacency = (ptr, others[order], weights[order])
+        return self._adjacency
+
+    def sample_matrix(self, assignments):
+        '''Builds an int8 sample matrix from dicts of variable values.'''
+        samples = numpy.zeros((len(assignments), len(self.variables)), dtype=numpy.int8)
+        for k, assignment in enumerate(assignments):
+            samples[k] = [assignment[variable] for variable in self.variables]
+        return samples
+
+
+def from_configuration(qpu_config):
+    '''The energy model of a QPUConfiguration, its variables are the active
+    sites in index order.
+    '''
+    active_sites = qpu_config.active_sites()
+    variables = [site for site in qpu_config.qpu.sorted_sites() if site in active_sites]
+    position = {site : k for k, site in enumerate(variables)}
+
+    linear = [qpu_config.fields.get(site, 0.0) for site in variables]
+    couplers = [coupler for coupler in qpu_config.qpu.sorted_couplers() if coupler in qpu_config.couplings]
+
+    return EnergyModel(variables, linear,
+        [position[i] for i,j in couplers], [position[j] for i,j in couplers],
+        [qpu_config.couplings[coupler] for coupler in couplers],
+        qpu_config.scale, qpu_config.offset)
+
+
+def from_bqp(data):
+    '''The energy model of bqpjson data, its variables are the variable_ids.'''
+    variables = data['variable_ids']
+    position = {variable : k for k, variable in enumerate(variables)}
+
+    linear = numpy.zeros(len(variables))
+    for term in data['linear_terms']:
+        linear[position[term['id']]] += term['coeff']
+
+    quadratic_terms = data['quadratic_terms']
+    return EnergyModel(variables, linear,
+        [position[term['id_tail']] for term in quadratic_terms], [position[term['id_head']] for term in quadratic_terms],
+        [term['coeff'] for term in quadratic_terms],
+        data['scale'], data['offset'])
+
+
+class LocalFieldCache(object):
+    '''Holds a spin state of an EnergyModel with the local field of every
+    variable, h_k + sum_j J_kj s_j, so that the energy change of flipping a 
+    spin is available in O(1) and a flip updates the cache in O(degree).  
+    Energies and deltas are scaled like EnergyModel.energies.
+    '''
+    def __init__(self, model, spins):
+        self.model = model
+        self.spins = numpy.array(spins, dtype=numpy.int8).reshape(-1)
+        assert(len(self.spins) == len(model.variables))
+
+        spins = self.spins.astype(numpy.float64)
+        self.fields = model.linear.copy()
+        numpy.add.at(self.fields, model.coupler_i, model.quadratic*spins[model.coupler_j])
+        numpy.add.at(self.fields, model.coupler_j, model.quadratic*spins[model.coupler_i])
+
+        # the unscaled energy without the offset
+        self._energy = float(numpy.dot(spins, model.linear) + numpy.dot(model.quadratic, spins[model.coupler_i]*spins[model.coupler_j]))
+
+    def energy(self):
+        return self.model.scale*(self._energy + self.model.offset)
+
+    def delta(self, k):
+        '''The energy change of flipping variable k.'''
+        return self.model.scale*-2.0*self.spins[k]*self.fields[k]
+
+    def deltas(self):
+        '''The energy change of flipping each variable on its own.'''
+        return self.model.scale*-2.0*self.spins*self.fields
+
+    def is_local_minimum(self, tolerance=1e-9):
+        return bool(numpy.all(self.deltas() >= -tolerance))
+
+    def flip(self, k):
+        '''Flips variable k and returns the energy change.'''
+        ptr, neighbors, weights = self.model.adjacency()
+        spin = float(self.spins[k])
+
+        delta = -2.0*spin*self.fields[k]
+        self.fields[neighbors[ptr[k]:ptr[k+1]]] -= 2.0*spin*weights[ptr[k]:ptr[k+1]]
+        self.spins[k] = -self.spins[k]
+        self._energy += delta
+
+        return self.model.scale*delta
+
+    def flip_many(self, variables):
+        '''Flips all of the given (distinct) variables at once and returns the
+        energy change, the cost is linear in their total degree.
+        '''
+        ptr, neighbors, weights = self.model.adjacency()
+        variables = numpy.asarray(variables, dtype=numpy.int64)
+        assert(len(numpy.unique(variables)) == len(variables))
+
+        spins = self.spins.astype(numpy.float64)
+        flipped = numpy.zeros(len(self.spins), dtype=bool)
+        flipped[variables] = True
+
+        # the adjacency positions of all flipped variables
+        lengths = ptr[variables+1] - ptr[variables]
+        sources = numpy.repeat(variables, lengths)
+        positions = numpy.arange(lengths.sum()) - numpy.repeat(numpy.cumsum(lengths) - lengths, lengths) + numpy.repeat(ptr[variables], lengths)
+        others = neighbors[positions]
+        values = weights[positions]*spins[sources]
+
+        # couplings between two flipped variables keep their sign and appear
+        # twice in the adjacency
+        delta = -2.0*numpy.dot(spins[variables], self.fields[variables])
+        delta += 2.0*numpy.sum((values*spins[others])[flipped[others]])
+
+        numpy.add.at(self.fields, others, -2.0*values)
+        self.spins[variables] = -self.spins[variables]
+        self._energy += delta
+
+        return self.model.scale*delta
+
+    def assignment(self):
+        '''The current spins as a dict keyed by the model variables.'''
+        return dict(zip(self.model.variables, self.spins.tolist()))
+
+
+def local_field_cache(assignment):
+    '''A LocalFieldCache that starts from the spins of a QPUAssignment.'''
+    model = from_configuration(assignment.qpu_config)
+    return LocalFieldCache(model, model.sample_matrix([assignment.spins])[0])
+
+
+def load_samples(file_name, num_variables, variable_domain='spin'):
+    '''Reads a sample matrix from a .npy file or from a text file with one
+    sample per line, values separated by spaces or commas.  Every sample must
+    assign num_variables values of the variable domain, -1/1 for spin and 0/1
+    for boolean problems.
+    '''
+    values = (-1, 1) if variable_domain == 'spin' else (0, 1)
+
+    if file_name.endswith('.npy'):
+        samples = numpy.load(file_name)
+        if samples.ndim != 2 or samples.shape[1] != num_variables:
+            raise DWIGException('{} holds samples of shape {}, expected rows of {} values'.format(file_name, samples.shape, num_variables))
+        invalid = numpy.flatnonzero(~numpy.isin(samples, values).all(axis=1))
+        if len(invalid) > 0:
+            raise DWIGException('{} row {} has values other than {} and {}'.format(file_name, invalid[0]+1, values[0], values[1]))
+        return samples.astype(numpy.int8)
+
+    rows = []
+    with open(file_name) as file:
+        for line_number, line in enumerate(file, 1):
+            line = line.split('#')[0].replace(',', ' ').split()
+            if len(line) == 0:
+                continue
+            if len(line) != num_variables:
+                raise DWIGException('{} line {} has {} values, expected {}'.format(file_name, line_number, len(line), num_variables))
+            try:
+                row = [int(value) for value in line]
+            except ValueError:
+                raise DWIGException('{} line {} has a value that is not an integer'.format(file_name, line_number))
+            if any(value not in values for value in row):
+                raise DWIGException('{} line {} has values other than {} and {}'.format(file_name, line_number, values[0], values[1]))
+            rows.append(row)
+
+    return numpy.array(rows, dtype=numpy.int8).reshape(-1, num_variables)
+
+
+def main(args, output_stream=sys.stdout):
+    with open(args.input_file) as file:
+        data = json.load(file)
+    model = from_bqp(data)
+
+    ground_energy = None
+    if 'solutions' in data and len(data['solutions']) > 0:
+        planted = {term['id']: term['value'] for term in data['solutions'][0]['assignment']}
+        ground_energy = model.energies(model.sample_matrix([planted]))[0]
+
+    if args.residual and ground_energy == None:
+        print_err('warning: {} does not include a planted solution, printing energies'.format(args.input_file))
+
+    for sample_file in args.sample_files:
+        energies = model.energies(load_samples(sample_file, len(model.variables), data['variable_domain']))
+
+        if args.summary:
+            summary = {
+                'file': sample_file,
+                'samples': len(energies),
+                'min_energy': float(energies.min()) if len(energies) > 0 else None,
+                'mean_energy': float(energies.mean()) if len(energies) > 0 else None
+            }
+            if ground_energy != None:
+                summary['ground_energy'] = float(ground_energy)
+                summary['min_residual_energy'] = summary['min_energy'] - ground_energy if len(energies) > 0 else None
+            print(json.dumps(summary, sort_keys=True), file=output_stream)
+        else:
+            for energy in energies.tolist():
+                if ground_energy != None and args.residual:
+                    energy = energy - ground_energy
+                print(energy, file=output_stream)
+
+
+def build_cli_parser():
+    parser = argparse.ArgumentParser(description='evaluates the energy of samples of a bqpjson problem, each sample file has one sample per line in the order of the variable_ids or is a .npy matrix')
+
+    parser.add_argument('input_file', help='the bqpjson problem')
+    parser.add_argument('sample_files', help='the sample files to evaluate', nargs='+')
+    parser.add_argument('-s', '--summary', help='print the size, minimum and mean energy of each file instead of every energy', action='store_true', default=False)
+    parser.add_argument('-r', '--residual', help='print energies relative to the planted solution of the problem', action='store_true', default=False)
+
+    return parser
+
+
+if __name__ == '__main__':
+    parser = build_cli_parser()
+    main(parser.parse_args())
@@ -1,6 +1,7 @@
-import random, math
+import random, math, pickle
 
 from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from itertools import product, chain
 
 from common import DWIGException
@@ -10,14 +11,20 @@ from structure import QPUAssignment
 from structure import QPUConfiguration
 from structure import ChimeraCoordinate
 
+from certificate import FrustratedLoop
+from certificate import Gadget
+from certificate import LoopCertificate
+from certificate import cell_loop_strands
+
 # Generators take an instance of ChimeraQPU (qpu) and a generate 
 # a problem and return the data as a QPUConfiguration object
 
-def generate_disordered(qpu, coupling_vals=[], couplings_pr=[], field_vals=[], fields_pr=[], random_gauge_transformation=False):
+def generate_disordered(qpu, coupling_vals=[], couplings_pr=[], field_vals=[], fields_pr=[], random_gauge_transformation=False, rng=random):
     '''This function builds random couplings and fields based on independent
     probability distributions it is used to implement the gd, cbfm and const
     problem classes.
     '''
+    import numpy
 
     assert(len(coupling_vals) == len(couplings_pr))
     assert(len(field_vals) == len(fields_pr))
@@ -25,71 +32,116 @@ def generate_disordered(qpu, coupling_vals=[], couplings_pr=[], field_vals=[], f
     assert(sum(couplings_pr) <= 1.0 and all(pr >= 0.0 for pr in couplings_pr))
     assert(sum(fields_pr) <= 1.0 and all(pr >= 0.0 for pr in fields_pr))
 
+    topology = qpu.topology()
+
+    # the position of each value in its distribution, len(vals) when no value is drawn
+    field_choices = numpy.full(len(topology.sites), len(field_vals))
+    coupling_choices = numpy.full(len(topology.couplers), len(coupling_vals))
+
+    site_signs = numpy.ones(len(topology.sites), dtype=numpy.int64)
+
+    with _MirroredRandom(rng) as rnd:
+        if len(fields_pr) > 0:
+            field_choices = numpy.searchsorted(_cdf(fields_pr), rnd.random(len(topology.sites)), side='left')
+
+        if len(couplings_pr) > 0:
+            coupling_choices = numpy.searchsorted(_cdf(couplings_pr), rnd.random(len(topology.couplers)), side='left')
+
+        if random_gauge_transformation:
+            site_signs[rnd.random(len(topology.sites)) < 0.5] = -1
+
+    coupler_signs = site_signs[topology.coupler_i]*site_signs[topology.coupler_j]
+
     fields = {}
+    for site, k, sign in zip(topology.sites, field_choices.tolist(), site_signs.tolist()):
+        if k < len(field_vals):
+            fields[site] = field_vals[k] if sign > 0 else field_vals[k]*-1
+
     couplings = {}
+    for coupler, k, sign in zip(topology.couplers, coupling_choices.tolist(), coupler_signs.tolist()):
+        if k < len(coupling_vals):
+            couplings[coupler] = coupling_vals[k] if sign > 0 else coupling_vals[k]*-1
 
-    if len(fields_pr) > 0:
-        fields_cdf = [fields_pr[0]]
-        for (i,pr) in enumerate(fields_pr[1:]):
-            fields_cdf.append(fields_cdf[i] + pr)
+    return QPUConfiguration(qpu, fields, couplings)
 
-        fields_dist = [i for i in zip(fields_cdf, field_vals)]
 
-        for site in sorted(qpu.sites):
-            rnd = random.random()
-            for cdf, val in fields_dist:
-                if rnd <= cdf:
-                    fields[site] = val
-                    break
+def _cdf(probabilities):
+    import numpy
 
-    if len(couplings_pr) > 0:
-        couplings_cdf = [couplings_pr[0]]
-        for (i,pr) in enumerate(couplings_pr[1:]):
-            couplings_cdf.append(couplings_cdf[i] + pr)
+    # accumulated in order, so that the bounds match the sequential sums exactly
+    cdf = [probabilities[0]]
+    for (i,pr) in enumerate(probabilities[1:]):
+        cdf.append(cdf[i] + pr)
+    return numpy.array(cdf)
 
-        couplings_dist = [i for i in zip(couplings_cdf, coupling_vals)]
 
-        for coupling in sorted(qpu.couplers):
-            rnd = random.random()
-            for cdf, val in couplings_dist:
-                if rnd <= cdf:
-                    couplings[coupling] = val
-                    break
+class _MirroredRandom(object):
+    '''Mirrors the state of a python random number generator into a numpy 
+    RandomState, so that batches of draws produce exactly the values of the
+    equivalent sequence of python calls.  Both generators use the Mersenne 
+    Twister and build doubles from the same 53 bits.  On exit the python
+    generator is advanced past all of the draws made in the batch.
+    '''
+    def __init__(self, rng=random):
+        self.rng = rng
 
-    if random_gauge_transformation:
-        adjacent = {}
-        for i, j in qpu.couplers:
-            adjacent.setdefault(i, []).append((i, j))
-            adjacent.setdefault(j, []).append((i, j))
+    def __enter__(self):
+        import numpy
 
-        for site in sorted(qpu.sites):
-            if random.random() < 0.5:
-                if site in fields:
-                    fields[site] *= -1
-                for pair in adjacent[site]:
-                    if pair in couplings:
-                        couplings[pair] *= -1
+        self.version, internal_state, self.gauss_next = self.rng.getstate()
+        self.state = numpy.random.RandomState()
+        self.state.set_state(('MT19937', numpy.array(internal_state[:-1], dtype=numpy.uint32), internal_state[-1]))
+        return self
 
-    return QPUConfiguration(qpu, fields, couplings)
+    def __exit__(self, exc_type, exc_value, traceback):
+        name, key, pos = self.state.get_state()[:3]
+        self.rng.setstate((self.version, tuple(key.tolist()) + (int(pos),), self.gauss_next))
+        return False
+
+    def random(self, size):
+        '''Equivalent to size calls of random.random()'''
+        return self.state.random_sample(size)
+
+    def randbelow(self, n, size):
+        '''Equivalent to size calls of random.randrange(n), which python 
+        implements by rejection sampling on getrandbits(n.bit_length())
+        '''
+        import numpy
+
+        shift = 32 - n.bit_length()
+        assert(shift >= 0)
+
+        values = []
+        remaining = size
+        while remaining > 0:
+            # each call consumes at least one word, so no draw is wasted
+            words = self.state.randint(0, 2**32, size=remaining, dtype=numpy.uint32) >> shift
+            words = words[words < n]
+            values.append(words)
+            remaining -= len(words)
+
+        return numpy.concatenate(values).astype(numpy.int64) if len(values) > 0 else numpy.zeros(0, dtype=numpy.int64)
+
+    def choice(self, seq, size):
+        '''Equivalent to size calls of random.choice(seq)'''
+        import numpy
+        return numpy.asarray(seq)[self.randbelow(len(seq), size)]
 
 
-def generate_ran(qpu, probability=0.5, steps=1, feild=False, scale=1.0, simple_ground_state=False):
+def generate_ran(qpu, probability=0.5, steps=1, feild=False, scale=1.0, simple_ground_state=False, rng=random):
     '''This function builds random couplings as described by, https://arxiv.org/abs/1511.02476,
     which is a generalization of https://arxiv.org/abs/1508.05087
     '''
+    import numpy
+
     assert(isinstance(probability, float))
     assert(probability <= 1.0 and probability >= 0.0)
     assert(isinstance(steps, int))
     assert(steps >= 1)
 
-    fields = {}
-    couplings = {}
-
-    # Build an initial spin state for generating the case
-    if simple_ground_state:
-        spins = {site : -1 for site in sorted(qpu.sites)}
-    else:
-        spins = {site : random.choice([-1, 1]) for site in sorted(qpu.sites)}
+    topology = qpu.topology()
+    num_sites = len(topology.sites)
+    num_couplers = len(topology.couplers)
 
     if probability < 1.0:
         discription = 'initial state for building this case with a probability of {}, is most likely not a ground state'.format(probability)
@@ -99,119 +151,84 @@ def generate_ran(qpu, probability=0.5, steps=1, feild=False, scale=1.0, simple_g
         else:
             discription = 'planted ground state, one of two'
 
-    # Assign non-frustrated couplings and fields at random
     fm_choices = [float(x) for x in range(1, steps+1)]
 
-    if feild:
-        fields = {site : -scale*spins[site]*random.choice(fm_choices) for site in sorted(qpu.sites)}
+    with _MirroredRandom(rng) as rnd:
+        # Build an initial spin state for generating the case
+        if simple_ground_state:
+            spins = numpy.full(num_sites, -1, dtype=numpy.int64)
+        else:
+            spins = rnd.choice([-1, 1], num_sites)
 
-    couplings = {coupler : -scale*spins[coupler[0]]*spins[coupler[1]]*random.choice(fm_choices) for coupler in sorted(qpu.couplers)}
+        # Assign non-frustrated couplings and fields at random
+        if feild:
+            fields = -scale*spins*rnd.choice(fm_choices, num_sites)
 
+        couplings = -scale*spins[topology.coupler_i]*spins[topology.coupler_j]*rnd.choice(fm_choices, num_couplers)
 
-    # With probability alpha, override non-frustrated couplings and fields with random ones
-    ran_choices = [i for i in range(-steps, 0)] + [i for i in range(1, steps+1)]
-    ran_choices = [float(x) for x in ran_choices]
+        # With probability alpha, override non-frustrated couplings and fields with random ones
+        if feild:
+            fields[probability < rnd.random(num_sites)] *= -1
 
-    if feild:
-        for site in sorted(qpu.sites):
-            if probability < random.random():
-                fields[site] = -fields[site]
+        couplings[probability < rnd.random(num_couplers)] *= -1
 
-    for coupler in sorted(qpu.couplers):
-        if probability < random.random():
-            couplings[coupler] = -couplings[coupler]
+    spins = dict(zip(topology.sites, spins.tolist()))
+    couplings = dict(zip(topology.couplers, couplings.tolist()))
+    if feild:
+        fields = dict(zip(topology.sites, fields.tolist()))
+    else:
+        fields = {}
 
     config = QPUConfiguration(qpu, fields, couplings)
     return QPUAssignment(config, spins, 0, discription)
 
 
-def generate_fl(qpu, steps=2, alpha=0.2, multicell=False, cluster_cells=False, simple_ground_state=False, min_cycle_length=7, cycle_reject_limit=1000, cycle_sample_limit=10000):
+def generate_fl(qpu, steps=2, alpha=0.2, multicell=False, cluster_cells=False, simple_ground_state=False, min_cycle_length=7, cycle_reject_limit=1000, cycle_sample_limit=10000, workers=1, record_loops=False, executor=None, rng=random):
     '''This function builds a frustrated loop problems as described by,
     https://arxiv.org/abs/1502.02098 and https://arxiv.org/abs/1701.04579.
     Because random walks are used for finding cycles in the graph and 
     constraints are applied to these cycles, termination of this function for 
     all possible parameter settings is not guaranteed.  Various limits are 
     used to ensure the problem generator will terminate.
+
+    When workers is larger than one, candidate cycles are proposed by that
+    many processes, the result is reproducible for a given seed and number 
+    of workers (see _sample_cycles).  The processes are taken from executor
+    when it is given, otherwise a pool is started and closed by this call.
+
+    When record_loops is set, the loops and their frustrated couplers are 
+    recorded as a certificate.LoopCertificate of the planted solution.  Loops
+    over clustered cells are recorded as the loops of their strands.
     '''
     if cluster_cells:
-        sites = qpu.chimera_cells
-        couplers = set()
-        for i,j in qpu.couplers:
-            cell_i = i.chimera_cell
-            cell_j = j.chimera_cell
-            if cell_i != cell_j:
-                if cell_i < cell_j:
-                    couplers.add((cell_i, cell_j))
-                else:
-                    couplers.add((cell_j, cell_i))
+        cell_graph = qpu.cell_graph()
+        sites = cell_graph.cells
+        site_list = cell_graph.cells
+        coupler_list = cell_graph.cell_edges
     else:
         sites = qpu.sites
-        couplers = qpu.couplers
+        site_list = qpu.sorted_sites()
+        coupler_list = qpu.sorted_couplers()
 
     num_cycles = int(alpha*len(sites))
 
-    incident = {}
-    cycle_count = {}
-    for site in sites:
-        incident[site] = []
-    for coupler in sorted(couplers):
-        incident[coupler[0]].append(coupler)
-        incident[coupler[1]].append(coupler)
-        cycle_count[coupler] = 0
-
-    site_list = sorted(list(sites))
+    site_id = {site : k for k, site in enumerate(site_list)}
+    sampler = _CycleSampler(len(site_list), [site_id[i] for i,j in coupler_list], [site_id[j] for i,j in coupler_list])
 
-    reject_count = 0
-    cycles = []
-    while len(cycles) < num_cycles:
-        if reject_count >= cycle_reject_limit:
-            #print_err('Error: hit cycle rejection limit of {}.\ntry relaxing the cycle constraints'.format(cycle_reject_limit))
-            raise DWIGException('hit cycle rejection limit of {}.  try relaxing the cycle constraints'.format(cycle_reject_limit))
+    site_cells = None
+    if multicell and not cluster_cells:
+        site_cells = [site.chimera_cell for site in site_list]
+    cycle_filter = _CycleFilter(min_cycle_length, site_cells)
 
-        cycle = _build_cycle(site_list, incident, cycle_sample_limit)
-
-        if cycle == None:
-            #print_err('Error: unable to find a vaild random walk cycle in {} samples.\ntry increasing the number of steps or decreasing alpha'.format(cycle_sample_limit))
-            raise DWIGException('unable to find a vaild random walk cycle in {} samples.  try increasing the number of steps or decreasing alpha'.format(cycle_sample_limit))
-
-        # print_err('')
-        # for coupler in cycle:
-        #     print_err('{}, {}'.format(coupler[0].index, coupler[1].index))
-
-        if len(cycle) < min_cycle_length:
-            reject_count += 1
-            continue
-
-        if multicell and not cluster_cells:
-            chimera_cell = cycle[0][0].chimera_cell
-
-            second_cell = False
-            for coupler in cycle:
-                if coupler[0].chimera_cell != chimera_cell or coupler[1].chimera_cell != chimera_cell:
-                    second_cell = True
-                    break
-
-            if not second_cell:
-                reject_count += 1
-                continue
-
-        reject_count = 0
-
-        for coupler in cycle:
-            cycle_count[coupler] = cycle_count[coupler] + 1
-            if cycle_count[coupler] >= steps:
-                incident[coupler[0]].remove(coupler)
-                incident[coupler[1]].remove(coupler)
-                #if cycle_count[coupler] > steps:
-                #    print_err(cycle)
-
-        cycles.append(cycle)
+    cycle_ids = _sample_cycles(sampler, num_cycles, steps, cycle_filter, cycle_reject_limit, cycle_sample_limit, workers, rng=rng, executor=executor)
+    cycles = [[coupler_list[edge] for edge in cycle] for cycle in cycle_ids]
 
     #for k,v in cycle_count.items():
     #    if v > 0:
     #        print_err(k, v)
 
     couplings = {}
+    loops = []
     for cycle in cycles:
         for coupler in cycle:
             val = 0.0
@@ -219,8 +236,9 @@ def generate_fl(qpu, steps=2, alpha=0.2, multicell=False, cluster_cells=False, s
                 val = couplings[coupler]
             couplings[coupler] = val - 1.0
 
-        rand_coupler = random.choice(cycle)
+        rand_coupler = rng.choice(cycle)
         couplings[rand_coupler] = couplings[rand_coupler] + 2.0
+        loops.append(FrustratedLoop(cycle, rand_coupler))
 
     for coupler, value in couplings.items():
         if abs(value) > steps:
@@ -236,7 +254,7 @@ def generate_fl(qpu, steps=2, alpha=0.2, multicell=False, cluster_cells=False, s
 
     if not simple_ground_state:
         choices = [-1, 1]
-        spins = {site:random.choice(choices) for site in sorted(active_sites)}
+        spins = {site:rng.choice(choices) for site in site_list if site in active_sites}
 
         for coupler, value in couplings.items():
             site_i, site_j = coupler
@@ -262,25 +280,25 @@ def generate_fl(qpu, steps=2, alpha=0.2, multicell=False, cluster_cells=False, s
             active_cells.add(cell_j)
 
         site_couplings = {}
-        for site_coupler in qpu.couplers:
-            i,j = site_coupler
-            cell_i = i.chimera_cell
-            cell_j = j.chimera_cell
-            if cell_i in active_cells and cell_j in active_cells:
-                if cell_i == cell_j:
-                    site_couplings[site_coupler] = -max_val
-                else:
-                    if cell_i < cell_j:
-                        cell_coupler = (cell_i, cell_j)
-                    else:
-                        cell_coupler = (cell_j, cell_i)
-                    #print(site_coupler, cell_coupler)
-                    if cell_coupler in couplings:
-                        site_couplings[site_coupler] = couplings[cell_coupler]
+        for cell in active_cells:
+            for site_coupler in cell_graph.intra_couplers[cell]:
+                site_couplings[site_coupler] = -max_val
+        for cell_coupler, value in couplings.items():
+            for site_coupler in cell_graph.cell_couplers[cell_coupler]:
+                site_couplings[site_coupler] = value
 
         spins = site_spins
         couplings = site_couplings
 
+        if record_loops:
+            turn_load = {}
+            strand_loops = []
+            for loop in loops:
+                strands = cell_loop_strands(cell_graph, loop.couplers, loop.frustrated, qpu.cell_size, turn_load)
+                if strands != None:
+                    strand_loops.extend(strands)
+            loops = strand_loops
+
     # it is possible that couplings cancel eliminating some sites from the active set
     active_sites = set()
     for coupler, value in couplings.items():
@@ -290,70 +308,305 @@ def generate_fl(qpu, steps=2, alpha=0.2, multicell=False, cluster_cells=False, s
             active_sites.add(site_j)
     spins = {site:spin for site,spin in spins.items() if site in active_sites}
 
-    config = QPUConfiguration(qpu, {}, couplings)
-    return QPUAssignment(config, spins, 0, 'planted ground state, most likely non-unique')
-
+    certificate = None
+    if record_loops:
+        certificate = LoopCertificate(loops, [])
 
-def _build_cycle(site_list, incident, fail_limit):
-    simple_cycle = None
-
-    for tries in range(fail_limit):
-        cycle = []
-        touched_sites = set([])
-        touched_edges = set([])
-        current_site = random.choice(site_list)
+    config = QPUConfiguration(qpu, {}, couplings)
+    return QPUAssignment(config, spins, 0, 'planted ground state, most likely non-unique', certificate)
 
-        cycle_found = False
-        while not cycle_found:
-            touched_sites.add(current_site)
 
-            if sum([edge not in touched_edges for edge in incident[current_site]]) <= 1:
-                break
+class _CycleSampler(object):
+    '''Samples cycles by random walks over a graph given by integer site and
+    edge ids.  Each site keeps its available edges in edge id order and walks
+    use epoch stamps for their visited sites and touched edges, so starting a
+    new walk costs O(1) and each step costs O(degree).
+    '''
+    def __init__(self, num_sites, edge_i, edge_j):
+        self.sites = range(num_sites)
+        self.edge_i = list(edge_i)
+        self.edge_j = list(edge_j)
+
+        self.incident = [[] for site in self.sites]
+        for edge, (i,j) in enumerate(zip(self.edge_i, self.edge_j)):
+            self.incident[i].append(edge)
+            self.incident[j].append(edge)
+
+        self.epoch = 0
+        self.site_stamp = [0]*num_sites
+        self.edge_stamp = [0]*len(self.edge_i)
+        # the number of touched incident edges, valid when touched_stamp is the epoch
+        self.touched = [0]*num_sites
+        self.touched_stamp = [0]*num_sites
+
+    def remove_edge(self, edge):
+        '''Removes a saturated edge from all later walks.  The incident lists 
+        keep their order, so that walks are reproducible for a given seed.
+        '''
+        self.incident[self.edge_i[edge]].remove(edge)
+        self.incident[self.edge_j[edge]].remove(edge)
+
+    def _touch(self, site):
+        if self.touched_stamp[site] != self.epoch:
+            self.touched_stamp[site] = self.epoch
+            self.touched[site] = 0
+        self.touched[site] += 1
+
+    def _untouched(self, site):
+        if self.touched_stamp[site] != self.epoch:
+            return len(self.incident[site])
+        return len(self.incident[site]) - self.touched[site]
+
+    def _walk(self, rng):
+        self.epoch += 1
+        epoch = self.epoch
+        site_stamp = self.site_stamp
+        edge_stamp = self.edge_stamp
+
+        walk = []
+        current_site = rng.choice(self.sites)
+        while True:
+            site_stamp[current_site] = epoch
+
+            if self._untouched(current_site) <= 1:
+                return None
 
+            incident = self.incident[current_site]
             while True:
-                edge = random.choice(incident[current_site])
-                if edge not in touched_edges:
-                    touched_edges.add(edge)
+                edge = rng.choice(incident)
+                if edge_stamp[edge] != epoch:
+                    edge_stamp[edge] = epoch
                     break
 
-            cycle.append(edge)
-
-            if edge[0] == current_site:
-                next_site = edge[1]
-            else:
-                assert(edge[1] == current_site)
-                next_site = edge[0]
+            self._touch(self.edge_i[edge])
+            self._touch(self.edge_j[edge])
+            walk.append(edge)
 
-            if next_site in touched_sites:
-                cycle_found = True
+            if self.edge_i[edge] == current_site:
+                next_site = self.edge_j[edge]
             else:
-                current_site = next_site
-
-        if cycle_found:
-            # print_err('')
-            # for edge in cycle:
-            #     print_err(edge[0].index, edge[1].index)
+                assert(self.edge_j[edge] == current_site)
+                next_site = self.edge_i[edge]
+
+            if site_stamp[next_site] == epoch:
+                return walk
+            current_site = next_site
+
+    def sample(self, rng, fail_limit):
+        '''Returns the edge ids of a simple cycle, or None if no random walk
+        closed a cycle in fail_limit tries.
+        '''
+        for tries in range(fail_limit):
+            walk = self._walk(rng)
+            if walk is None:
+                continue
 
             # Trim off tail edges
+            self.epoch += 1
+            epoch = self.epoch
+            site_stamp = self.site_stamp
+
             simple_cycle = []
-            touched_sites = set([])
-            for edge in reversed(cycle):
+            for edge in reversed(walk):
                 simple_cycle.append(edge)
-                if edge[0] in touched_sites and edge[1] in touched_sites:
+                i, j = self.edge_i[edge], self.edge_j[edge]
+                if site_stamp[i] == epoch and site_stamp[j] == epoch:
                     break
                 else:
-                    touched_sites.add(edge[0])
-                    touched_sites.add(edge[1])
+                    site_stamp[i] = epoch
+                    site_stamp[j] = epoch
+
+            return simple_cycle
+
+        return None
+
+
+class _CellCycleSampler(_CycleSampler):
+    '''Samples cycles by random walks that choose uniformly among the untouched
+    edges of the current site, in edge id order, and close the cycle at the 
+    first revisited site.  This is the walk used by the fclg generator.
+
+    The incident lists are kept in edge id order, so filtering out the edges 
+    touched in the current epoch gives the sorted available edges without any
+    set operations, and the position of each visited site in the walk is 
+    stamped so that closing the cycle is O(1).
+    '''
+    def __init__(self, num_sites, edge_i, edge_j):
+        _CycleSampler.__init__(self, num_sites, edge_i, edge_j)
+        self.site_position = [0]*num_sites
+
+    def _walk(self, rng):
+        self.epoch += 1
+        epoch = self.epoch
+        site_stamp = self.site_stamp
+        edge_stamp = self.edge_stamp
+        site_position = self.site_position
+
+        walk = []
+        current_site = rng.choice(self.sites)
+        while site_stamp[current_site] != epoch:
+            site_stamp[current_site] = epoch
+            site_position[current_site] = len(walk)
+
+            remaining_edges = [edge for edge in self.incident[current_site] if edge_stamp[edge] != epoch]
+            if len(remaining_edges) == 0:
+                return None
+
+            edge = rng.choice(remaining_edges)
+            edge_stamp[edge] = epoch
+            walk.append(edge)
+
+            if self.edge_i[edge] == current_site:
+                current_site = self.edge_j[edge]
+            else:
+                current_site = self.edge_i[edge]
+
+        return walk[site_position[current_site]:]
+
+    def sample(self, rng, fail_limit):
+        for tries in range(fail_limit):
+            cycle = self._walk(rng)
+            if cycle is not None:
+                return cycle
+        return None
+
+
+class _CycleFilter(object):
+    '''Rejects cycles that are shorter than min_cycle_length and, when the 
+    chimera cell of each site is given, cycles within a single chimera cell.
+    '''
+    def __init__(self, min_cycle_length, site_cells=None):
+        self.min_cycle_length = min_cycle_length
+        self.site_cells = site_cells
+
+    def __call__(self, sampler, cycle):
+        if len(cycle) < self.min_cycle_length:
+            return False
+
+        if self.site_cells is not None:
+            site_cells = self.site_cells
+            chimera_cell = site_cells[sampler.edge_i[cycle[0]]]
+            for edge in cycle:
+                if site_cells[sampler.edge_i[edge]] != chimera_cell or site_cells[sampler.edge_j[edge]] != chimera_cell:
+                    return True
+            return False
+
+        return True
+
+
+def _sample_cycles(sampler, num_cycles, steps, cycle_filter, cycle_reject_limit, cycle_sample_limit, workers=1, on_cycle=None, rng=random, executor=None):
+    '''Samples num_cycles cycles that pass cycle_filter, such that no edge is
+    used by more than steps cycles.  Saturated edges are removed from the 
+    sampler and on_cycle is called with each accepted cycle, in order.
+
+    When workers is larger than one, the cycles are proposed in rounds by a
+    pool of processes, each walking a snapshot of the sampler with its own
+    seed drawn from the random module.  The proposals are then merged in worker
+    order and a proposal is accepted only if all of its edges still have 
+    capacity, so that the result only depends on the seed and the number of
+    workers.  The first worker that stops early while cycles are still needed
+    raises its error.  The pool is the given executor, which is left open for
+    the caller, or a pool that is closed on return.
+    '''
+    cycle_count = [0]*len(sampler.edge_i)
+    cycles = []
+
+    def accept(cycle):
+        for edge in cycle:
+            cycle_count[edge] = cycle_count[edge] + 1
+            if cycle_count[edge] >= steps:
+                sampler.remove_edge(edge)
+        cycles.append(cycle)
+        if on_cycle is not None:
+            on_cycle(cycle)
+
+    if workers <= 1:
+        reject_count = 0
+        while len(cycles) < num_cycles:
+            if reject_count >= cycle_reject_limit:
+                raise DWIGException(_reject_limit_message.format(cycle_reject_limit))
+
+            cycle = sampler.sample(rng, cycle_sample_limit)
+
+            if cycle == None:
+                raise DWIGException(_sample_limit_message.format(cycle_sample_limit))
+
+            if not cycle_filter(sampler, cycle):
+                reject_count += 1
+                continue
+
+            reject_count = 0
+            accept(cycle)
+
+        return cycles
+
+    def propose_rounds(executor):
+        while len(cycles) < num_cycles:
+            remaining = num_cycles - len(cycles)
+            proposal_size = (remaining + workers - 1)//workers
+            seeds = [rng.getrandbits(32) for worker in range(workers)]
+
+            # the executor pickles arguments lazily, so the snapshot is taken here
+            snapshot = pickle.dumps((sampler, cycle_count, cycle_filter))
+            futures = [executor.submit(_propose_cycles, snapshot, seed, proposal_size, steps, cycle_reject_limit, cycle_sample_limit) for seed in seeds]
+
+            for k, future in enumerate(futures):
+                proposals, error = future.result()
+                for cycle in proposals:
+                    if len(cycles) < num_cycles and all(cycle_count[edge] < steps for edge in cycle):
+                        accept(cycle)
+                if error is not None and len(cycles) < num_cycles:
+                    for other in futures[k+1:]:
+                        other.cancel()
+                    raise DWIGException(error)
+
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            propose_rounds(executor)
+    else:
+        propose_rounds(executor)
 
-            # print_err('')
-            # for edge in simple_cycle:
-            #     print_err(edge[0].index, edge[1].index)
-            break
+    return cycles
 
-    return simple_cycle
 
+_reject_limit_message = 'hit cycle rejection limit of {}.  try relaxing the cycle constraints'
+_sample_limit_message = 'unable to find a vaild random walk cycle in {} samples.  try increasing the number of steps or decreasing alpha'
 
-def generate_wscn(qpu, weak_field, strong_field):
+
+def _propose_cycles(snapshot, seed, proposal_size, steps, cycle_reject_limit, cycle_sample_limit):
+    '''Runs in a worker process, proposes up to proposal_size cycles from a
+    pickled snapshot of the sampler and returns them with the error that 
+    stopped the proposal early, if any.
+    '''
+    sampler, cycle_count, cycle_filter = pickle.loads(snapshot)
+    rng = random.Random(seed)
+
+    cycles = []
+    reject_count = 0
+    while len(cycles) < proposal_size:
+        if reject_count >= cycle_reject_limit:
+            return cycles, _reject_limit_message.format(cycle_reject_limit)
+
+        cycle = sampler.sample(rng, cycle_sample_limit)
+
+        if cycle == None:
+            return cycles, _sample_limit_message.format(cycle_sample_limit)
+
+        if not cycle_filter(sampler, cycle):
+            reject_count += 1
+            continue
+
+        reject_count = 0
+        for edge in cycle:
+            cycle_count[edge] = cycle_count[edge] + 1
+            if cycle_count[edge] >= steps:
+                sampler.remove_edge(edge)
+        cycles.append(cycle)
+
+    return cycles, None
+
+
+def generate_wscn(qpu, weak_field, strong_field, rng=random):
     '''This function builds a weak-strong cluster network as described by,
     https://arxiv.org/abs/1512.02206.  The function assumes that the chimera
     degree of the QPU is a square multiple of 3 that is greater than 5.  As 
@@ -365,55 +618,126 @@ def generate_wscn(qpu, weak_field, strong_field):
     clusters which cannot be captured by the repeated sub-structure.  With all 
     of the weak-strong clusters in place, it finished by linking the strong 
     clusters together.
+
+    The placement of the clusters only depends on the chimera degree, so it is
+    computed once (see _wscn_layout) and the field and coupling values are then
+    stamped onto the QPU through its cell indexes.
     '''
     assert(qpu.chimera_degree_view >= 6)
     assert(qpu.chimera_degree_view % 3 == 0)
 
-    c_row_offset = 1
-    c_col_offset = 1
+    layout = _wscn_layout(qpu.chimera_degree_view, qpu.chimera_degree)
+    cell_graph = qpu.cell_graph()
 
     fields = {} 
     couplings = {}
 
-    strong_cultsers = []
+    for cell, strong in layout.cell_strong.items():
+        value = strong_field if strong else weak_field
+        for site in qpu.chimera_cell_sites[cell]:
+            fields[site] = value
+        for coupler in cell_graph.intra_couplers[cell]:
+            couplings[coupler] = -1
+
+    for cell_i, cell_j in layout.cluster_pairs:
+        for coupler in cell_graph.couplers_between(cell_i, cell_j):
+            couplings[coupler] = -1
+
+    # every pair of strong clusters draws a link value, in sorted pair order
+    num_strong = len(layout.strong_cells)
+    with _MirroredRandom(rng) as rnd:
+        links = rnd.choice([-1, 1], num_strong*(num_strong-1)//2).tolist()
+
+    strong_position = layout.strong_position
+    for cell_i, cell_j in cell_graph.cell_edges:
+        if cell_i in strong_position and cell_j in strong_position:
+            k = strong_position[cell_i]
+            l = strong_position[cell_j]
+            coupling = links[k*(2*num_strong-k-1)//2 + l-k-1]
+            for coupler in cell_graph.cell_couplers[(cell_i, cell_j)]:
+                assert(coupler not in couplings)
+                couplings[coupler] = coupling
 
-    steps = qpu.chimera_degree_view//3 - 1
+    return QPUConfiguration(qpu, fields, couplings)
 
-    wscbs = []
 
-    for step_row in range(steps):
-        for step_column in range(steps):
-            wscbs.append((1 + 3*(step_row), 1+3*(step_column)))
+WeakStrongCluster = namedtuple('WeakStrongCluster', ['weak', 'strong'])
+
+WeakStrongLayout = namedtuple('WeakStrongLayout', ['cell_strong', 'cluster_pairs', 'strong_cells', 'strong_position'])
 
-    for c_row_offset, c_col_offset in wscbs:
-        wscb_fields, wscb_couplings, wscb_strong_cultsers = _build_wscb(qpu, weak_field, strong_field, c_row_offset, c_col_offset)
-        strong_cultsers.extend(wscb_strong_cultsers)
-        _update_fc(fields, couplings, wscb_fields, wscb_couplings, strict = False)
+# weak-strong cluster network layouts, keyed by chimera degree view and chimera degree
+_wscn_layouts = {}
 
-    wscbc_fields, wscbc_couplings, wscbc_strong_cultsers = _build_wscbc(qpu, weak_field, strong_field, qpu.chimera_degree_view)
+def _wscn_layout(chimera_degree_view, chimera_degree):
+    '''Returns the cell level layout of a weak-strong cluster network.  
+    cell_strong maps each cluster cell to True when it is a strong cluster, 
+    cluster_pairs lists the (weak, strong) cell pairs and strong_cells is the 
+    sorted list of strong cells, with strong_position giving their positions.
+    '''
+    key = (chimera_degree_view, chimera_degree)
+    if key in _wscn_layouts:
+        return _wscn_layouts[key]
+
+    def chimera_cell(chimera_coordinate):
+        assert(chimera_coordinate.row > 0 and chimera_coordinate.row <= chimera_degree_view)
+        assert(chimera_coordinate.col > 0 and chimera_coordinate.col <= chimera_degree_view)
+        return (chimera_coordinate.row-1)*chimera_degree + (chimera_coordinate.col-1)
+
+    cluster_pairs = []
+    strong_cultsers = []
+
+    def add_wsc(cells, wsc):
+        weak_cell = chimera_cell(wsc.weak)
+        strong_cell = chimera_cell(wsc.strong)
+        assert(weak_cell not in cells)
+        cells[weak_cell] = False
+        assert(strong_cell not in cells)
+        cells[strong_cell] = True
+        cluster_pairs.append((weak_cell, strong_cell))
+
+    # blocks may overlap, later blocks replace the fields of earlier ones
+    cell_strong = {}
+    steps = chimera_degree_view//3 - 1
+    for step_row in range(steps):
+        for step_column in range(steps):
+            block_cells = {}
+            for wsc in _build_wscb(1 + 3*(step_row), 1+3*(step_column)):
+                add_wsc(block_cells, wsc)
+                strong_cultsers.append(wsc.strong)
+            cell_strong.update(block_cells)
+
+    ws_cluters, s_clusters, wscbc_strong_cultsers = _build_wscbc(chimera_degree_view)
+    wscbc_cells = {}
+    for wsc in ws_cluters:
+        add_wsc(wscbc_cells, wsc)
+    for sc in s_clusters:
+        assert(chimera_cell(sc) not in wscbc_cells)
+        wscbc_cells[chimera_cell(sc)] = True
     strong_cultsers.extend(wscbc_strong_cultsers)
-    _update_fc(fields, couplings, wscbc_fields, wscbc_couplings)
 
-    scl_fields, scl_couplings = _build_scl(qpu, strong_cultsers)
-    _update_fc(fields, couplings, scl_fields, scl_couplings)
+    for cell, strong in wscbc_cells.items():
+        assert(cell not in cell_strong)
+        cell_strong[cell] = strong
 
-    return QPUConfiguration(qpu, fields, couplings)
+    strong_cells = sorted(set(chimera_cell(sc) for sc in strong_cultsers))
+    strong_position = {cell : k for k, cell in enumerate(strong_cells)}
 
+    layout = WeakStrongLayout(cell_strong, cluster_pairs, strong_cells, strong_position)
+    _wscn_layouts[key] = layout
+    return layout
 
-WeakStrongCluster = namedtuple('WeakStrongCluster', ['weak', 'strong'])
 
-def _build_wscbc(qpu, weak_field, strong_field, chimera_degree_view):
+def _build_wscbc(chimera_degree_view):
     '''This function adds the parts of the of weak-strong cluster network which
     are not covered by the weak-strong cluster blocks. This function must 
     consider the complete weak-strong cluster network because the semantics 
     vary based on the overlap of the weak-strong cluster blocks.  There are 
     three primary cases: (1) corners of the cluster network; (2) along the 
     boarder of the cluster network; and (3) on the interior of cluster network.
+    Returns the weak-strong clusters, the stand alone strong clusters and all 
+    of the strong clusters of this part.
     '''
-    fields = {} 
-    couplings = {}
-
-    steps = qpu.chimera_degree_view//3
+    steps = chimera_degree_view//3
 
     strong_cultsers = []
     for step_row in range(steps):
@@ -436,22 +760,22 @@ def _build_wscbc(qpu, weak_field, strong_field, chimera_degree_view):
         if sc.row == min_row_col and sc.col == min_row_col:
             wc_1 = ChimeraCoordinate(sc.row-1, sc.col)
             wc_2 = ChimeraCoordinate(sc.row, sc.col-1)
-            wc = _select_weak_cluster(qpu, sc, wc_1, wc_2)
+            wc = _select_weak_cluster(sc, wc_1, wc_2)
             ws_cluters.append(WeakStrongCluster(wc, sc))
         elif sc.row == min_row_col and sc.col == max_row_col:
             wc_1 = ChimeraCoordinate(sc.row-1, sc.col)
             wc_2 = ChimeraCoordinate(sc.row, sc.col+1)
-            wc = _select_weak_cluster(qpu, sc, wc_1, wc_2)
+            wc = _select_weak_cluster(sc, wc_1, wc_2)
             ws_cluters.append(WeakStrongCluster(wc, sc))
         elif sc.row == max_row_col and sc.col == min_row_col:
             wc_1 = ChimeraCoordinate(sc.row+1, sc.col)
             wc_2 = ChimeraCoordinate(sc.row, sc.col-1)
-            wc = _select_weak_cluster(qpu, sc, wc_1, wc_2)
+            wc = _select_weak_cluster(sc, wc_1, wc_2)
             ws_cluters.append(WeakStrongCluster(wc, sc))
         elif sc.row == max_row_col and sc.col == max_row_col:
             wc_1 = ChimeraCoordinate(sc.row+1, sc.col)
             wc_2 = ChimeraCoordinate(sc.row, sc.col-1)
-            wc = _select_weak_cluster(qpu, sc, wc_1, wc_2)
+            wc = _select_weak_cluster(sc, wc_1, wc_2)
             ws_cluters.append(WeakStrongCluster(wc, sc))
         # Row Cases
         elif sc.row == min_row_col and (sc.col != min_row_col or sc.col != max_row_col):
@@ -474,18 +798,10 @@ def _build_wscbc(qpu, weak_field, strong_field, chimera_degree_view):
         else:
             assert(False) # Case missing from SWC generator
 
-    for wsc in ws_cluters:
-        wsc_fields, wsc_couplings = _build_wsc(qpu, weak_field, strong_field, wsc)
-        _update_fc(fields, couplings, wsc_fields, wsc_couplings)
-
-    for sc in s_clusters:
-        sc_fields, sc_couplings = _build_sc(qpu, strong_field, sc)
-        _update_fc(fields, couplings, sc_fields, sc_couplings)
-
-    return fields, couplings, strong_cultsers
+    return ws_cluters, s_clusters, strong_cultsers
 
 
-def _select_weak_cluster(qpu, strong_cluster, weak_cluster_1, weak_cluster_2):
+def _select_weak_cluster(strong_cluster, weak_cluster_1, weak_cluster_2):
     '''There are multiple weak cluster options for the corners of a 
     weak-strong cluster network.  This function is used to select between them.
     '''
@@ -493,13 +809,10 @@ def _select_weak_cluster(qpu, strong_cluster, weak_cluster_1, weak_cluster_2):
     return weak_cluster_1
 
 
-def _build_wscb(qpu, weak_field, strong_field, c_row_offset, c_col_offset):
+def _build_wscb(c_row_offset, c_col_offset):
     '''Given chimera coordinate offsets, builds the repeatable part of and a 
     4x4 weak-string cluster block.  Block corners are left to another method.
     '''
-    fields = {} 
-    couplings = {}
-
     cro = c_row_offset
     cco = c_col_offset
     wscs = [
@@ -516,117 +829,20 @@ def _build_wscb(qpu, weak_field, strong_field, c_row_offset, c_col_offset):
         WeakStrongCluster(ChimeraCoordinate(cro+5, cco+3), ChimeraCoordinate(cro+4, cco+3)),
     ]
 
-    strong_cultsers = []
-    for wsc in wscs:
-        strong_cultsers.append(wsc.strong)
-        wsc_fields, wsc_couplings = _build_wsc(qpu, weak_field, strong_field, wsc)
-        _update_fc(fields, couplings, wsc_fields, wsc_couplings)
-        #fields.update(wsc_fields)
-        #couplings.update(wsc_couplings)
-
-    return fields, couplings, strong_cultsers
-
-
-def _build_scl(qpu, strong_cultsers):
-    '''Given a collection of ChimeraCordinates representing strong clusters, 
-    this links these these cells together using random coupler settings
-    '''
-    fields = {} 
-    couplings = {}
-
-    strong_cells = [qpu.chimera_cell(sc) for sc in set(strong_cultsers)]
-    strong_cells.sort()
-
-    choices = [-1, 1]
-
-    for i, sc_1 in enumerate(strong_cells):
-        for sc_2 in [strong_cells[j] for j in range(i+1, len(strong_cells))]:
-            coupling = random.choice(choices)
-            #print(sc_1, sc_2, coupling)
-            sites_1 = qpu.chimera_cell_sites[sc_1]
-            sites_2 = qpu.chimera_cell_sites[sc_2]
-
-            for (i,j) in qpu.couplers:
-                if (i in sites_1 and j in sites_2) or (j in sites_1 and j in sites_2):
-                    assert((i,j) not in couplings)
-                    couplings[(i,j)] = coupling
-
-    return fields, couplings
-
-
-def _build_wsc(qpu, weak_field, strong_field, weak_strong_cluster):
-    '''Given a WeakStrongCluster, configures the field and couplers of 
-    both the weak and strong Chimera cells
-    '''
-    fields = {} 
-    couplings = {}
-
-    weak_chimera_cell = qpu.chimera_cell(weak_strong_cluster.weak)
-    strong_chimera_cell = qpu.chimera_cell(weak_strong_cluster.strong)
-
-    weak_sites = qpu.chimera_cell_sites[weak_chimera_cell]
-    strong_sites = qpu.chimera_cell_sites[strong_chimera_cell]
-
-    for site in weak_sites:
-        fields[site] = weak_field
-    for site in strong_sites:
-        fields[site] = strong_field
-
-    for (i,j) in qpu.couplers:
-        if (i in weak_sites or i in strong_sites) and (j in weak_sites or j in strong_sites):
-            couplings[(i,j)] = -1
-
-    return fields, couplings
-
-
-def _build_sc(qpu, strong_field, strong_cluster):
-    '''Given a ChimeraCordinate, configures the field and couplers of a 
-    stand alone strong cluster Chimera cell
-    '''
-    fields = {} 
-    couplings = {}
-
-    chimera_cell = qpu.chimera_cell(strong_cluster)
-
-    sites = qpu.chimera_cell_sites[chimera_cell]
+    return wscs
 
-    for site in sites:
-        fields[site] = strong_field
 
-    for (i,j) in qpu.couplers:
-        if (i in sites) and (j in sites):
-            couplings[(i,j)] = -1
-
-    return fields, couplings
-
-
-def _update_fc(fields, couplings, new_fields, new_couplings, strict = True):
-    '''Updates the given fields and couplings with given new data.
-    By default the function checks that merging will not cause any data loss,
-    this can be turned off by setting strict to False. 
-    '''
-    for k,v in new_fields.items():
-        if strict:
-            assert(k not in fields)
-        fields[k] = v
-
-    for k,v in new_couplings.items():
-        if strict:
-            assert(k not in couplings)
-        couplings[k] = v
-
-
-def generate_fclg(qpu, steps=3, alpha=0.2, gadget_fraction=0.1, simple_ground_state=False, min_cycle_length=3, cycle_reject_limit=5000, cycle_sample_limit=10000):
+def generate_fclg(qpu, steps=3, alpha=0.2, gadget_fraction=0.1, simple_ground_state=False, min_cycle_length=3, cycle_reject_limit=5000, cycle_sample_limit=10000, workers=1, record_loops=False, executor=None, rng=random):
     '''This function builds frustrated clustered loops and gadgets as described
     by https://journals.aps.org/prx/abstract/10.1103/PhysRevX.8.031016.
-    '''
-    assert qpu.cell_size == 8
 
-    def ordered(i, j):
-        return (i, j) if i <= j else (j, i)
+    The workers and executor are used as in generate_fl.
 
-    def the_other(pair, i):
-        return pair[0] if pair[0] != i else pair[1]
+    When record_loops is set, the strand loops of the clustered loops and the
+    gadgets are recorded as a certificate.LoopCertificate of the planted 
+    solution.
+    '''
+    assert qpu.cell_size == 8
 
     def add_values(values, new_values):
         for k, v in new_values.items():
@@ -649,7 +865,7 @@ def generate_fclg(qpu, steps=3, alpha=0.2, gadget_fraction=0.1, simple_ground_st
 
     def randomize_ground_state(fields, couplings):
         active_sites = set(chain.from_iterable(couplings))
-        ground_state = {site: random.choice([-1, 1]) for site in sorted(active_sites)}
+        ground_state = {site: rng.choice([-1, 1]) for site in sorted(active_sites)}
         for site, spin in ground_state.items():
             if spin == -1 and site in fields:
                 fields[site] *= -1
@@ -663,61 +879,26 @@ def generate_fclg(qpu, steps=3, alpha=0.2, gadget_fraction=0.1, simple_ground_st
     sites_of_cell = find_complete_cells(qpu)
     cells = sites_of_cell.keys()
     cells_list = sorted(cells)
-    cell_couplers = {
-        ordered(i.chimera_cell, j.chimera_cell) for i, j in qpu.couplers
-        if i.chimera_cell != j.chimera_cell and i.chimera_cell in cells and j.chimera_cell in cells
-    }
-
-    # build adjacent list
-    incident = {}
-    cycle_count = {}
-    for i, j in cell_couplers:
-        incident.setdefault(i, []).append((i, j))
-        incident.setdefault(j, []).append((i, j))
-        cycle_count[i, j] = 0
+    cell_graph = qpu.cell_graph()
+    cell_coupler_list = [(i, j) for i, j in cell_graph.cell_edges if i in cells and j in cells]
 
-    # generate cycles
-    def generate_cycle_once():
-        path = [random.choice(cells_list)]
-        touched_cells = set()
-        touched_edges = set()
-        while path[-1] not in touched_cells:
-            touched_cells.add(path[-1])
-            remaining_edges = sorted(set(incident[path[-1]]) - touched_edges)
-            if len(remaining_edges) == 0:
-                return None
-            edge = random.choice(remaining_edges)
-            cell = the_other(edge, path[-1])
-            touched_edges.add(edge)
-            path.append(cell)
-        path = path[path.index(path[-1]):]
-        return [ordered(i, j) for i, j in zip(path, path[1:])]
-
-    def generate_cycle():
-        for i in range(cycle_sample_limit):
-            cycle = generate_cycle_once()
-            if cycle is not None:
-                return cycle
-        raise DWIGException('unable to find a vaild random walk cycle in {} samples.  try increasing the number of steps or decreasing alpha'.format(cycle_sample_limit))
-
-    def generate_good_cycle():
-        for i in range(cycle_reject_limit):
-            cycle = generate_cycle()
-            if len(cycle) >= min_cycle_length:
-                for edge in cycle:
-                    cycle_count[edge] += 1
-                    if cycle_count[edge] >= steps:
-                        incident[edge[0]].remove(edge)
-                        incident[edge[1]].remove(edge)
-                return cycle
-        raise DWIGException('hit cycle rejection limit of {}.  try relaxing the cycle constraints'.format(cycle_reject_limit))
+    # build a random walk sampler over the logical graph
+    cell_id = {cell : k for k, cell in enumerate(cells_list)}
+    sampler = _CellCycleSampler(len(cells_list), [cell_id[i] for i, j in cell_coupler_list], [cell_id[j] for i, j in cell_coupler_list])
 
+    # generate cycles
     cell_couplings = {}
-    num_cycles = math.floor(alpha * len(cells))
-    for _ in range(num_cycles):
-        cycle = generate_good_cycle()
+    cell_loops = []
+
+    def add_cycle(cycle_ids):
+        cycle = [cell_coupler_list[edge] for edge in cycle_ids]
         add_values(cell_couplings, {edge: -1 for edge in cycle})
-        cell_couplings[random.choice(cycle)] += 2
+        frustrated = rng.choice(cycle)
+        cell_couplings[frustrated] += 2
+        cell_loops.append((cycle, frustrated))
+
+    num_cycles = math.floor(alpha * len(cells))
+    _sample_cycles(sampler, num_cycles, steps, _CycleFilter(min_cycle_length), cycle_reject_limit, cycle_sample_limit, workers, add_cycle, rng, executor)
 
     # build hardware fields and couplings
     fields = {}    
@@ -727,30 +908,31 @@ def generate_fclg(qpu, steps=3, alpha=0.2, gadget_fraction=0.1, simple_ground_st
     active_cells = set(chain.from_iterable(cell_couplings))
 
     intracell_coupling = -max(abs(v) for k, v in cell_couplings.items())
-    for i, j in qpu.couplers:
-        if i.chimera_cell not in active_cells or j.chimera_cell not in active_cells:
-            continue
-        if i.chimera_cell == j.chimera_cell:
+    for cell in active_cells:
+        for i, j in cell_graph.intra_couplers[cell]:
             couplings[i, j] = intracell_coupling
-        else:
-            cell_coupler = ordered(i.chimera_cell, j.chimera_cell)
-            if cell_coupler in cell_couplings:
-                couplings[i, j] = cell_couplings[cell_coupler]
+    for cell_coupler, value in cell_couplings.items():
+        for i, j in cell_graph.cell_couplers[cell_coupler]:
+            couplings[i, j] = value
 
     # add gadgets
     gadgets_num = math.floor(gadget_fraction * len(active_cells))
-    for cell in random.sample(sorted(active_cells), k=gadgets_num):
+    gadgets = []
+    for cell in rng.sample(sorted(active_cells), k=gadgets_num):
         sites = sites_of_cell[cell]
-        add_values(fields, scale({
+        gadget_fields = scale({
             sites[0]: -1,   sites[1]: -2/3, sites[2]: 2/3,  sites[3]: -1,
             sites[4]: 1/3,  sites[5]: 1,    sites[6]: -1,   sites[7]: 1,
-        }, steps))
-        add_values(couplings, scale({
+        }, steps)
+        gadget_couplings = scale({
             (sites[0], sites[4]): +1, (sites[0], sites[5]): -1, (sites[0], sites[6]): -1, (sites[0], sites[7]): -1,
             (sites[1], sites[4]): -1, (sites[1], sites[5]): -1, (sites[1], sites[6]): +1, (sites[1], sites[7]): -1, 
             (sites[2], sites[4]): -1, (sites[2], sites[5]): -1, (sites[2], sites[6]): -1, (sites[2], sites[7]): -1,
             (sites[3], sites[4]): -1, (sites[3], sites[5]): -1, (sites[3], sites[6]): -1, (sites[3], sites[7]): -1,
-        }, steps))
+        }, steps)
+        add_values(fields, gadget_fields)
+        add_values(couplings, gadget_couplings)
+        gadgets.append(Gadget(gadget_fields, gadget_couplings))
 
     couplings = {coupler: value for coupler, value in couplings.items() if value != 0}
     if not simple_ground_state:
@@ -758,6 +940,16 @@ def generate_fclg(qpu, steps=3, alpha=0.2, gadget_fraction=0.1, simple_ground_st
     else:
         ground_state = {site: 1 for site in set(chain.from_iterable(couplings))}
 
+    certificate = None
+    if record_loops:
+        turn_load = {}
+        loops = []
+        for cycle, frustrated in cell_loops:
+            strands = cell_loop_strands(cell_graph, cycle, frustrated, qpu.cell_size, turn_load)
+            if strands != None:
+                loops.extend(strands)
+        certificate = LoopCertificate(loops, gadgets)
+
     config = QPUConfiguration(qpu, fields, couplings)
-    return QPUAssignment(config, ground_state, description='planted ground state, most likely non-unique')
+    return QPUAssignment(config, ground_state, description='planted ground state, most likely non-unique', certificate=certificate)
 
@@ -0,0 +1,68 @@
+import os, json, time
+
+# caches the topology and properties of remote solvers across processes
+
+default_cache_file = os.path.join(os.path.expanduser('~'), '.dwig', 'qpu_cache.json')
+default_cache_ttl = 24*60*60
+
+
+def cache_key(profile, solver_name=None):
+    if profile is None:
+        profile = 'default'
+    if solver_name is None:
+        solver_name = 'default'
+    return '{}/{}'.format(profile, solver_name)
+
+
+def _read_cache(cache_file):
+    # a missing or damaged cache file is treated as an empty cache
+    try:
+        with open(cache_file) as file:
+            cache = json.load(file)
+    except (IOError, OSError, ValueError):
+        return {}
+    if not isinstance(cache, dict):
+        return {}
+    return cache
+
+
+def load_qpu_details(cache_file, key, ttl=None):
+    '''Returns the cached details for the given key, or None if there is no
+    entry.  When a ttl (in seconds) is given, entries older than the ttl are
+    treated as missing, as are entries without a timestamp.
+    '''
+    entry = _read_cache(cache_file).get(key)
+    if not isinstance(entry, dict) or not isinstance(entry.get('timestamp'), (int, float)):
+        return None
+
+    if ttl is not None and time.time() - entry['timestamp'] > ttl:
+        return None
+
+    return entry
+
+
+def store_qpu_details(cache_file, key, details):
+    '''Stores the given solver details under key, replacing any previous
+    entry, so a change in the solver's topology is picked up when the entry
+    expires or is refreshed.  The cache file is replaced atomically so that
+    concurrent processes never read a partial file.
+    '''
+    cache = _read_cache(cache_file)
+
+    entry = dict(details)
+    entry['timestamp'] = time.time()
+    cache[key] = entry
+    _write_cache(cache_file, cache)
+
+    return entry
+
+
+def _write_cache(cache_file, cache):
+    cache_dir = os.path.dirname(cache_file)
+    if cache_dir != '' and not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+
+    tmp_file = '{}.{}.tmp'.format(cache_file, os.getpid())
+    with open(tmp_file, 'w') as file:
+        json.dump(cache, file, sort_keys=True)
+    os.replace(tmp_file, cache_file)
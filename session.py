@@ -0,0 +1,116 @@
+import random
+
+import generator
+
+from common import DWIGException
+
+from domain import spin_to_bool
+
+from structure import QPUAssignment
+from structure import ChimeraQPU
+from structure import Range
+from structure import chimera_graph
+
+# a library interface to the problem generators, which does not use the
+# global random number generator or any other module level state
+
+
+def chimera_qpu(hardware_chimera_degree=16, chimera_degree=None, cell_size=8):
+    '''Builds a full yield chimera QPU with the default D-Wave field and
+    coupling ranges, optionally filtered to a chimera degree.
+    '''
+    site_array, coupler_array = chimera_graph(hardware_chimera_degree, cell_size)
+    sites = set(site_array.tolist())
+    couplers = [tuple(coupler) for coupler in coupler_array.tolist()]
+
+    qpu = ChimeraQPU(sites, couplers, cell_size, hardware_chimera_degree, Range(-2.0, 2.0), Range(-1.0, 1.0))
+    if chimera_degree != None:
+        qpu = qpu.chimera_degree_filter(chimera_degree)
+    return qpu
+
+
+class Session(object):
+    '''Generates problems on a fixed QPU.  Each session draws from its own
+    random number generator, either the given rng or a random.Random seeded
+    with seed, so sessions can be used concurrently and are reproducible
+    without reseeding the random module.  The generator methods take the same
+    parameters as the command line and return a QPUConfiguration or a
+    QPUAssignment, build_dict converts these into bqpjson data.
+
+    When executor, a concurrent.futures.ProcessPoolExecutor, is given, fl and
+    fclg propose loops on its processes instead of starting a pool for each
+    call with more than one worker.  The executor belongs to the caller, who
+    shuts it down when the session is no longer used.
+    '''
+    def __init__(self, qpu, seed=None, rng=None, executor=None):
+        if rng == None:
+            rng = random.Random(seed)
+        else:
+            assert(seed == None)
+
+        self.qpu = qpu
+        self.rng = rng
+        self.executor = executor
+        self._wscn_qpu = None
+
+    def const(self, coupling=0.0, field=0.0, random_gauge_transformation=False):
+        return generator.generate_disordered(self.qpu, [coupling], [1.0], [field], [1.0], random_gauge_transformation, rng=self.rng)
+
+    def ran(self, probability=0.5, steps=1, field=False, scale=1.0, simple_ground_state=False):
+        return generator.generate_ran(self.qpu, probability, steps, field, scale, simple_ground_state, rng=self.rng)
+
+    def gd(self, coupling_values=[], coupling_probabilities=[], field_values=[], field_probabilities=[], random_gauge_transformation=False):
+        return generator.generate_disordered(self.qpu, coupling_values, coupling_probabilities, field_values, field_probabilities, random_gauge_transformation, rng=self.rng)
+
+    def cbfm(self, j1_val=-1.0, j1_pr=0.625, j2_val=0.2, j2_pr=0.375, h1_val=-1.0, h1_pr=0.02, h2_val=1.0, h2_pr=0.01, random_gauge_transformation=False):
+        return generator.generate_disordered(self.qpu, [j1_val, j2_val], [j1_pr, j2_pr], [h1_val, h2_val], [h1_pr, h2_pr], random_gauge_transformation, rng=self.rng)
+
+    def fl(self, steps=2, alpha=0.2, multicell=False, cluster_chimera_cells=False, simple_ground_state=False, min_loop_length=7, loop_reject_limit=1000, loop_sample_limit=10000, workers=1, record_loops=False):
+        return generator.generate_fl(self.qpu, steps, alpha, multicell, cluster_chimera_cells, simple_ground_state, min_loop_length, loop_reject_limit, loop_sample_limit, workers, record_loops, self.executor, rng=self.rng)
+
+    def wscn(self, weak_field=0.44, strong_field=-1.0):
+        '''Weak-strong cluster networks use the largest chimera degree that is
+        a multiple of 3, which must be at least 6.
+        '''
+        if self._wscn_qpu == None:
+            if self.qpu.chimera_degree_view < 6:
+                raise DWIGException('weak-strong cluster networks require a qpu with chimera degree of at least 6, the given degree is {}'.format(self.qpu.chimera_degree_view))
+            effective_chimera_degree = 3*(self.qpu.chimera_degree_view//3)
+            if effective_chimera_degree != self.qpu.chimera_degree_view:
+                self._wscn_qpu = self.qpu.chimera_degree_filter(effective_chimera_degree)
+            else:
+                self._wscn_qpu = self.qpu
+        return generator.generate_wscn(self._wscn_qpu, weak_field, strong_field, rng=self.rng)
+
+    def fclg(self, steps=3, alpha=0.2, gadget_fraction=0.1, simple_ground_state=False, min_loop_length=7, loop_reject_limit=5000, loop_sample_limit=10000, workers=1, record_loops=False):
+        return generator.generate_fclg(self.qpu, steps, alpha, gadget_fraction, simple_ground_state, min_loop_length, loop_reject_limit, loop_sample_limit, workers, record_loops, self.executor, rng=self.rng)
+
+    def build_dict(self, qpu_config, include_zeros=False, omit_solution=False, variable_domain='spin', stream=False):
+        '''Returns the bqpjson data of a generated problem, the problem id is
+        drawn from this session's random number generator.  Problems are 
+        converted to the boolean domain when variable_domain is 'boolean', 
+        which drops any zero terms.  When stream is set, spin domain terms are
+        generated as they are written by bqp_stream.write_bqp.
+        '''
+        if include_zeros:
+            config = qpu_config
+            if isinstance(qpu_config, QPUAssignment):
+                config = qpu_config.qpu_config
+            for site in config.qpu.sites:
+                if not site in config.fields:
+                    config.fields[site] = 0.0
+            for coupler in config.qpu.couplers:
+                if not coupler in config.couplings:
+                    config.couplings[coupler] = 0.0
+
+        if omit_solution:
+            if isinstance(qpu_config, QPUAssignment):
+                qpu_config = qpu_config.qpu_config
+
+        data = qpu_config.build_dict(include_zeros, self.rng, stream and variable_domain == 'spin')
+        if variable_domain == 'boolean':
+            data = spin_to_bool(data)
+        else:
+            assert(variable_domain == 'spin')
+
+        return data
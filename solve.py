@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+
+from __future__ import print_function
+
+import sys, json, argparse, math
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+import evaluate
+
+from common import print_err
+from common import DWIGException
+
+# exact ground states of small or narrow problems, by exhaustive enumeration
+# or by variable elimination along the chimera cells
+
+SearchResult = namedtuple('SearchResult', ['energy', 'degeneracy', 'assignment'])
+
+default_low_size = 20
+max_variables = 48
+max_frontier_width = 22
+
+methods = ['auto', 'exhaustive', 'elimination']
+
+
+def exhaustive_search(model, processes=1, low_size=default_low_size, tolerance=1e-9):
+    '''Enumerates every spin state of an evaluate.EnergyModel and returns the
+    minimum energy (scaled like QPUAssignment.eval), the number of states
+    within tolerance of it and one optimal assignment.
+
+    The variables are split into a low block of up to low_size variables,
+    whose 2^low_size states are evaluated together as a numpy array, and a
+    high block that is enumerated in Gray code order, so each step flips one
+    high variable and updates the array through its few low neighbors.  The
+    high states are divided among processes by fixing their leading spins.
+    '''
+    num_variables = len(model.variables)
+    if num_variables > max_variables:
+        raise DWIGException('exhaustive search supports at most {} variables, the problem has {}'.format(max_variables, num_variables))
+
+    low_size = min(low_size, num_variables)
+    high_size = num_variables - low_size
+
+    prefix_size = 0
+    if processes > 1:
+        prefix_size = min(high_size, int(math.ceil(math.log(4*processes, 2))))
+
+    tasks = [(model, low_size, prefix_size, prefix, tolerance) for prefix in range(2**prefix_size)]
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(_search_block, *zip(*tasks)))
+    else:
+        results = [_search_block(*task) for task in tasks]
+
+    energy = min(result[0] for result in results)
+    degeneracy = 0
+    spins = None
+    for block_energy, block_degeneracy, block_spins in results:
+        if block_energy <= energy + tolerance:
+            degeneracy += block_degeneracy
+            if spins is None:
+                spins = block_spins
+
+    assignment = dict(zip(model.variables, spins.tolist()))
+    return SearchResult(float(model.scale*(energy + model.offset)), degeneracy, assignment)
+
+
+def chimera_order(site_indices, chimera_degree, cell_size=8):
+    '''Orders the positions of site_indices for variable elimination, cell 
+    by cell along the chimera cell rows, or along the columns when that keeps
+    the elimination frontier smaller, e.g. for strips that are one or two cells
+    wide.  Within a cell the vertical shore comes first.
+    '''
+    shore = cell_size//2
+    keys = []
+    for k, index in enumerate(site_indices):
+        cell = index//cell_size
+        keys.append((cell//chimera_degree, cell%chimera_degree, (index%cell_size)//shore, index%shore, k))
+
+    row_order = [key[-1] for key in sorted(keys)]
+    column_order = [key[-1] for key in sorted(keys, key=lambda key: (key[1], key[0], key[2], key[3]))]
+    return row_order, column_order
+
+
+def frontier_width(model, order):
+    '''The largest number of variables held in the elimination table when
+    variables are added in the given order.
+    '''
+    ptr, neighbors, weights = model.adjacency()
+    remaining = numpy.diff(ptr).tolist()
+    added = [False]*len(model.variables)
+
+    width = 0
+    frontier = 0
+    for k in order:
+        added[k] = True
+        frontier += 1
+        width = max(width, frontier)
+        for other in neighbors[ptr[k]:ptr[k+1]].tolist():
+            if added[other]:
+                remaining[other] -= 1
+                remaining[k] -= 1
+                if remaining[other] == 0:
+                    frontier -= 1
+        if remaining[k] == 0:
+            frontier -= 1
+    return width
+
+
+def variable_elimination(model, order, tolerance=1e-9, max_width=max_frontier_width):
+    '''Computes the minimum energy, its degeneracy and an optimal assignment
+    of an evaluate.EnergyModel by min-sum variable elimination.  Variables are
+    added to a table over the current frontier in the given order and each 
+    variable is minimized out as soon as all of its neighbors have been added,
+    so the cost is exponential only in the frontier width (see chimera_order).
+    '''
+    width = frontier_width(model, order)
+    if width > max_width:
+        raise DWIGException('the elimination frontier has {} variables, which is more than the limit of {}'.format(width, max_width))
+
+    ptr, neighbors, weights = model.adjacency()
+    remaining = numpy.diff(ptr).tolist()
+    added = [False]*len(model.variables)
+    signs = numpy.array([1.0, -1.0])
+
+    # the energy and count tables, axis a holds the spin of frontier[a], 
+    # position 0 is spin 1 and position 1 is spin -1
+    frontier = []
+    energies = numpy.zeros(())
+    counts = numpy.ones(())
+    eliminated = []
+
+    for k in order:
+        energies = energies[..., numpy.newaxis] + model.linear[k]*signs
+        counts = numpy.repeat(counts[..., numpy.newaxis], 2, axis=-1)
+        frontier.append(k)
+        added[k] = True
+
+        ready = []
+        for position in range(ptr[k], ptr[k+1]):
+            other = neighbors[position]
+            if added[other]:
+                shape = [1]*len(frontier)
+                shape[frontier.index(other)] = 2
+                shape[-1] = 2
+                energies = energies + weights[position]*numpy.outer(signs, signs).reshape(shape)
+                remaining[other] -= 1
+                remaining[k] -= 1
+                if remaining[other] == 0:
+                    ready.append(other)
+        if remaining[k] == 0:
+            ready.append(k)
+
+        for variable in ready:
+            axis = frontier.index(variable)
+            up = numpy.take(energies, 0, axis=axis)
+            down = numpy.take(energies, 1, axis=axis)
+            minimum = numpy.minimum(up, down)
+            counts = numpy.take(counts, 0, axis=axis)*(up <= minimum + tolerance) + numpy.take(counts, 1, axis=axis)*(down <= minimum + tolerance)
+            frontier.pop(axis)
+            eliminated.append((variable, list(frontier), down < up))
+            energies = minimum
+
+    assert(len(frontier) == 0)
+
+    # recover an optimal state by replaying the eliminations backwards
+    spins = numpy.zeros(len(model.variables), dtype=numpy.int8)
+    for variable, variables, choice in reversed(eliminated):
+        position = tuple(0 if spins[other] == 1 else 1 for other in variables)
+        spins[variable] = -1 if choice[position] else 1
+
+    assignment = dict(zip(model.variables, spins.tolist()))
+    return SearchResult(float(model.scale*(float(energies) + model.offset)), int(round(float(counts))), assignment)
+
+
+def chimera_search(model, site_indices, chimera_degree, cell_size=8, processes=1, low_size=default_low_size, tolerance=1e-9, method='auto'):
+    '''Solves a problem on chimera sites exactly.  The elimination method
+    uses the narrower of the cell row and column orders, the exhaustive method
+    enumerates all states, and auto uses elimination whenever its frontier is
+    small enough.
+    '''
+    assert(method in methods)
+
+    if method != 'exhaustive':
+        orders = chimera_order(site_indices, chimera_degree, cell_size)
+        order = min(orders, key=lambda order: frontier_width(model, order))
+        if method == 'elimination' or frontier_width(model, order) <= max_frontier_width:
+            return variable_elimination(model, order, tolerance)
+
+    return exhaustive_search(model, processes, low_size, tolerance)
+
+
+def certify(assignment, processes=1, low_size=default_low_size, tolerance=1e-9, method='auto'):
+    '''Solves the problem of a QPUAssignment and returns the SearchResult
+    and whether the assignment is optimal.
+    '''
+    qpu = assignment.qpu_config.qpu
+    model = evaluate.from_configuration(assignment.qpu_config)
+    site_indices = [site.index for site in model.variables]
+    result = chimera_search(model, site_indices, qpu.chimera_degree, qpu.cell_size, processes, low_size, tolerance, method)
+    return result, bool(assignment.eval() <= result.energy + tolerance*max(1.0, abs(model.scale)))
+
+
+def _search_block(model, low_size, prefix_size, prefix, tolerance):
+    '''Searches all states whose leading prefix_size high spins are given by
+    the bits of prefix.  Returns the unscaled minimum energy, its degeneracy
+    and an optimal state.
+    '''
+    num_variables = len(model.variables)
+    high = numpy.arange(low_size, num_variables)
+
+    # the spins of all low states, bit k of a state is 1 when spin k is -1
+    states = numpy.arange(2**low_size, dtype=numpy.int64)
+    low_spins = (1 - 2*((states[numpy.newaxis, :] >> numpy.arange(low_size)[:, numpy.newaxis]) & 1)).astype(numpy.int8)
+
+    # the initial high state, free high spins start at +1
+    spins = numpy.ones(num_variables, dtype=numpy.float64)
+    for bit in range(prefix_size):
+        if (prefix >> bit) & 1:
+            spins[num_variables-1-bit] = -1.0
+
+    ptr, neighbors, weights = model.adjacency()
+
+    # energies of the low block with the fields of the initial high state
+    low_fields = model.linear[:low_size].copy()
+    energies = numpy.zeros(2**low_size)
+    high_energy = 0.0
+    for k in high:
+        high_energy += model.linear[k]*spins[k]
+    for i, j, coeff in zip(model.coupler_i.tolist(), model.coupler_j.tolist(), model.quadratic.tolist()):
+        if i < low_size and j < low_size:
+            energies += coeff*(low_spins[i]*low_spins[j])
+        elif i < low_size:
+            low_fields[i] += coeff*spins[j]
+        elif j < low_size:
+            low_fields[j] += coeff*spins[i]
+        else:
+            high_energy += coeff*spins[i]*spins[j]
+    for k in range(low_size):
+        energies += low_fields[k]*low_spins[k]
+    energies += high_energy
+
+    best_energy, best_degeneracy, best_spins = None, 0, None
+
+    free_size = len(high) - prefix_size
+    for step in range(2**free_size):
+        if step > 0:
+            # the Gray code flips the lowest set bit of step
+            k = low_size + (step & -step).bit_length() - 1
+            spin = spins[k]
+            delta = -2.0*spin*model.linear[k]
+            for position in range(ptr[k], ptr[k+1]):
+                other = neighbors[position]
+                coeff = -2.0*spin*weights[position]
+                if other < low_size:
+                    energies += coeff*low_spins[other]
+                else:
+                    delta += coeff*spins[other]
+            energies += delta
+            spins[k] = -spin
+
+        minimum = energies.min()
+        if best_energy is None or minimum < best_energy - tolerance:
+            best_energy = minimum
+            best_degeneracy = int(numpy.count_nonzero(energies <= minimum + tolerance))
+            best_spins = spins.copy()
+            best_spins[:low_size] = low_spins[:, energies.argmin()]
+        elif minimum <= best_energy + tolerance:
+            best_degeneracy += int(numpy.count_nonzero(energies <= best_energy + tolerance))
+
+    return best_energy, best_degeneracy, best_spins.astype(numpy.int8)
+
+
+def main(args, output_stream=sys.stdout):
+    with open(args.input_file) as file:
+        data = json.load(file)
+
+    if data['variable_domain'] != 'spin':
+        raise DWIGException('exhaustive search requires a spin domain problem, given {}'.format(data['variable_domain']))
+
+    model = evaluate.from_bqp(data)
+    metadata = data.get('metadata', {})
+    if args.method == 'elimination' and not 'chimera_degree' in metadata:
+        raise DWIGException('variable elimination requires the chimera_degree metadata of D-WIG output, which {} does not have'.format(args.input_file))
+    if args.method != 'exhaustive' and 'chimera_degree' in metadata:
+        result = chimera_search(model, model.variables, metadata['chimera_degree'], metadata.get('chimera_cell_size', 8), args.processes, args.low_size, method=args.method)
+    else:
+        print_err('enumerating {} states of {} variables'.format(2**len(model.variables), len(model.variables)))
+        result = exhaustive_search(model, args.processes, args.low_size)
+
+    summary = {
+        'variables': len(model.variables),
+        'min_energy': result.energy,
+        'degeneracy': result.degeneracy
+    }
+
+    if 'solutions' in data and len(data['solutions']) > 0:
+        planted = {term['id']: term['value'] for term in data['solutions'][0]['assignment']}
+        planted_energy = float(model.energies(model.sample_matrix([planted]))[0])
+        summary['planted_energy'] = planted_energy
+        summary['planted_optimal'] = bool(planted_energy <= result.energy + 1e-9*max(1.0, abs(model.scale)))
+
+    if args.include_assignment:
+        summary['assignment'] = [{'id': k, 'value': v} for k, v in sorted(result.assignment.items())]
+
+    print(json.dumps(summary, sort_keys=True), file=output_stream)
+
+
+def build_cli_parser():
+    parser = argparse.ArgumentParser(description='computes the ground state energy and degeneracy of a bqpjson problem exactly, by variable elimination along the chimera cells of narrow problems or by exhaustive enumeration')
+
+    parser.add_argument('input_file', help='the bqpjson problem')
+    parser.add_argument('-m', '--method', help='the solution method, auto uses variable elimination when the chimera problem is narrow enough', choices=methods, default='auto')
+    parser.add_argument('-pc', '--processes', help='the number of processes used for the enumeration', type=int, default=1)
+    parser.add_argument('-ls', '--low-size', help='the number of variables evaluated together as one array', type=int, default=default_low_size)
+    parser.add_argument('-ia', '--include-assignment', help='include an optimal assignment in the output', action='store_true', default=False)
+
+    return parser
+
+
+if __name__ == '__main__':
+    parser = build_cli_parser()
+    main(parser.parse_args())
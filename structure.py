@@ -1,16 +1,20 @@
-import copy, random, math
+import copy, random, math, threading
 
 from collections import namedtuple
 
 from common import print_err
 from common import bqpjson_version
 
+from bqp_stream import TermList
+
 class QPUAssignment(object):
-    def __init__(self, qpu_config, spins={}, identifier=0, description=None):
+    def __init__(self, qpu_config, spins={}, identifier=0, description=None, certificate=None):
         self.qpu_config = qpu_config
         self.spins = spins
         self.identifier = identifier
         self.description = description
+        # an optional certificate.LoopCertificate of the planted solution
+        self.certificate = certificate
 
         for k, v in self.spins.items():
             assert(k in self.qpu_config.qpu.sites)
@@ -29,10 +33,14 @@ class QPUAssignment(object):
             #print(coupling*self.spins[coupler[0]]*self.spins[coupler[1]])
         return self.qpu_config.scale*(energy + self.qpu_config.offset)
 
-    def build_dict(self, zeros=False):
-        sorted_sites = sorted(self.spins.keys(), key=lambda x: x.index)
+    def build_dict(self, zeros=False, rng=random, stream=False):
+        sorted_sites = [site for site in self.qpu_config.qpu.sorted_sites() if site in self.spins]
 
-        assignment = [{'id':site.index, 'value':self.spins[site]} for site in sorted_sites]
+        if stream:
+            spins = self.spins
+            assignment = TermList(['id', 'value'], lambda: ((site.index, spins[site]) for site in sorted_sites), len(sorted_sites))
+        else:
+            assignment = [{'id':site.index, 'value':self.spins[site]} for site in sorted_sites]
 
         solution = {
             'id':self.identifier,
@@ -43,7 +51,7 @@ class QPUAssignment(object):
         if self.description != None:
             solution['description'] = self.description
 
-        data_dict = self.qpu_config.build_dict(zeros)
+        data_dict = self.qpu_config.build_dict(zeros, rng, stream)
         data_dict['solutions'] = [solution]
 
         return data_dict
@@ -64,6 +72,8 @@ class QPUConfiguration(object):
         self.fields = filtered_fields
         self.couplings = filtered_couplings
         self.offset = scaled_offset
+        # the factor applied to the given fields and couplings
+        self.scaling_factor = 1.0/scale
         self.scale = 1.0
         if not unitless:
             self.scale = scale
@@ -82,26 +92,32 @@ class QPUConfiguration(object):
         active |= set([key[1] for key in self.couplings.keys()])
         return active
 
-    def build_dict(self, zeros=False):
-        sorted_sites = sorted(self.active_sites(), key=lambda x: x.index)
-
-        quadratic_terms_data = []
-        for (i,j) in sorted(self.couplings.keys(), key=lambda x:(x[0].index, x[1].index)):
-            v = self.couplings[(i,j)]
-            if not zeros:
-                assert(v != 0)
-            quadratic_terms_data.append({'id_tail':i.index, 'id_head':j.index, 'coeff':v})
-
-        linear_terms_data = []
-        for k in sorted(self.fields.keys(), key=lambda x: x.index):
-            v = self.fields[k]
-            if not zeros:
-                assert(v != 0)
-            linear_terms_data.append({'id':k.index, 'coeff':v})
+    def build_dict(self, zeros=False, rng=random, stream=False):
+        '''The bqpjson data of the configuration.  When stream is set, the
+        terms are bqp_stream.TermList objects that are generated as they are
+        written by bqp_stream.write_bqp.
+        '''
+        active_sites = self.active_sites()
+        sorted_sites = [site for site in self.qpu.sorted_sites() if site in active_sites]
+
+        couplers = [coupler for coupler in self.qpu.sorted_couplers() if coupler in self.couplings]
+        field_sites = [site for site in self.qpu.sorted_sites() if site in self.fields]
+        if not zeros:
+            assert(all(self.couplings[coupler] != 0 for coupler in couplers))
+            assert(all(self.fields[site] != 0 for site in field_sites))
+
+        if stream:
+            couplings = self.couplings
+            fields = self.fields
+            quadratic_terms_data = TermList(['coeff', 'id_head', 'id_tail'], lambda: ((couplings[(i,j)], j.index, i.index) for i,j in couplers), len(couplers))
+            linear_terms_data = TermList(['coeff', 'id'], lambda: ((fields[k], k.index) for k in field_sites), len(field_sites))
+        else:
+            quadratic_terms_data = [{'id_tail':i.index, 'id_head':j.index, 'coeff':self.couplings[(i,j)]} for i,j in couplers]
+            linear_terms_data = [{'id':k.index, 'coeff':self.fields[k]} for k in field_sites]
 
         data_dict = {
             'version': bqpjson_version,
-            'id': random.randint(0, 2**31 - 1),
+            'id': rng.randint(0, 2**31 - 1),
             'variable_domain': 'spin',
             'variable_ids':[site.index for site in sorted_sites],
             'scale': self.scale,
@@ -166,7 +182,8 @@ class ChimeraQPU(object):
         self.endpoint = endpoint
         self.solver_name = solver_name
 
-        self.sites = set([ChimeraSite(site, chimera_degree) for site in sites])
+        site_table = chimera_site_table(chimera_degree, self.cell_size, max(sites, default=-1)+1)
+        self.sites = set([site_table[site] for site in sites])
 
         site_lookup = { cn.index : cn for cn in self.sites }
         self.couplers = set([(site_lookup[i],site_lookup[j]) for i,j in couplers])
@@ -191,30 +208,156 @@ class ChimeraQPU(object):
         for i,j in couplers:
             assert(i != j)
 
+        self._sorted_sites = None
+        self._sorted_couplers = None
+        self._site_lookup = None
+        self._coupler_lookup = None
+        self._topology = None
+        self._cell_graph = None
+
+    def sorted_sites(self):
+        '''Returns the sites in index order, this list is computed once and 
+        must not be modified by the caller.
+        '''
+        if self._sorted_sites is None:
+            self._sorted_sites = sorted(self.sites, key=lambda site: site.index)
+        return self._sorted_sites
+
+    def sorted_couplers(self):
+        '''Returns the couplers in index order, this list is computed once and 
+        must not be modified by the caller.
+        '''
+        if self._sorted_couplers is None:
+            self._sorted_couplers = sorted(self.couplers, key=lambda coupler: (coupler[0].index, coupler[1].index))
+        return self._sorted_couplers
+
+    def topology(self):
+        '''Returns the compact array representation of this QPU, which is
+        built on the first call and shared by all later callers.
+        '''
+        if self._topology is None:
+            self._topology = ChimeraTopology(self)
+        return self._topology
+
+    def cell_graph(self):
+        '''Returns the contracted graph of the chimera cells of this QPU, which
+        is built on the first call and shared by all later callers.
+        '''
+        if self._cell_graph is None:
+            self._cell_graph = ChimeraCellGraph(self)
+        return self._cell_graph
+
+    def site_lookup(self):
+        '''Returns a dict from site index to site, computed once.'''
+        if self._site_lookup is None:
+            self._site_lookup = {site.index : site for site in self.sites}
+        return self._site_lookup
+
+    def coupler_lookup(self):
+        '''Returns a dict from site index pairs to couplers, computed once.'''
+        if self._coupler_lookup is None:
+            self._coupler_lookup = {(i.index, j.index) : (i,j) for i,j in self.couplers}
+        return self._coupler_lookup
+
+    def view(self):
+        return ChimeraQPUView(self)
+
     def chimera_degree_filter(self, chimera_degree_view):
-        assert(chimera_degree_view >= 1)
+        return self.view().chimera_degree_filter(chimera_degree_view).materialize()
 
-        filtered_sites = set([n.index for n in self.sites if n.is_chimera_degree(chimera_degree_view)])
-        filtered_couplers = [(i.index, j.index) for i,j in self.couplers if (i.index in filtered_sites and j.index in filtered_sites)]
+    def cell_filter(self, max_cell):
+        return self.view().cell_filter(max_cell).materialize()
+
+    def chimera_cell_box_filter(self, chimera_cell_1, chimera_cell_2):
+        return self.view().chimera_cell_box_filter(chimera_cell_1, chimera_cell_2).materialize()
 
-        return ChimeraQPU(filtered_sites, filtered_couplers, self.cell_size, self.chimera_degree, self.site_range, self.coupler_range, chimera_degree_view, self.chip_id, self.endpoint, self.solver_name)
+    def spin_filter(self, spin_set):
+        return self.view().spin_filter(spin_set).materialize()
+
+    def coupler_filter(self, coupler_set):
+        return self.view().coupler_filter(coupler_set).materialize()
+
+    def chimera_cell(self, chimera_coordinate):
+        return self.chimera_cell_coordinates(chimera_coordinate.row, chimera_coordinate.col)
+
+    def chimera_cell_coordinates(self, chimera_row, chimera_column):
+        assert(chimera_row > 0 and chimera_row <= self.chimera_degree_view)
+        assert(chimera_column > 0 and chimera_column <= self.chimera_degree_view)
+
+        return (chimera_row-1)*(self.chimera_degree) + (chimera_column-1)
+
+    def __reduce__(self):
+        # pickled by site and coupler indices, so that the sites are the 
+        # interned ChimeraSite objects of the unpickling process
+        sites = set(site.index for site in self.sites)
+        couplers = [(i.index, j.index) for i,j in self.sorted_couplers()]
+        return (ChimeraQPU, (sites, couplers, self.cell_size, self.chimera_degree, self.site_range, self.coupler_range, self.chimera_degree_view, self.chip_id, self.endpoint, self.solver_name))
+
+    def __str__(self):
+        return 'sites: '+\
+            ' '.join([str(site) for site in self.sites])+'\ncouplers: '+\
+            ' '.join(['('+str(i)+', '+str(j)+')' for i,j in self.couplers])
+
+
+class ChimeraQPUView(object):
+    '''A lazy composition of ChimeraQPU filters.  Each filter narrows a set 
+    of site indices (and optionally coupler index pairs) over the base QPU and
+    returns a new view, only materialize builds a ChimeraQPU.  Spatial filters 
+    use the chimera cells of the base QPU, so they only touch the selected cells.
+    '''
+    def __init__(self, qpu, sites=None, couplers=None, chimera_degree_view=None):
+        self.qpu = qpu
+        self.sites = sites
+        self.couplers = couplers
+        if chimera_degree_view == None:
+            self.chimera_degree_view = qpu.chimera_degree_view
+        else:
+            self.chimera_degree_view = chimera_degree_view
+
+    def _filtered(self, sites, couplers=None, chimera_degree_view=None):
+        if couplers is None:
+            couplers = self.couplers
+        if chimera_degree_view is None:
+            chimera_degree_view = self.chimera_degree_view
+        return ChimeraQPUView(self.qpu, sites, couplers, chimera_degree_view)
+
+    def _cell_sites(self, cell):
+        sites = self.qpu.chimera_cell_sites.get(cell, ())
+        if self.sites is None:
+            return [site.index for site in sites]
+        return [site.index for site in sites if site.index in self.sites]
+
+    def _cell_box_sites(self, rows, columns):
+        chimera_degree = self.qpu.chimera_degree
+        filtered_sites = set([])
+        for row in range(max(rows[0], 0), min(rows[1], chimera_degree-1)+1):
+            for column in range(max(columns[0], 0), min(columns[1], chimera_degree-1)+1):
+                filtered_sites.update(self._cell_sites(row*chimera_degree + column))
+        return filtered_sites
+
+    def chimera_degree_filter(self, chimera_degree_view):
+        assert(chimera_degree_view >= 1)
+
+        filtered_sites = self._cell_box_sites((0, chimera_degree_view-1), (0, chimera_degree_view-1))
+        return self._filtered(filtered_sites, chimera_degree_view=chimera_degree_view)
 
     def cell_filter(self, max_cell):
         assert(max_cell >= 1)
         # TODO add warning if max_cell is larger than chimera_degree_view**2
 
-        chimera_rows = max(s.chimera_row for s in self.sites)+1
         cell_distances = {}
-        for s in self.sites:
-            cell_distances[s.chimera_cell] = (s.chimera_cell_distance, s.chimera_row)
+        for cell in self.qpu.chimera_cells:
+            if len(self._cell_sites(cell)) > 0:
+                row = cell//self.qpu.chimera_degree
+                column = cell%self.qpu.chimera_degree
+                cell_distances[cell] = (row**2 + column**2, row)
 
         cells = sorted(cell_distances, key=cell_distances.get)
-        cells = set(cells[:max_cell])
 
-        filtered_sites = set([n.index for n in self.sites if n.chimera_cell in cells])
-        filtered_couplers = [(i.index, j.index) for i,j in self.couplers if (i.index in filtered_sites and j.index in filtered_sites)]
-
-        return ChimeraQPU(filtered_sites, filtered_couplers, self.cell_size, self.chimera_degree, self.site_range, self.coupler_range, self.chimera_degree_view, self.chip_id, self.endpoint, self.solver_name)
+        filtered_sites = set([])
+        for cell in cells[:max_cell]:
+            filtered_sites.update(self._cell_sites(cell))
+        return self._filtered(filtered_sites)
 
     def chimera_cell_box_filter(self, chimera_cell_1, chimera_cell_2):
         chimera_rows = (chimera_cell_1[0], chimera_cell_2[0])
@@ -227,49 +370,38 @@ class ChimeraQPU(object):
         assert(chimera_columns[1] >= 0 and chimera_columns[1] <= self.chimera_degree_view)
         assert(chimera_columns[0] <= chimera_columns[1])
 
-        filtered_sites = set([])
-        for site in self.sites:
-            if site.chimera_row >= chimera_rows[0] and site.chimera_row <= chimera_rows[1] and \
-                site.chimera_column >= chimera_columns[0] and site.chimera_column <= chimera_columns[1]:
-                filtered_sites.add(site.index)
-
-        filtered_couplers = [(i.index, j.index) for i,j in self.couplers if (i.index in filtered_sites and j.index in filtered_sites)]
-
-        return ChimeraQPU(filtered_sites, filtered_couplers, self.cell_size, self.chimera_degree, self.site_range, self.coupler_range, self.chimera_degree_view, self.chip_id, self.endpoint, self.solver_name)
+        return self._filtered(self._cell_box_sites(chimera_rows, chimera_columns))
 
     def spin_filter(self, spin_set):
-        spin_set = set(spin_set)
+        site_lookup = self.qpu.site_lookup()
 
         filtered_sites = set([])
-        for site in self.sites:
-            if site.index in spin_set:
-                filtered_sites.add(site.index)
+        for index in set(spin_set):
+            if index in site_lookup and (self.sites is None or index in self.sites):
+                filtered_sites.add(index)
 
-        filtered_couplers = []
-        for i,j in self.couplers:
-            if (i.index in filtered_sites and j.index in filtered_sites):
-                coupler = (i.index,j.index)
-                filtered_couplers.append(coupler)
-
-        return ChimeraQPU(filtered_sites, filtered_couplers, self.cell_size, self.chimera_degree, self.site_range, self.coupler_range, self.chimera_degree_view, self.chip_id, self.endpoint, self.solver_name)
+        return self._filtered(filtered_sites)
 
     def coupler_filter(self, coupler_set):
+        coupler_set = set(coupler_set)
+        coupler_lookup = self.qpu.coupler_lookup()
+        site_lookup = self.qpu.site_lookup()
+
         coupler_sites = set([])
         for (i,j) in coupler_set:
             coupler_sites.add(i)
             coupler_sites.add(j)
 
         filtered_sites = set([])
-        for site in self.sites:
-            if site.index in coupler_sites:
-                filtered_sites.add(site.index)
+        for index in coupler_sites:
+            if index in site_lookup and (self.sites is None or index in self.sites):
+                filtered_sites.add(index)
 
-        filtered_couplers = []
-        for i,j in self.couplers:
-            if (i.index in filtered_sites and j.index in filtered_sites):
-                coupler = (i.index, j.index)
-                if coupler in coupler_set:
-                    filtered_couplers.append(coupler)
+        filtered_couplers = set([])
+        for coupler in coupler_set:
+            if coupler in coupler_lookup and coupler[0] in filtered_sites and coupler[1] in filtered_sites:
+                if self.couplers is None or coupler in self.couplers:
+                    filtered_couplers.add(coupler)
 
         if len(filtered_couplers) != len(coupler_sites):
             print_err('warning: given a coupler set of size {} but found only {} active couplings from this set'.format(len(coupler_sites), len(filtered_couplers)))
@@ -278,29 +410,121 @@ class ChimeraQPU(object):
                 filtered_sites.add(i)
                 filtered_sites.add(j)
 
-        return ChimeraQPU(filtered_sites, filtered_couplers, self.cell_size, self.chimera_degree, self.site_range, self.coupler_range, self.chimera_degree_view, self.chip_id, self.endpoint, self.solver_name)
+        return self._filtered(filtered_sites, filtered_couplers)
 
+    def materialize(self):
+        '''Builds a ChimeraQPU from the composed filters in a single pass over
+        the candidate couplers.
+        '''
+        qpu = self.qpu
+        if self.sites is None and self.couplers is None and self.chimera_degree_view == qpu.chimera_degree_view:
+            return qpu
 
-    def chimera_cell(self, chimera_coordinate):
-        return self.chimera_cell_coordinates(chimera_coordinate.row, chimera_coordinate.col)
+        sites = self.sites
+        if sites is None:
+            sites = set(qpu.site_lookup())
 
-    def chimera_cell_coordinates(self, chimera_row, chimera_column):
-        assert(chimera_row > 0 and chimera_row <= self.chimera_degree_view)
-        assert(chimera_column > 0 and chimera_column <= self.chimera_degree_view)
+        if self.couplers is None:
+            candidates = qpu.coupler_lookup()
+        else:
+            candidates = self.couplers
+        couplers = [(i,j) for i,j in candidates if i in sites and j in sites]
 
-        return (chimera_row-1)*(self.chimera_degree) + (chimera_column-1)
+        return ChimeraQPU(sites, couplers, qpu.cell_size, qpu.chimera_degree, qpu.site_range, qpu.coupler_range, self.chimera_degree_view, qpu.chip_id, qpu.endpoint, qpu.solver_name)
 
-    def __str__(self):
-        return 'sites: '+\
-            ' '.join([str(site) for site in self.sites])+'\ncouplers: '+\
-            ' '.join(['('+str(i)+', '+str(j)+')' for i,j in self.couplers])
+
+class ChimeraTopology(object):
+    '''An integer indexed view of the sites and couplers of a ChimeraQPU.
+
+    Sites and couplers are given dense ids following their index order, so 
+    that site id k refers to sites[k] and coupler id k refers to couplers[k].
+    The neighbors of site k are neighbors[incident_ptr[k]:incident_ptr[k+1]]
+    and incident holds the matching coupler ids, in coupler id order.
+    '''
+    def __init__(self, qpu):
+        import numpy
+
+        self.sites = qpu.sorted_sites()
+        self.couplers = qpu.sorted_couplers()
+
+        self.site_id = {site : k for k, site in enumerate(self.sites)}
+        self.coupler_id = {coupler : k for k, coupler in enumerate(self.couplers)}
+
+        num_sites = len(self.sites)
+        num_couplers = len(self.couplers)
+
+        self.site_index = numpy.array([site.index for site in self.sites], dtype=numpy.int64)
+        self.cell = numpy.array([site.chimera_cell for site in self.sites], dtype=numpy.int64)
+        self.row = numpy.array([site.chimera_row for site in self.sites], dtype=numpy.int64)
+        self.column = numpy.array([site.chimera_column for site in self.sites], dtype=numpy.int64)
+        self.cell_row = numpy.array([site.chimera_cell_row for site in self.sites], dtype=numpy.int64)
+
+        self.coupler_i = numpy.array([self.site_id[i] for i,j in self.couplers], dtype=numpy.int64)
+        self.coupler_j = numpy.array([self.site_id[j] for i,j in self.couplers], dtype=numpy.int64)
+
+        # CSR adjacency, each coupler appears once in the row of both endpoints
+        endpoints = numpy.concatenate((self.coupler_i, self.coupler_j))
+        others = numpy.concatenate((self.coupler_j, self.coupler_i))
+        coupler_ids = numpy.concatenate((numpy.arange(num_couplers), numpy.arange(num_couplers)))
+
+        order = numpy.lexsort((coupler_ids, endpoints))
+        self.neighbors = others[order]
+        self.incident = coupler_ids[order]
+
+        self.incident_ptr = numpy.zeros(num_sites+1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(endpoints, minlength=num_sites), out=self.incident_ptr[1:])
+
+    def degree(self):
+        import numpy
+        return numpy.diff(self.incident_ptr)
+
+    def site_neighbors(self, site_id):
+        return self.neighbors[self.incident_ptr[site_id]:self.incident_ptr[site_id+1]]
+
+    def site_incident(self, site_id):
+        return self.incident[self.incident_ptr[site_id]:self.incident_ptr[site_id+1]]
+
+
+class ChimeraCellGraph(object):
+    '''The graph of a ChimeraQPU contracted to its chimera cells.
+
+    cells is the sorted list of cells and cell_edges the sorted list of 
+    (cell_i, cell_j) pairs, with cell_i < cell_j, that share a coupler.  The
+    couplers within a cell are given by intra_couplers[cell] and the couplers 
+    between two cells by cell_couplers[(cell_i, cell_j)], both in index order.
+    Couplers keep the orientation of the qpu, which may list either site first.
+    '''
+    def __init__(self, qpu):
+        self.cells = sorted(qpu.chimera_cells)
+
+        self.intra_couplers = {cell : [] for cell in self.cells}
+        self.cell_couplers = {}
+        for coupler in qpu.sorted_couplers():
+            cell_i = min(coupler[0].chimera_cell, coupler[1].chimera_cell)
+            cell_j = max(coupler[0].chimera_cell, coupler[1].chimera_cell)
+            if cell_i == cell_j:
+                self.intra_couplers[cell_i].append(coupler)
+            else:
+                if (cell_i, cell_j) not in self.cell_couplers:
+                    self.cell_couplers[(cell_i, cell_j)] = []
+                self.cell_couplers[(cell_i, cell_j)].append(coupler)
+
+        self.cell_edges = sorted(self.cell_couplers)
+
+    def couplers_between(self, cell_i, cell_j):
+        '''Returns the couplers between two distinct cells, in either order.'''
+        if cell_i > cell_j:
+            cell_i, cell_j = cell_j, cell_i
+        return self.cell_couplers.get((cell_i, cell_j), [])
 
 
 class ChimeraSite(object):
+    __slots__ = ('index', 'chimera_cell', 'chimera_cell_row', 'chimera_row', 'chimera_column', 'chimera_cell_distance')
+
     def __init__(self, index, chimera_degree, unit_cell_size = 8):
         self.index = index
         self.chimera_cell = self.index//unit_cell_size
-        self.chimera_cell_row = (self.index%unit_cell_size)//(unit_cell_size/2)
+        self.chimera_cell_row = (self.index%unit_cell_size)//(unit_cell_size//2)
         self.chimera_row = self.chimera_cell//chimera_degree
         self.chimera_column = self.chimera_cell%chimera_degree
         self.chimera_cell_distance = math.sqrt(self.chimera_row**2 + self.chimera_column**2)
@@ -314,3 +538,101 @@ class ChimeraSite(object):
     # required so sorting works properly and problem generation is consistent
     def __lt__(self, other):
         return self.index < other.index
+
+
+# interned ChimeraSite objects, keyed by chimera degree and unit cell size,
+# tables only grow while holding the lock, so that each index is interned once
+_chimera_site_tables = {}
+_chimera_site_tables_lock = threading.Lock()
+
+def chimera_site_table(chimera_degree, unit_cell_size=8, size=0):
+    '''Returns a list of shared ChimeraSite objects, where position i holds 
+    the site with index i.  The table covers at least a full chimera graph of
+    the given degree and is extended in bulk when a larger size is requested.
+    '''
+    chimera_degree = int(chimera_degree)
+    unit_cell_size = int(unit_cell_size)
+    size = max(size, chimera_degree**2*unit_cell_size)
+
+    key = (chimera_degree, unit_cell_size)
+    table = _chimera_site_tables.get(key)
+    if table != None and len(table) >= size:
+        return table
+
+    with _chimera_site_tables_lock:
+        table = _chimera_site_tables.setdefault(key, [])
+        if len(table) < size:
+            _extend_chimera_site_table(table, chimera_degree, unit_cell_size, size)
+    return table
+
+
+def _extend_chimera_site_table(table, chimera_degree, unit_cell_size, size):
+    import numpy
+
+    index = numpy.arange(len(table), size)
+    cell = index//unit_cell_size
+    cell_row = (index%unit_cell_size)//(unit_cell_size//2)
+    row = cell//chimera_degree
+    column = cell%chimera_degree
+    distance = numpy.sqrt(row**2 + column**2)
+
+    for values in zip(index.tolist(), cell.tolist(), cell_row.tolist(), row.tolist(), column.tolist(), distance.tolist()):
+        site = ChimeraSite.__new__(ChimeraSite)
+        site.index, site.chimera_cell, site.chimera_cell_row, site.chimera_row, site.chimera_column, site.chimera_cell_distance = values
+        table.append(site)
+
+
+# memoized chimera graphs, keyed by chimera degree and unit cell size
+_chimera_graphs = {}
+
+def chimera_graph(chimera_degree, cell_size=8):
+    '''Builds the sites and couplers of a full yield square chimera graph, 
+    using the same site indices as the D-Wave solvers.  The sites are returned
+    as a sorted array and the couplers as a lexicographically sorted array of 
+    (i, j) rows with i < j.  Results are memoized and must not be modified.
+    '''
+    import numpy
+
+    key = (int(chimera_degree), int(cell_size))
+    if key in _chimera_graphs:
+        return _chimera_graphs[key]
+
+    degree, shore = key[0], key[1]//2
+
+    # site index of (row, column, u, k), u = 0 are the vertical couplers
+    index = numpy.arange(degree*degree*2*shore, dtype=numpy.int64).reshape(degree, degree, 2, shore)
+
+    intra_i = numpy.broadcast_to(index[:, :, 0, :, None], (degree, degree, shore, shore))
+    intra_j = numpy.broadcast_to(index[:, :, 1, None, :], (degree, degree, shore, shore))
+    vertical_i, vertical_j = index[:-1, :, 0, :], index[1:, :, 0, :]
+    horizontal_i, horizontal_j = index[:, :-1, 1, :], index[:, 1:, 1, :]
+
+    couplers = numpy.stack((
+        numpy.concatenate((intra_i.ravel(), vertical_i.ravel(), horizontal_i.ravel())),
+        numpy.concatenate((intra_j.ravel(), vertical_j.ravel(), horizontal_j.ravel()))
+    ), axis=1)
+    couplers = couplers[numpy.lexsort((couplers[:, 1], couplers[:, 0]))]
+
+    _chimera_graphs[key] = (index.ravel(), couplers)
+    return _chimera_graphs[key]
+
+
+def save_chimera_snapshot(file_name, chimera_degree, cell_size=8):
+    '''Saves the chimera graph of the given size as a binary snapshot.'''
+    import numpy
+
+    sites, couplers = chimera_graph(chimera_degree, cell_size)
+    with open(file_name, 'wb') as file:
+        numpy.savez(file, chimera_degree=chimera_degree, cell_size=cell_size, sites=sites, couplers=couplers)
+
+
+def load_chimera_snapshot(file_name):
+    '''Loads a snapshot written by save_chimera_snapshot, memoizes its chimera
+    graph and returns the chimera degree and cell size that it covers.
+    '''
+    import numpy
+
+    with numpy.load(file_name) as snapshot:
+        key = (int(snapshot['chimera_degree']), int(snapshot['cell_size']))
+        _chimera_graphs[key] = (snapshot['sites'], snapshot['couplers'])
+    return key
@@ -0,0 +1,96 @@
+import sys, os, json
+
+if (sys.version_info > (3, 0)):
+    from io import StringIO
+else:
+    from cStringIO import StringIO
+
+import numpy
+
+sys.path.append('.')
+import anneal
+import evaluate
+
+from session import Session
+from session import chimera_qpu
+
+
+class TestColourClasses:
+    def test_chimera(self):
+        session = Session(chimera_qpu(16, 3), seed=0)
+        model = evaluate.from_configuration(session.ran().qpu_config)
+        classes = anneal.colour_classes(model)
+        assert(len(classes) == 2)
+        assert(sum(len(members) for members in classes) == len(model.variables))
+
+        colour = numpy.zeros(len(model.variables), dtype=numpy.int64)
+        for c, members in enumerate(classes):
+            colour[members] = c
+        assert(numpy.all(colour[model.coupler_i] != colour[model.coupler_j]))
+
+    def test_triangle(self):
+        model = evaluate.EnergyModel([0, 1, 2, 3], [0.0, 0.5, 0.0, 0.0], [0, 1, 0, 2], [1, 2, 2, 3], [1.0, -1.0, 1.0, 0.5])
+        classes = anneal.colour_classes(model)
+        assert(len(classes) == 3)
+        for members in classes:
+            for i, j in zip(model.coupler_i, model.coupler_j):
+                assert(not (i in members and j in members))
+
+
+class TestAnneal:
+    def setup_class(self):
+        session = Session(chimera_qpu(16, 2), seed=0)
+        self.assignment = session.fl(min_loop_length=4)
+        self.model = evaluate.from_configuration(self.assignment.qpu_config)
+
+    def test_target(self):
+        result = anneal.anneal_assignment(self.assignment, replicas=32, sweeps=500, seed=0)
+        assert(result.sweeps_to_target != None)
+        assert(result.sweeps == result.sweeps_to_target)
+        assert(result.success_fraction == None)
+        assert(numpy.isclose(result.best_energy, self.assignment.eval()))
+        assert(numpy.isclose(self.model.energies(self.model.sample_matrix([result.best_sample]))[0], result.best_energy))
+
+    def test_full_schedule(self):
+        result = anneal.anneal(self.model, replicas=16, sweeps=200, schedule='linear', target=self.assignment.eval(), stop_at_target=False, seed=1)
+        assert(result.sweeps == 200)
+        assert(len(result.energies) == 16)
+        assert(result.success_fraction > 0.0)
+        assert(numpy.all(result.energies >= self.assignment.eval() - 1e-9))
+
+    def test_seed(self):
+        first = anneal.anneal(self.model, replicas=8, sweeps=50, seed=3)
+        second = anneal.anneal(self.model, replicas=8, sweeps=50, seed=3)
+        assert(first.target == None and first.sweeps_to_target == None)
+        assert(numpy.array_equal(first.energies, second.energies))
+        assert(first.best_sample == second.best_sample)
+
+    def test_beta_schedule(self):
+        betas = anneal.beta_schedule(10, (0.1, 10.0))
+        assert(numpy.isclose(betas[0], 0.1) and numpy.isclose(betas[-1], 10.0))
+        assert(numpy.isclose(betas[1]/betas[0], betas[-1]/betas[-2]))
+
+        beta_min, beta_max = anneal.default_beta_range(self.model)
+        assert(0.0 < beta_min < beta_max)
+
+
+class TestAnnealCLI:
+    def test_directory(self, tmpdir):
+        session = Session(chimera_qpu(16, 1), seed=0)
+        for k in range(2):
+            with open(str(tmpdir.join('case_{}.json'.format(k))), 'w') as file:
+                json.dump(session.build_dict(session.fl(min_loop_length=4)), file)
+        with open(str(tmpdir.join('cases.jsonl')), 'w') as file:
+            for k in range(3):
+                file.write(json.dumps(session.build_dict(session.fl(min_loop_length=4))) + '\n')
+
+        output = StringIO()
+        anneal.main(anneal.build_cli_parser().parse_args([str(tmpdir), '-r', '8', '-sw', '200', '-rs', '0']), output)
+        summaries = [json.loads(line) for line in output.getvalue().splitlines()]
+
+        assert(len(summaries) == 5)
+        assert([os.path.basename(summary['file']) for summary in summaries] == ['case_0.json', 'case_1.json', 'cases.jsonl:1', 'cases.jsonl:2', 'cases.jsonl:3'])
+        for summary in summaries:
+            assert(summary['sweeps_to_target'] != None)
+            assert(numpy.isclose(summary['min_energy'], summary['planted_energy']))
+            assert(not 'success_fraction' in summary)
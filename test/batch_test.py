@@ -0,0 +1,52 @@
+import sys, os, json
+
+if (sys.version_info > (3, 0)):
+    from io import StringIO
+else:
+    from cStringIO import StringIO
+
+sys.path.append('.')
+import dwig
+
+from common import derive_seed
+from common_test import run_dwig_cli
+
+
+def run_batch(parser, cli_args):
+    output = StringIO()
+    dwig.main(parser.parse_args(cli_args), output)
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+class TestBatch:
+    def setup_class(self):
+        self.parser = dwig.build_cli_parser()
+
+    def test_derive_seed(self):
+        seeds = [derive_seed(0, index) for index in range(100)]
+        assert(seeds == [derive_seed(0, index) for index in range(100)])
+        assert(len(set(seeds)) == 100)
+        assert(derive_seed(1, 0) != derive_seed(0, 1))
+
+    def test_count(self):
+        cases = run_batch(self.parser, ['-ic', '-cd', '2', '-tl', '-rs', '3', '-n', '4', 'ran'])
+        assert(len(cases) == 4)
+        assert(len(set(case['id'] for case in cases)) == 4)
+
+    def test_instances_reproducible(self):
+        cases = run_batch(self.parser, ['-ic', '-cd', '2', '-tl', '-rs', '3', '-n', '3', 'fl'])
+        for index, case in enumerate(cases):
+            single = run_dwig_cli(self.parser, ['-ic', '-cd', '2', '-tl', '-rs', str(derive_seed(3, index)), 'fl'])
+            assert(case == single)
+
+    def test_output_dir(self, tmpdir):
+        output_dir = str(tmpdir.join('cases'))
+        output = run_batch(self.parser, ['-ic', '-cd', '6', '-tl', '-rs', '3', '-n', '12', '-od', output_dir, 'wscn'])
+        assert(len(output) == 0)
+
+        file_names = sorted(os.listdir(output_dir))
+        assert(file_names[0] == 'wscn_00.json' and file_names[-1] == 'wscn_11.json')
+
+        with open(os.path.join(output_dir, 'wscn_05.json')) as file:
+            case = json.load(file)
+        assert(case == run_dwig_cli(self.parser, ['-ic', '-cd', '6', '-tl', '-rs', str(derive_seed(3, 5)), 'wscn']))
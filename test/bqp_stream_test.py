@@ -0,0 +1,86 @@
+import sys, json
+
+if (sys.version_info > (3, 0)):
+    from io import StringIO
+else:
+    from cStringIO import StringIO
+
+import pytest
+
+sys.path.append('.')
+import dwig
+import bqp_stream
+
+from common import json_dumps_kwargs
+from session import Session
+from session import chimera_qpu
+
+
+def expand(value):
+    if isinstance(value, bqp_stream.TermList):
+        return list(value)
+    if isinstance(value, dict):
+        return {k: expand(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [expand(v) for v in value]
+    return value
+
+
+def write(data, pretty, chunk_size):
+    output = StringIO()
+    bqp_stream.write_bqp(data, output, pretty, chunk_size)
+    return output.getvalue()
+
+
+class TestWriteBqp:
+    def setup_class(self):
+        session = Session(chimera_qpu(16, 3), seed=0)
+        self.cases = [
+            (session.ran(field=True), True),
+            (session.fclg(min_loop_length=4), False),
+            (session.const(coupling=1.0), True),
+            (session.fl(min_loop_length=4).qpu_config, True)
+        ]
+        self.session = session
+
+    def test_identical(self):
+        for qpu_config, zeros in self.cases:
+            data = self.session.build_dict(qpu_config, zeros, stream=True)
+            data['metadata'] = {'chimera_degree': 2, 'nested': [{'b': 1, 'a': []}, {}]}
+            expanded = expand(data)
+            for chunk_size in [1, 3, 1000]:
+                assert(write(data, False, chunk_size) == json.dumps(expanded, sort_keys=True))
+                assert(write(data, True, chunk_size) == json.dumps(expanded, **json_dumps_kwargs))
+
+    def test_terms(self):
+        qpu_config = self.cases[0][0]
+        streamed = qpu_config.build_dict(rng=Session(chimera_qpu(16, 2), seed=1).rng, stream=True)
+        built = qpu_config.build_dict(rng=Session(chimera_qpu(16, 2), seed=1).rng)
+        assert(len(streamed['linear_terms']) == len(built['linear_terms']))
+        assert(expand(streamed) == built)
+
+    def test_empty(self):
+        terms = bqp_stream.TermList(['coeff', 'id'], lambda: iter([]), 0)
+        data = {'linear_terms': terms, 'offset': 0.0}
+        assert(write(data, False, 10) == json.dumps({'linear_terms': [], 'offset': 0.0}, sort_keys=True))
+        assert(write(data, True, 10) == json.dumps({'linear_terms': [], 'offset': 0.0}, **json_dumps_kwargs))
+
+
+class TestStreamCLI:
+    def setup_class(self):
+        self.parser = dwig.build_cli_parser()
+
+    def test_identical(self):
+        for cli_args in [['-cd', '3', '-iz', 'ran', '-f'], ['-cd', '4', 'fclg', '-mll', '4'], ['-cd', '2', '-os', 'fl'], ['-cd', '2', '-vd', 'boolean', 'fl']]:
+            for pretty in [[], ['-pp']]:
+                outputs = []
+                for stream in [[], ['--stream']]:
+                    output = StringIO()
+                    dwig.main(self.parser.parse_args(['-ic', '-tl', '-rs', '5'] + pretty + stream + cli_args), output)
+                    outputs.append(output.getvalue())
+                assert(outputs[0] == outputs[1])
+
+    def test_batch(self, tmpdir):
+        for batch in [['-n', '2'], ['-od', str(tmpdir)], ['-ef', str(tmpdir.join('fl.dwig'))]]:
+            with pytest.raises(SystemExit):
+                dwig.main(self.parser.parse_args(['-ic', '-tl', '-cd', '2', '--stream'] + batch + ['fl']), StringIO())
@@ -0,0 +1,70 @@
+import sys
+
+import numpy
+
+sys.path.append('.')
+import certificate
+import evaluate
+import solve
+
+from session import Session
+from session import chimera_qpu
+from structure import QPUAssignment
+
+
+class TestLoopCertificate:
+    def setup_class(self):
+        session = Session(chimera_qpu(16, 4), seed=0)
+        self.assignments = [
+            session.fl(record_loops=True),
+            session.fl(record_loops=True, simple_ground_state=True, steps=3),
+            session.fl(record_loops=True, cluster_chimera_cells=True, min_loop_length=4, steps=3, alpha=0.1),
+            session.fclg(record_loops=True, min_loop_length=4),
+            session.fclg(record_loops=True, simple_ground_state=True, min_loop_length=4)
+        ]
+
+    def test_optimal(self):
+        for assignment in self.assignments:
+            result = certificate.verify(assignment)
+            assert(result.optimal)
+            assert(numpy.isclose(result.energy, assignment.eval()))
+            assert(numpy.isclose(result.lower_bound, solve.certify(assignment)[0].energy))
+
+    def test_loops(self):
+        for assignment in self.assignments:
+            assert(len(assignment.certificate.loops) > 0)
+            for loop in assignment.certificate.loops:
+                assert(certificate.is_simple_cycle(loop.couplers))
+                assert(loop.frustrated in loop.couplers)
+
+    def test_gadgets(self):
+        gadgets = self.assignments[3].certificate.gadgets
+        assert(len(gadgets) > 0)
+        for gadget in gadgets:
+            assert(len(gadget.fields) == 8 and len(gadget.couplings) == 16)
+        assert(len(self.assignments[0].certificate.gadgets) == 0)
+
+    def test_unchanged(self):
+        session = Session(chimera_qpu(16, 4), seed=0)
+        assignment = session.fl()
+        assert(assignment.certificate == None)
+        assert(assignment.qpu_config.couplings == self.assignments[0].qpu_config.couplings)
+        assert(assignment.spins == self.assignments[0].spins)
+
+    def test_not_optimal(self):
+        assignment = self.assignments[3]
+        cache = evaluate.local_field_cache(assignment)
+        cache.flip(0)
+        flipped = QPUAssignment(assignment.qpu_config, cache.assignment(), certificate=assignment.certificate)
+
+        result = certificate.verify(flipped)
+        assert(not result.optimal)
+        assert(result.lower_bound <= certificate.verify(assignment).lower_bound + 1e-9)
+        assert(result.energy > assignment.eval())
+
+    def test_cycle_minimum(self):
+        assert(certificate.cycle_minimum([-1.0, -1.0, -1.0, -1.0]) == -4.0)
+        assert(certificate.cycle_minimum([-1.0, -1.0, 0.5, -1.0]) == -2.5)
+        assert(certificate.cycle_minimum([1.0, -2.0, 1.0, -1.0]) == -5.0)
+        assert(not certificate.is_simple_cycle([(0, 1), (1, 2), (2, 0), (0, 3), (3, 4), (4, 0)]))
+        assert(certificate.is_simple_cycle([(0, 1), (2, 3), (1, 2), (0, 3)]))
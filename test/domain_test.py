@@ -0,0 +1,68 @@
+import sys, json
+
+import bqpjson
+import numpy
+
+sys.path.append('.')
+import dwig
+import domain
+import evaluate
+
+from session import Session
+from session import chimera_qpu
+from common_test import bqp_files
+from common_test import run_dwig_cli
+
+
+def spin_cases():
+    cases = []
+    for file_name in bqp_files:
+        with open(file_name) as file:
+            data = json.load(file)
+        if data['variable_domain'] == 'spin':
+            cases.append(data)
+
+    session = Session(chimera_qpu(16, 4), seed=1)
+    cases.append(session.build_dict(session.ran(field=True, steps=3)))
+    cases.append(session.build_dict(session.cbfm(random_gauge_transformation=True)))
+    cases.append(session.build_dict(session.fclg()))
+    for data in cases[-3:]:
+        data['description'] = ''
+        data['metadata'] = {}
+    return cases
+
+
+class TestSpinToBool:
+    def setup_class(self):
+        self.cases = spin_cases()
+
+    def test_bqpjson(self):
+        for data in self.cases:
+            assert(json.dumps(domain.spin_to_bool(data), sort_keys=True) == json.dumps(bqpjson.spin_to_bool(data), sort_keys=True))
+
+    def test_unchanged(self):
+        data = self.cases[0]
+        text = json.dumps(data, sort_keys=True)
+        domain.spin_to_bool(data)
+        assert(json.dumps(data, sort_keys=True) == text)
+
+    def test_evaluation(self):
+        for data in self.cases:
+            if 'solutions' not in data:
+                continue
+            bool_data = domain.spin_to_bool(data)
+            model = evaluate.from_bqp(bool_data)
+            assignment = {term['id']: term['value'] for term in bool_data['solutions'][0]['assignment']}
+            energy = model.energies(model.sample_matrix([assignment]))[0]
+            assert(numpy.isclose(energy, data['solutions'][0]['evaluation']))
+
+
+class TestVariableDomainCLI:
+    def setup_class(self):
+        self.parser = dwig.build_cli_parser()
+
+    def test_boolean(self):
+        spin = run_dwig_cli(self.parser, ['-ic', '-cd', '2', '-tl', '-rs', '0', 'fl'])
+        boolean = run_dwig_cli(self.parser, ['-ic', '-cd', '2', '-tl', '-rs', '0', '-vd', 'boolean', 'fl'])
+        assert(boolean['variable_domain'] == 'boolean')
+        assert(boolean == bqpjson.spin_to_bool(spin))
@@ -0,0 +1,149 @@
+import sys, os, json
+
+if (sys.version_info > (3, 0)):
+    from io import StringIO
+else:
+    from cStringIO import StringIO
+
+import pytest
+
+sys.path.append('.')
+import dwig
+import ensemble_file
+
+from common import DWIGException
+from common import derive_seed
+from common_test import run_dwig_cli
+from domain import spin_to_bool
+from session import Session
+from session import chimera_qpu
+
+
+class TestEnsembleFile:
+    def setup_class(self):
+        qpu = chimera_qpu(16, 4)
+        session = Session(qpu, seed=0)
+        self.qpu = qpu
+        self.cases = [
+            session.build_dict(session.ran(field=True)),
+            session.build_dict(session.fclg(min_loop_length=4)),
+            session.build_dict(session.fl(), variable_domain='boolean'),
+            session.build_dict(session.fl(), omit_solution=True),
+            session.build_dict(session.cbfm(), include_zeros=True)
+        ]
+        self.cases[0]['metadata'] = {'chimera_degree': 4, 'generated': 'now'}
+
+    def test_round_trip(self, tmpdir):
+        file_name = str(tmpdir.join('cases.dwig'))
+        with ensemble_file.EnsembleWriter(file_name, *ensemble_file.qpu_topology(self.qpu)) as writer:
+            for data in self.cases:
+                writer.write(data)
+
+        with ensemble_file.EnsembleReader(file_name) as reader:
+            assert(len(reader) == len(self.cases))
+            for k in reversed(range(len(self.cases))):
+                assert(json.dumps(reader[k], sort_keys=True) == json.dumps(self.cases[k], sort_keys=True))
+            assert([data['id'] for data in reader] == [data['id'] for data in self.cases])
+
+            record = reader.record(1)
+            assert(record.linear_coefficients.dtype.name == 'float64')
+            assert(len(record.quadratic) == len(self.cases[1]['quadratic_terms']))
+            assert(len(record.solutions) == 1 and len(record.solutions[0]) == len(self.cases[1]['variable_ids']))
+
+            with pytest.raises(IndexError):
+                reader[len(self.cases)]
+
+    def test_topology(self, tmpdir):
+        site_ids, couplers = ensemble_file.bqp_topology(self.cases)
+        assert(site_ids == sorted(set(site_ids)))
+        assert(set(couplers) <= set(ensemble_file.qpu_topology(self.qpu)[1]))
+
+        with ensemble_file.EnsembleWriter(str(tmpdir.join('small.dwig')), site_ids[:-1], couplers) as writer:
+            with pytest.raises(DWIGException):
+                writer.write(self.cases[0])
+
+    def test_order(self, tmpdir):
+        data = json.loads(json.dumps(self.cases[1]))
+        data['variable_ids'] = list(reversed(data['variable_ids']))
+        data['linear_terms'] = data['linear_terms'][1::2] + data['linear_terms'][::2]
+        data['quadratic_terms'] = list(reversed(data['quadratic_terms']))
+        data['solutions'].append(dict(data['solutions'][0], id=1, assignment=data['solutions'][0]['assignment'][::-1]))
+
+        file_name = str(tmpdir.join('order.dwig'))
+        with ensemble_file.EnsembleWriter(file_name, *ensemble_file.qpu_topology(self.qpu)) as writer:
+            writer.write(self.cases[1])
+            writer.write(data)
+
+            duplicate = dict(data, variable_ids=data['variable_ids'] + data['variable_ids'][:1])
+            with pytest.raises(DWIGException):
+                writer.write(duplicate)
+
+        with ensemble_file.EnsembleReader(file_name) as reader:
+            assert(reader.record(0).orders == {})
+            assert(sorted(reader.record(1).orders) == [ensemble_file.variable_order, ensemble_file.linear_order, ensemble_file.quadratic_order, ensemble_file.solution_order+1])
+            assert(json.dumps(reader[0], sort_keys=True) == json.dumps(self.cases[1], sort_keys=True))
+            assert(json.dumps(reader[1], sort_keys=True) == json.dumps(data, sort_keys=True))
+
+    def test_not_ensemble(self, tmpdir):
+        file_name = str(tmpdir.join('case.json'))
+        with open(file_name, 'w') as file:
+            json.dump(self.cases[0], file)
+        with pytest.raises(DWIGException):
+            ensemble_file.EnsembleReader(file_name)
+
+    def test_truncated(self, tmpdir):
+        file_name = str(tmpdir.join('cases.dwig'))
+        with ensemble_file.EnsembleWriter(file_name, *ensemble_file.qpu_topology(self.qpu)) as writer:
+            for data in self.cases:
+                writer.write(data)
+        with open(file_name, 'rb') as file:
+            content = file.read()
+
+        for length in [0, 8, len(content)//2, len(content)-1]:
+            truncated = str(tmpdir.join('truncated.dwig'))
+            with open(truncated, 'wb') as file:
+                file.write(content[:length])
+            with pytest.raises(DWIGException):
+                ensemble_file.EnsembleReader(truncated)
+
+        # a truncated file that still ends with the magic bytes
+        with open(truncated, 'wb') as file:
+            file.write(content[:len(content)//2] + ensemble_file.magic)
+        with pytest.raises(DWIGException):
+            ensemble_file.EnsembleReader(truncated)
+
+
+class TestEnsembleFileCLI:
+    def setup_class(self):
+        self.parser = dwig.build_cli_parser()
+
+    def test_dwig(self, tmpdir):
+        file_name = str(tmpdir.join('fl.dwig'))
+        output = StringIO()
+        dwig.main(self.parser.parse_args(['-ic', '-cd', '2', '-tl', '-rs', '3', '-n', '4', '-ef', file_name, 'fl']), output)
+        assert(len(output.getvalue()) == 0)
+
+        with ensemble_file.EnsembleReader(file_name) as reader:
+            assert(len(reader) == 4)
+            assert(reader[2] == run_dwig_cli(self.parser, ['-ic', '-cd', '2', '-tl', '-rs', str(derive_seed(3, 2)), 'fl']))
+
+    def test_pack_unpack(self, tmpdir):
+        lines = StringIO()
+        dwig.main(self.parser.parse_args(['-ic', '-cd', '3', '-tl', '-rs', '5', '-n', '3', 'ran', '-f']), lines)
+        input_file = str(tmpdir.join('cases.jsonl'))
+        with open(input_file, 'w') as file:
+            file.write(lines.getvalue())
+
+        parser = ensemble_file.build_cli_parser()
+        file_name = str(tmpdir.join('cases.dwig'))
+        ensemble_file.main(parser.parse_args(['pack', file_name, input_file]))
+
+        output = StringIO()
+        ensemble_file.main(parser.parse_args(['unpack', file_name]), output)
+        assert(output.getvalue() == lines.getvalue())
+
+        output_dir = str(tmpdir.join('cases'))
+        ensemble_file.main(parser.parse_args(['unpack', file_name, '-i', '1', '-od', output_dir, '-pp']))
+        assert(os.listdir(output_dir) == ['1.json'])
+        with open(os.path.join(output_dir, '1.json')) as file:
+            assert(json.load(file) == json.loads(lines.getvalue().splitlines()[1]))
@@ -0,0 +1,34 @@
+import sys, pickle
+
+sys.path.append('.')
+import dwig
+import ensemble
+
+from structure import chimera_site_table
+
+
+class TestEnsemble:
+    def setup_class(self):
+        self.parser = dwig.build_cli_parser()
+
+    def cases(self, cli_args, processes, **kwargs):
+        args = self.parser.parse_args(cli_args)
+        qpu = dwig.build_qpu(args)
+        return list(ensemble.generate_ensemble(args, qpu, 10, 7, processes, **kwargs))
+
+    def test_processes(self):
+        cli_args = ['-ic', '-cd', '3', '-tl', 'fl']
+        serial = self.cases(cli_args, 1)
+        assert([index for index, text in serial] == list(range(10)))
+        assert(serial == self.cases(cli_args, 2))
+        assert(serial == self.cases(cli_args, 3, window=1, chunk_size=3))
+
+    def test_pickle_interned(self):
+        qpu = dwig.get_qpu(None, True, 16).chimera_degree_filter(4)
+        copy = pickle.loads(pickle.dumps(qpu))
+
+        site_table = chimera_site_table(16)
+        assert(all(site is site_table[site.index] for site in copy.sites))
+        assert(copy.sites == qpu.sites)
+        assert(copy.couplers == qpu.couplers)
+        assert(copy.chimera_degree_view == qpu.chimera_degree_view)
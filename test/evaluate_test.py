@@ -0,0 +1,141 @@
+import sys, os, json, random
+
+if (sys.version_info > (3, 0)):
+    from io import StringIO
+else:
+    from cStringIO import StringIO
+
+import numpy
+import pytest
+
+sys.path.append('.')
+import evaluate
+
+from common import DWIGException
+from session import Session
+from session import chimera_qpu
+from common_test import bqp_files
+
+
+class TestEnergyModel:
+    def setup_class(self):
+        session = Session(chimera_qpu(16, 3), seed=0)
+        self.assignment = session.ran(field=True, scale=0.25)
+        self.model = evaluate.from_configuration(self.assignment.qpu_config)
+
+    def random_samples(self, num_samples):
+        rng = numpy.random.RandomState(0)
+        return rng.choice(numpy.array([-1, 1], dtype=numpy.int8), (num_samples, len(self.model.variables)))
+
+    def test_planted(self):
+        samples = self.model.sample_matrix([self.assignment.spins])
+        assert(numpy.isclose(self.model.energies(samples)[0], self.assignment.eval()))
+
+    def test_eval(self):
+        samples = self.random_samples(20)
+        energies = self.model.energies(samples, chunk_size=7)
+        for sample, energy in zip(samples.tolist(), energies):
+            self.assignment.spins = dict(zip(self.model.variables, sample))
+            assert(numpy.isclose(energy, self.assignment.eval()))
+
+    def test_bqp_files(self):
+        for file_name in bqp_files:
+            with open(file_name) as file:
+                data = json.load(file)
+            if 'solutions' not in data or data['variable_domain'] != 'spin':
+                continue
+            model = evaluate.from_bqp(data)
+            assignment = {term['id']: term['value'] for term in data['solutions'][0]['assignment']}
+            energy = model.energies(model.sample_matrix([assignment]))[0]
+            assert(numpy.isclose(energy, data['solutions'][0]['evaluation']))
+
+
+class TestEvaluateCLI:
+    def test_summary(self, tmpdir):
+        session = Session(chimera_qpu(16, 2), seed=0)
+        data = session.build_dict(session.fl())
+        input_file = str(tmpdir.join('case.json'))
+        with open(input_file, 'w') as file:
+            json.dump(data, file)
+
+        planted = {term['id']: term['value'] for term in data['solutions'][0]['assignment']}
+        samples = [[planted[v] for v in data['variable_ids']], [-1 for v in data['variable_ids']]]
+        sample_file = str(tmpdir.join('samples.txt'))
+        with open(sample_file, 'w') as file:
+            for sample in samples:
+                file.write(' '.join(str(value) for value in sample)+'\n')
+        numpy.save(str(tmpdir.join('samples.npy')), numpy.array(samples, dtype=numpy.int8))
+
+        parser = evaluate.build_cli_parser()
+        output = StringIO()
+        evaluate.main(parser.parse_args(['-s', input_file, sample_file, str(tmpdir.join('samples.npy'))]), output)
+        summaries = [json.loads(line) for line in output.getvalue().splitlines()]
+
+        assert(len(summaries) == 2)
+        for summary in summaries:
+            assert(summary['samples'] == 2)
+            assert(summary['min_residual_energy'] == 0.0)
+
+        output = StringIO()
+        evaluate.main(parser.parse_args(['-r', input_file, sample_file]), output)
+        residuals = [float(line) for line in output.getvalue().splitlines()]
+        assert(residuals[0] == 0.0 and residuals[1] >= 0.0)
+
+    def test_invalid_samples(self, tmpdir):
+        file_name = str(tmpdir.join('samples.txt'))
+        for content in ['1 -1 1 -1\n1 -1 1 -1 1 -1 1 -1\n', '1 -1 1\n', '1 -1 1 x\n', '1 -1 1 0\n']:
+            with open(file_name, 'w') as file:
+                file.write(content)
+            with pytest.raises(DWIGException):
+                evaluate.load_samples(file_name, 4)
+
+        with open(file_name, 'w') as file:
+            file.write('# header\n1 0 1 0\n\n0, 0, 1, 1\n')
+        assert(evaluate.load_samples(file_name, 4, 'boolean').tolist() == [[1, 0, 1, 0], [0, 0, 1, 1]])
+        with pytest.raises(DWIGException):
+            evaluate.load_samples(file_name, 4, 'spin')
+
+        npy_file = str(tmpdir.join('samples.npy'))
+        for samples in [numpy.ones((2, 8)), numpy.ones(4), numpy.array([[1, -1, 1, 2]])]:
+            numpy.save(npy_file, samples.astype(numpy.int8))
+            with pytest.raises(DWIGException):
+                evaluate.load_samples(npy_file, 4)
+
+
+class TestLocalFieldCache:
+    def setup_class(self):
+        session = Session(chimera_qpu(16, 3), seed=2)
+        self.assignment = session.fl(steps=3)
+        self.model = evaluate.from_configuration(self.assignment.qpu_config)
+
+    def test_planted(self):
+        cache = evaluate.local_field_cache(self.assignment)
+        assert(numpy.isclose(cache.energy(), self.assignment.eval()))
+        assert(cache.is_local_minimum())
+
+    def test_flips(self):
+        cache = evaluate.local_field_cache(self.assignment)
+        rng = random.Random(0)
+        for step in range(200):
+            k = rng.randrange(len(self.model.variables))
+            delta = cache.delta(k)
+            before = cache.energy()
+            assert(numpy.isclose(cache.flip(k), delta))
+            assert(numpy.isclose(cache.energy(), before + delta))
+        assert(numpy.isclose(cache.energy(), self.model.energies(cache.spins)[0]))
+        assert(numpy.allclose(cache.deltas(), [self.model.energies(cache.spins*numpy.where(numpy.arange(len(cache.spins)) == k, -1, 1).astype(numpy.int8))[0] - cache.energy() for k in range(len(cache.spins))]))
+
+    def test_flip_many(self):
+        cache = evaluate.local_field_cache(self.assignment)
+        reference = evaluate.local_field_cache(self.assignment)
+        rng = random.Random(1)
+        for step in range(20):
+            variables = rng.sample(range(len(self.model.variables)), 15)
+            before = cache.energy()
+            delta = cache.flip_many(variables)
+            for k in variables:
+                reference.flip(k)
+            assert(numpy.isclose(cache.energy(), before + delta))
+            assert(numpy.isclose(cache.energy(), reference.energy()))
+            assert(numpy.array_equal(cache.spins, reference.spins))
+            assert(numpy.allclose(cache.fields, reference.fields))
@@ -0,0 +1,237 @@
+import sys, random
+
+import pytest
+
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append('.')
+import generator
+import dwig
+
+from common import DWIGException
+
+
+class TestMirroredRandom:
+    def setup_method(self, method):
+        self.rng = random.Random(7)
+        # move away from a fresh state
+        [self.rng.random() for i in range(1000)]
+
+    def check_continues(self, reference):
+        assert(self.rng.getstate() == reference.getstate())
+
+    def test_random(self):
+        reference = random.Random()
+        reference.setstate(self.rng.getstate())
+
+        with generator._MirroredRandom(self.rng) as rnd:
+            values = rnd.random(2000).tolist()
+
+        assert(values == [reference.random() for i in range(2000)])
+        self.check_continues(reference)
+
+    def test_choice(self):
+        reference = random.Random()
+        reference.setstate(self.rng.getstate())
+
+        with generator._MirroredRandom(self.rng) as rnd:
+            spins = rnd.choice([-1, 1], 500).tolist()
+            steps = rnd.choice([1.0], 10).tolist()
+            values = rnd.choice([1.0, 2.0, 3.0, 4.0, 5.0], 500).tolist()
+            indexes = rnd.randbelow(1000, 50).tolist()
+
+        assert(spins == [reference.choice([-1, 1]) for i in range(500)])
+        assert(steps == [reference.choice([1.0]) for i in range(10)])
+        assert(values == [reference.choice([1.0, 2.0, 3.0, 4.0, 5.0]) for i in range(500)])
+        assert(indexes == [reference.randrange(1000) for i in range(50)])
+        self.check_continues(reference)
+
+    def test_global(self):
+        random.seed(3)
+        with generator._MirroredRandom() as rnd:
+            value = rnd.random(1)[0]
+        following = random.random()
+
+        random.seed(3)
+        assert([value, following] == [random.random(), random.random()])
+
+
+def sequential_ran(qpu, probability, steps, feild, scale):
+    '''the loop based generate_ran that the vectorized version must match'''
+    spins = {site : random.choice([-1, 1]) for site in sorted(qpu.sites)}
+    fm_choices = [float(x) for x in range(1, steps+1)]
+    fields = {}
+    if feild:
+        fields = {site : -scale*spins[site]*random.choice(fm_choices) for site in sorted(qpu.sites)}
+    couplings = {coupler : -scale*spins[coupler[0]]*spins[coupler[1]]*random.choice(fm_choices) for coupler in sorted(qpu.couplers)}
+    if feild:
+        for site in sorted(qpu.sites):
+            if probability < random.random():
+                fields[site] = -fields[site]
+    for coupler in sorted(qpu.couplers):
+        if probability < random.random():
+            couplings[coupler] = -couplings[coupler]
+    return spins, fields, couplings
+
+
+class TestVectorizedRan:
+    def setup_class(self):
+        import dwig
+        self.qpu = dwig.get_qpu(None, True, 16).chimera_degree_filter(4)
+
+    def test_sequential(self):
+        for feild in [False, True]:
+            random.seed(11)
+            spins, fields, couplings = sequential_ran(self.qpu, 0.7, 3, feild, 0.25)
+            following = random.random()
+
+            random.seed(11)
+            assignment = generator.generate_ran(self.qpu, 0.7, 3, feild, 0.25)
+            assert(random.random() == following)
+
+            assert(assignment.spins == spins)
+            assert(assignment.qpu_config.fields == {k:v for k,v in fields.items() if v != 0.0})
+            assert(assignment.qpu_config.couplings == couplings)
+
+
+class TestCycleSampler:
+    def grid(self, size):
+        edges = []
+        for r in range(size):
+            for c in range(size):
+                if c+1 < size:
+                    edges.append((r*size+c, r*size+c+1))
+                if r+1 < size:
+                    edges.append((r*size+c, (r+1)*size+c))
+        return edges
+
+    def test_simple_cycles(self):
+        edges = self.grid(6)
+        sampler = generator._CycleSampler(36, [i for i,j in edges], [j for i,j in edges])
+        rng = random.Random(5)
+
+        for sample in range(200):
+            cycle = sampler.sample(rng, 100)
+            assert(cycle is not None)
+            assert(len(set(cycle)) == len(cycle))
+
+            degree = {}
+            for edge in cycle:
+                for site in edges[edge]:
+                    degree[site] = degree.get(site, 0) + 1
+            assert(all(d == 2 for d in degree.values()))
+            assert(len(degree) == len(cycle))
+
+    def test_removed_edges(self):
+        edges = self.grid(4)
+        sampler = generator._CycleSampler(16, [i for i,j in edges], [j for i,j in edges])
+        rng = random.Random(5)
+
+        removed = set(e for e, (i,j) in enumerate(edges) if i == 5 or j == 5)
+        for edge in removed:
+            sampler.remove_edge(edge)
+
+        for sample in range(50):
+            cycle = sampler.sample(rng, 100)
+            assert(cycle is not None)
+            assert(len(removed.intersection(cycle)) == 0)
+
+    def test_fail_limit(self):
+        edges = [(0, 1), (1, 2), (1, 3)]
+        sampler = generator._CycleSampler(4, [i for i,j in edges], [j for i,j in edges])
+        assert(sampler.sample(random.Random(5), 50) is None)
+
+    def reference_walk(self, rng, incident, edges, removed):
+        path = [rng.choice(range(len(incident)))]
+        walk = []
+        touched_sites = set()
+        touched_edges = set(removed)
+        while path[-1] not in touched_sites:
+            touched_sites.add(path[-1])
+            remaining_edges = sorted(set(incident[path[-1]]) - touched_edges)
+            if len(remaining_edges) == 0:
+                return None
+            edge = rng.choice(remaining_edges)
+            touched_edges.add(edge)
+            walk.append(edge)
+            path.append(edges[edge][1] if edges[edge][0] == path[-1] else edges[edge][0])
+        return walk[path.index(path[-1]):]
+
+    def test_cell_walk(self):
+        edges = self.grid(5)
+        incident = [[] for site in range(25)]
+        for edge, (i,j) in enumerate(edges):
+            incident[i].append(edge)
+            incident[j].append(edge)
+        sampler = generator._CellCycleSampler(25, [i for i,j in edges], [j for i,j in edges])
+
+        removed = [3, 17, 18]
+        for edge in removed:
+            sampler.remove_edge(edge)
+
+        rng, reference_rng = random.Random(3), random.Random(3)
+        for sample in range(300):
+            assert(sampler._walk(rng) == self.reference_walk(reference_rng, incident, edges, removed))
+
+
+class TestParallelCycles:
+    def setup_class(self):
+        self.qpu = dwig.get_qpu(None, True, 4)
+
+    def generate(self, generate, seed, workers):
+        random.seed(seed)
+        return generate(self.qpu, workers=workers).build_dict()
+
+    def test_fl_reproducible(self):
+        first = self.generate(generator.generate_fl, 7, 3)
+        second = self.generate(generator.generate_fl, 7, 3)
+        assert(first == second)
+
+    def test_fclg_reproducible(self):
+        first = self.generate(generator.generate_fclg, 7, 2)
+        second = self.generate(generator.generate_fclg, 7, 2)
+        assert(first == second)
+
+    def test_step_capacity(self):
+        edges = TestCycleSampler().grid(8)
+        sampler = generator._CycleSampler(64, [i for i,j in edges], [j for i,j in edges])
+        random.seed(11)
+        cycles = generator._sample_cycles(sampler, 20, 2, generator._CycleFilter(4), 1000, 100, workers=3)
+
+        assert(len(cycles) == 20)
+        usage = {}
+        for cycle in cycles:
+            for edge in cycle:
+                usage[edge] = usage.get(edge, 0) + 1
+        assert(all(count <= 2 for count in usage.values()))
+
+    def test_executor(self):
+        with ProcessPoolExecutor(max_workers=3) as executor:
+            random.seed(5)
+            shared = generator.generate_fl(self.qpu, workers=3, executor=executor).build_dict()
+            random.seed(5)
+            shared_fclg = generator.generate_fclg(self.qpu, workers=2, executor=executor).build_dict()
+        assert(shared == self.generate(generator.generate_fl, 5, 3))
+        assert(shared_fclg == self.generate(generator.generate_fclg, 5, 2))
+
+    def test_worker_error(self):
+        edges = TestCycleSampler().grid(4)
+        sampler = generator._CycleSampler(16, [i for i,j in edges], [j for i,j in edges])
+        random.seed(11)
+        with pytest.raises(DWIGException):
+            generator._sample_cycles(sampler, 5, 2, generator._CycleFilter(100), 10, 100, workers=2)
+
+
+class TestWscnLayout:
+    def test_memoized(self):
+        layout = generator._wscn_layout(9, 16)
+        assert(layout is generator._wscn_layout(9, 16))
+        assert(layout is not generator._wscn_layout(9, 12))
+
+    def test_clusters(self):
+        layout = generator._wscn_layout(12, 16)
+        for weak, strong in layout.cluster_pairs:
+            assert(layout.cell_strong[strong])
+            assert(abs(weak//16 - strong//16) + abs(weak%16 - strong%16) == 1)
+        assert(layout.strong_cells == sorted(layout.strong_position))
+        assert(all(layout.cell_strong[cell] for cell in layout.strong_cells))
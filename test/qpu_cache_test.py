@@ -0,0 +1,120 @@
+import sys, os, json
+
+sys.path.append('.')
+import dwig
+import qpu_cache
+
+
+class StandInSolver:
+    def __init__(self, sites, couplers):
+        self.name = 'stand_in_solver'
+        self.nodes = set(sites)
+        self.undirected_edges = set(couplers)
+        self.properties = {'h_range':[-2.0, 2.0], 'j_range':[-1.0, 1.0], 'chip_id':'stand_in_chip'}
+
+
+class StandInClient:
+    def __init__(self, solver):
+        self.endpoint = 'http://localhost/sapi'
+        self.solver = solver
+        self.connections = 0
+
+    def __call__(self, profile):
+        self.connections += 1
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def get_solver(self, name=None):
+        return self.solver
+
+
+def failing_client(profile):
+    raise IOError('no connection')
+
+
+class TestQPUCache:
+    def setup_method(self, method):
+        dwig._qpu_remote = None
+
+    def teardown_method(self, method):
+        dwig._qpu_remote = None
+
+    def client(self, sites):
+        couplers = [(i,j) for i in sites for j in sites if i < j and i//4 != j//4 and i//8 == j//8]
+        return StandInClient(StandInSolver(sites, couplers))
+
+    def get_qpu(self, cache_file, client_factory, **kwargs):
+        dwig._qpu_remote = None
+        return dwig.get_qpu('test', False, 1, cache_file=cache_file, client_factory=client_factory, **kwargs)
+
+    def test_reuse(self, tmpdir, capfd):
+        cache_file = str(tmpdir.join('qpu_cache.json'))
+        client = self.client(range(8))
+
+        qpu = self.get_qpu(cache_file, client)
+        assert(client.connections == 1)
+        assert(len(qpu.sites) == 8 and len(qpu.couplers) == 16)
+        assert(qpu.chip_id == 'stand_in_chip')
+
+        qpu = self.get_qpu(cache_file, client)
+        assert(client.connections == 1)
+        assert(len(qpu.sites) == 8 and len(qpu.couplers) == 16)
+        assert(qpu.solver_name == 'stand_in_solver')
+        assert(qpu.endpoint == 'http://localhost/sapi')
+
+    def test_ttl_and_refresh(self, tmpdir, capfd):
+        cache_file = str(tmpdir.join('qpu_cache.json'))
+        client = self.client(range(8))
+
+        self.get_qpu(cache_file, client)
+        self.get_qpu(cache_file, client, cache_ttl=-1)
+        assert(client.connections == 2)
+
+        self.get_qpu(cache_file, client, refresh_cache=True)
+        assert(client.connections == 3)
+
+    def test_topology_change(self, tmpdir, capfd):
+        cache_file = str(tmpdir.join('qpu_cache.json'))
+
+        self.get_qpu(cache_file, self.client(range(8)))
+        qpu = self.get_qpu(cache_file, self.client(range(7)), refresh_cache=True)
+        assert(len(qpu.sites) == 7)
+
+        with open(cache_file) as file:
+            cache = json.load(file)
+        assert(len(cache) == 1)
+        assert(len(cache['test/default']['sites']) == 7)
+
+    def test_offline(self, tmpdir, capfd):
+        cache_file = str(tmpdir.join('qpu_cache.json'))
+
+        self.get_qpu(cache_file, self.client(range(7)))
+        qpu = self.get_qpu(cache_file, failing_client, cache_ttl=-1)
+        assert(len(qpu.sites) == 7)
+
+        qpu = self.get_qpu(str(tmpdir.join('missing.json')), failing_client)
+        assert(len(qpu.sites) == 8)
+
+    def test_damaged(self, tmpdir, capfd):
+        cache_file = str(tmpdir.join('qpu_cache.json'))
+        client = self.client(range(8))
+
+        for content in [[1, 2], 'text', {'test/default': {'sites': []}}, {'test/default': 'entry'}]:
+            with open(cache_file, 'w') as file:
+                json.dump(content, file)
+            assert(qpu_cache.load_qpu_details(cache_file, 'test/default') == None)
+            qpu = self.get_qpu(cache_file, client)
+            assert(len(qpu.sites) == 8)
+
+        assert(client.connections == 4)
+        with open(cache_file) as file:
+            assert('timestamp' in json.load(file)['test/default'])
+
+    def test_key(self):
+        assert(qpu_cache.cache_key(None) == 'default/default')
+        assert(qpu_cache.cache_key('prod', 'DW_2000Q') == 'prod/DW_2000Q')
@@ -0,0 +1,78 @@
+import sys, random
+
+import pytest
+
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append('.')
+import dwig
+
+from session import Session
+from session import chimera_qpu
+from common import DWIGException
+from common_test import run_dwig_cli
+
+
+class TestSession:
+    def setup_class(self):
+        self.parser = dwig.build_cli_parser()
+        self.qpu = chimera_qpu(16, 4)
+
+    def test_chimera_qpu(self):
+        qpu = dwig.get_qpu(None, True, 16).chimera_degree_filter(4)
+        assert(set(site.index for site in self.qpu.sites) == set(site.index for site in qpu.sites))
+        assert(self.qpu.chimera_degree_view == 4)
+
+    def test_seed(self):
+        for name in ['const', 'ran', 'gd', 'cbfm', 'fl', 'fclg']:
+            first = Session(self.qpu, seed=3)
+            second = Session(self.qpu, seed=3)
+            assert(first.build_dict(getattr(first, name)()) == second.build_dict(getattr(second, name)()))
+
+    def test_global_random(self):
+        random.seed(0)
+        state = random.getstate()
+        session = Session(self.qpu, seed=1)
+        session.build_dict(session.fl())
+        session.build_dict(session.ran(field=True))
+        assert(random.getstate() == state)
+
+    def test_interleaved(self):
+        first = Session(self.qpu, seed=1)
+        second = Session(self.qpu, seed=2)
+        first_cases = []
+        for k in range(3):
+            first_cases.append(first.build_dict(first.fclg()))
+            second.build_dict(second.fl())
+
+        first = Session(self.qpu, seed=1)
+        assert(first_cases == [first.build_dict(first.fclg()) for k in range(3)])
+
+    def test_matches_cli(self):
+        case = run_dwig_cli(self.parser, ['-ic', '-cd', '4', '-tl', '-rs', '5', 'fl', '-s', '3'])
+
+        session = Session(self.qpu, rng=random.Random(5))
+        data = session.build_dict(session.fl(steps=3))
+        for key in ['description', 'metadata']:
+            del case[key]
+        del case['solutions'][0]['evaluation']
+        del data['solutions'][0]['evaluation']
+        assert(case == data)
+
+    def test_wscn(self):
+        session = Session(chimera_qpu(16, 7), seed=0)
+        config = session.wscn()
+        assert(config.qpu.chimera_degree_view == 6)
+
+    def test_executor(self):
+        qpu = chimera_qpu(16, 3)
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            session = Session(qpu, seed=4, executor=executor)
+            shared = [session.build_dict(session.fl(workers=2)) for k in range(2)]
+        session = Session(qpu, seed=4)
+        assert(shared == [session.build_dict(session.fl(workers=2)) for k in range(2)])
+
+    def test_wscn_degree(self):
+        session = Session(chimera_qpu(16, 5), seed=0)
+        with pytest.raises(DWIGException):
+            session.wscn()
@@ -0,0 +1,116 @@
+import sys, json, itertools
+
+if (sys.version_info > (3, 0)):
+    from io import StringIO
+else:
+    from cStringIO import StringIO
+
+import numpy, pytest
+
+sys.path.append('.')
+import evaluate
+import solve
+
+from common import DWIGException
+
+from session import Session
+from session import chimera_qpu
+
+
+def brute_force(model):
+    samples = numpy.array(list(itertools.product([-1, 1], repeat=len(model.variables))), dtype=numpy.int8)
+    energies = model.energies(samples)
+    minimum = energies.min()
+    return minimum, int(numpy.count_nonzero(numpy.isclose(energies, minimum)))
+
+
+class TestExhaustiveSearch:
+    def setup_class(self):
+        session = Session(chimera_qpu(16, 2).cell_filter(2), seed=0)
+        self.assignments = [session.ran(probability=0.7, field=True, steps=2), session.fl(min_loop_length=4, alpha=0.3), session.cbfm()]
+
+    def test_brute_force(self):
+        for assignment in self.assignments:
+            model = evaluate.from_configuration(getattr(assignment, 'qpu_config', assignment))
+            energy, degeneracy = brute_force(model)
+            for low_size in [3, 8, 20]:
+                result = solve.exhaustive_search(model, low_size=low_size)
+                assert(numpy.isclose(result.energy, energy))
+                assert(result.degeneracy == degeneracy)
+                assert(numpy.isclose(model.energies(model.sample_matrix([result.assignment]))[0], energy))
+
+    def test_processes(self):
+        model = evaluate.from_configuration(self.assignments[0].qpu_config)
+        serial = solve.exhaustive_search(model, low_size=6)
+        parallel = solve.exhaustive_search(model, processes=2, low_size=6)
+        assert(numpy.isclose(serial.energy, parallel.energy))
+        assert(serial.degeneracy == parallel.degeneracy)
+
+    def test_certify(self):
+        result, optimal = solve.certify(self.assignments[1], low_size=8)
+        assert(optimal)
+        assert(result.degeneracy >= 2)
+
+
+class TestVariableElimination:
+    def setup_class(self):
+        session = Session(chimera_qpu(16, 2).cell_filter(2), seed=1)
+        self.assignments = [session.ran(probability=0.7, field=True, steps=2), session.fl(min_loop_length=4, alpha=0.3), session.cbfm()]
+        self.strip = Session(chimera_qpu(16).chimera_cell_box_filter((0,0),(1,15)), seed=0)
+
+    def test_exhaustive(self):
+        for assignment in self.assignments:
+            model = evaluate.from_configuration(getattr(assignment, 'qpu_config', assignment))
+            exhaustive = solve.exhaustive_search(model, low_size=8)
+            site_indices = [site.index for site in model.variables]
+            for order in solve.chimera_order(site_indices, 2):
+                result = solve.variable_elimination(model, order)
+                assert(numpy.isclose(result.energy, exhaustive.energy))
+                assert(result.degeneracy == exhaustive.degeneracy)
+                assert(numpy.isclose(model.energies(model.sample_matrix([result.assignment]))[0], exhaustive.energy))
+
+    def test_strip(self):
+        for assignment in [self.strip.fl(), self.strip.fclg(min_loop_length=4)]:
+            result, optimal = solve.certify(assignment, method='elimination')
+            assert(optimal)
+            assert(numpy.isclose(assignment.eval(), result.energy))
+
+            model = evaluate.from_configuration(assignment.qpu_config)
+            assert(numpy.isclose(model.energies(model.sample_matrix([result.assignment]))[0], result.energy))
+
+    def test_frontier_width(self):
+        model = evaluate.from_configuration(self.assignments[1].qpu_config)
+        order = list(range(len(model.variables)))
+        with pytest.raises(DWIGException):
+            solve.variable_elimination(model, order, max_width=solve.frontier_width(model, order)-1)
+
+
+class TestSolveCLI:
+    def test_summary(self, tmpdir):
+        session = Session(chimera_qpu(16, 1), seed=0)
+        data = session.build_dict(session.fl(min_loop_length=4))
+        input_file = str(tmpdir.join('case.json'))
+        with open(input_file, 'w') as file:
+            json.dump(data, file)
+
+        output = StringIO()
+        solve.main(solve.build_cli_parser().parse_args([input_file, '-ia']), output)
+        summary = json.loads(output.getvalue())
+        assert(summary['planted_optimal'])
+        assert(summary['min_energy'] == summary['planted_energy'] or numpy.isclose(summary['min_energy'], summary['planted_energy']))
+        assert(len(summary['assignment']) == summary['variables'])
+
+    def test_elimination_metadata(self, tmpdir):
+        session = Session(chimera_qpu(16, 1), seed=0)
+        data = session.build_dict(session.fl(min_loop_length=4))
+        assert(not 'metadata' in data)
+        input_file = str(tmpdir.join('case.json'))
+        with open(input_file, 'w') as file:
+            json.dump(data, file)
+
+        with pytest.raises(DWIGException):
+            solve.main(solve.build_cli_parser().parse_args([input_file, '-m', 'elimination']), StringIO())
+
+        output = StringIO()
+        solve.main(solve.build_cli_parser().parse_args([input_file]), output)
+        assert(json.loads(output.getvalue())['planted_optimal'])
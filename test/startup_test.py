@@ -0,0 +1,55 @@
+import sys, os, subprocess
+
+import pytest
+
+sys.path.append('.')
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+heavy_modules = ['dwave.cloud', 'dwave_networkx', 'networkx', 'bqpjson', 'jsonschema', 'numpy']
+
+
+def import_times(args):
+    '''Runs python with -X importtime and returns the cumulative import time,
+    in microseconds, of every module that was loaded.
+    '''
+    process = subprocess.run([sys.executable, '-X', 'importtime'] + args, cwd=root_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    assert(process.returncode == 0)
+
+    times = {}
+    total = 0
+    for line in process.stderr.splitlines():
+        if line.startswith('import time:'):
+            fields = line[len('import time:'):].split('|')
+            try:
+                times[fields[2].strip()] = int(fields[1])
+            except ValueError:
+                continue
+            # top level imports are indented by a single space
+            if not fields[2].startswith('  '):
+                total += int(fields[1])
+    return times, total
+
+
+# -X importtime was added in python 3.7
+@pytest.mark.skipif(sys.version_info < (3, 7), reason='requires -X importtime')
+class TestStartup:
+    def check(self, args, needed=[]):
+        times, total = import_times(args)
+        for module in heavy_modules:
+            if not module in needed:
+                assert(module not in times)
+
+    def test_import(self):
+        self.check(['-c', 'import dwig'])
+
+    def test_help(self):
+        self.check(['dwig.py', '--help'])
+
+    def test_offline(self):
+        # the chimera graph and the ran generator are vectorized
+        self.check(['dwig.py', '-ic', '-nv', '-cd', '1', '-tl', 'ran'], needed=['numpy'])
+
+    def test_validation(self):
+        times, total = import_times(['dwig.py', '-ic', '-cd', '1', '-tl', 'ran'])
+        assert('bqpjson' in times)
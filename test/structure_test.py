@@ -0,0 +1,206 @@
+import sys, threading
+
+sys.path.append('.')
+import dwig
+
+from structure import ChimeraQPU
+from structure import ChimeraSite
+from structure import chimera_site_table
+from structure import chimera_graph
+from structure import load_chimera_snapshot
+from structure import save_chimera_snapshot
+
+
+class TestChimeraTopology:
+    def setup_class(self):
+        self.qpu = dwig.get_qpu(None, True, 16).chimera_degree_filter(3)
+
+    def test_ids(self):
+        topology = self.qpu.topology()
+
+        assert(len(topology.sites) == len(self.qpu.sites))
+        assert(len(topology.couplers) == len(self.qpu.couplers))
+        assert(list(topology.site_index) == sorted(site.index for site in self.qpu.sites))
+
+        for k, (i,j) in enumerate(topology.couplers):
+            assert(topology.coupler_id[(i,j)] == k)
+            assert(topology.sites[topology.coupler_i[k]] == i)
+            assert(topology.sites[topology.coupler_j[k]] == j)
+
+    def test_csr(self):
+        topology = self.qpu.topology()
+
+        for k, site in enumerate(topology.sites):
+            incident = [c for c in topology.couplers if site in c]
+            assert([topology.couplers[c] for c in topology.site_incident(k)] == incident)
+
+            neighbors = [j if i == site else i for i,j in incident]
+            assert([topology.sites[n] for n in topology.site_neighbors(k)] == neighbors)
+
+        assert(sum(topology.degree()) == 2*len(topology.couplers))
+
+    def test_coordinates(self):
+        topology = self.qpu.topology()
+
+        for k, site in enumerate(topology.sites):
+            assert(topology.cell[k] == site.chimera_cell)
+            assert(topology.row[k] == site.chimera_row)
+            assert(topology.column[k] == site.chimera_column)
+
+    def test_cached(self):
+        assert(self.qpu.topology() is self.qpu.topology())
+
+
+
+class TestChimeraCellGraph:
+    def setup_class(self):
+        self.qpu = dwig.get_qpu(None, True, 16).chimera_degree_filter(3).spin_filter({9, 33, 70})
+
+    def test_cells(self):
+        cell_graph = self.qpu.cell_graph()
+        assert(cell_graph.cells == sorted(self.qpu.chimera_cells))
+        assert(cell_graph is self.qpu.cell_graph())
+
+    def test_couplers(self):
+        cell_graph = self.qpu.cell_graph()
+
+        for cell in cell_graph.cells:
+            intra = [(i,j) for i,j in self.qpu.sorted_couplers() if i.chimera_cell == cell and j.chimera_cell == cell]
+            assert(cell_graph.intra_couplers[cell] == intra)
+
+        pairs = set()
+        for i,j in self.qpu.couplers:
+            if i.chimera_cell != j.chimera_cell:
+                pairs.add((i.chimera_cell, j.chimera_cell))
+        assert(cell_graph.cell_edges == sorted(pairs))
+
+        for cell_i, cell_j in pairs:
+            between = [(i,j) for i,j in self.qpu.sorted_couplers() if {i.chimera_cell, j.chimera_cell} == {cell_i, cell_j}]
+            assert(cell_graph.cell_couplers[(cell_i, cell_j)] == between)
+            assert(cell_graph.couplers_between(cell_j, cell_i) == between)
+
+        assert(sum(len(c) for c in cell_graph.intra_couplers.values()) + sum(len(c) for c in cell_graph.cell_couplers.values()) == len(self.qpu.couplers))
+
+    def test_reversed_couplers(self):
+        qpu = ChimeraQPU([site.index for site in self.qpu.sites], [(j.index, i.index) for i,j in self.qpu.couplers], 8, 16, self.qpu.site_range, self.qpu.coupler_range)
+        cell_graph = qpu.cell_graph()
+        assert(cell_graph.cell_edges == self.qpu.cell_graph().cell_edges)
+        for cell_i, cell_j in cell_graph.cell_edges:
+            assert(set(cell_graph.cell_couplers[(cell_i, cell_j)]) <= qpu.couplers)
+
+
+class TestChimeraSiteTable:
+    def setup_class(self):
+        self.qpu = dwig.get_qpu(None, True, 16)
+
+    def test_table_matches_sites(self):
+        table = chimera_site_table(16)
+        assert(len(table) == 16*16*8)
+
+        for index in [0, 3, 4, 7, 8, 135, 2047]:
+            site = ChimeraSite(index, 16)
+            for attr in ChimeraSite.__slots__:
+                assert(getattr(table[index], attr) == getattr(site, attr))
+            assert(isinstance(table[index].chimera_cell_row, int))
+
+    def test_interned(self):
+        filtered = self.qpu.chimera_degree_filter(2)
+        table = chimera_site_table(16)
+
+        for site in filtered.sites:
+            assert(site is table[site.index])
+            assert(site in self.qpu.sites)
+
+    def test_slots(self):
+        assert(not hasattr(chimera_site_table(16)[0], '__dict__'))
+
+    def test_threads(self):
+        # a degree that no other test uses, so that every thread extends it
+        threads = [threading.Thread(target=chimera_site_table, args=(5, 8, size)) for size in range(1000, 9000, 500)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        table = chimera_site_table(5)
+        assert(len(table) == 8500)
+        assert(all(site.index == i for i, site in enumerate(table)))
+
+    def test_sorted(self):
+        assert(self.qpu.sorted_sites() == sorted(self.qpu.sites))
+        assert(self.qpu.sorted_couplers() == sorted(self.qpu.couplers))
+        assert(self.qpu.sorted_sites() is self.qpu.sorted_sites())
+
+
+def _indices(qpu):
+    return (set(site.index for site in qpu.sites), set((i.index, j.index) for i,j in qpu.couplers))
+
+
+class TestChimeraQPUView:
+    def setup_class(self):
+        self.qpu = dwig.get_qpu(None, True, 16)
+
+    def test_lazy(self):
+        assert(self.qpu.view().materialize() is self.qpu)
+
+    def test_degree(self):
+        sites, couplers = _indices(self.qpu.view().chimera_degree_filter(2).materialize())
+        assert(len(sites) == 32)
+        assert(all(i in sites and j in sites for i,j in couplers))
+        assert(len(couplers) == 4*16 + 4*4)
+
+    def test_cell_limit(self):
+        for max_cell in range(1, 6):
+            sites, couplers = _indices(self.qpu.view().chimera_degree_filter(3).cell_filter(max_cell).materialize())
+            cells = set(index//8 for index in sites)
+            assert(len(cells) == max_cell)
+            assert(cells <= set([0, 1, 16, 17, 2, 32]))
+
+    def test_box(self):
+        qpu = self.qpu.view().chimera_cell_box_filter((1, 1), (2, 5)).materialize()
+        assert(len(qpu.sites) == 2*5*8)
+        assert(all(1 <= site.chimera_row <= 2 and 1 <= site.chimera_column <= 5 for site in qpu.sites))
+
+    def test_composed(self):
+        view = self.qpu.view().chimera_degree_filter(4).cell_filter(6).chimera_cell_box_filter((0, 0), (1, 1))
+        chained = self.qpu.chimera_degree_filter(4).cell_filter(6).chimera_cell_box_filter((0, 0), (1, 1))
+        assert(_indices(view.materialize()) == _indices(chained))
+        assert(view.materialize().chimera_degree_view == 4)
+
+        view = view.spin_filter([0, 1, 4, 5, 8, 12, 4000])
+        chained = chained.spin_filter([0, 1, 4, 5, 8, 12, 4000])
+        assert(_indices(view.materialize()) == _indices(chained))
+        assert(_indices(chained) == (set([0, 1, 4, 5, 8, 12]), set([(0, 4), (0, 5), (1, 4), (1, 5), (4, 12), (8, 12)])))
+
+    def test_coupler_set(self):
+        coupler_set = [(0, 4), (0, 5), (1, 4), (1, 5), (0, 10)]
+        sites, couplers = _indices(self.qpu.view().chimera_degree_filter(2).coupler_filter(coupler_set).materialize())
+        assert(couplers == set(coupler_set[:4]))
+        assert(sites == set([0, 1, 4, 5]))
+
+        sites, couplers = _indices(self.qpu.view().coupler_filter(coupler_set).spin_filter([0, 1, 4]).materialize())
+        assert(couplers == set([(0, 4), (1, 4)]))
+
+
+class TestChimeraGraph:
+    def test_dwave_networkx(self):
+        import dwave_networkx
+
+        for chimera_degree, cell_size in [(1, 8), (3, 8), (16, 8), (2, 4)]:
+            graph = dwave_networkx.chimera_graph(chimera_degree, chimera_degree, cell_size//2)
+            sites, couplers = chimera_graph(chimera_degree, cell_size)
+
+            assert(sites.tolist() == sorted(graph.nodes()))
+            assert([tuple(c) for c in couplers.tolist()] == sorted((min(i,j), max(i,j)) for i,j in graph.edges()))
+
+    def test_memoized(self):
+        assert(chimera_graph(4) is chimera_graph(4, 8))
+
+    def test_snapshot(self, tmpdir):
+        file_name = str(tmpdir.join('chimera_5.npz'))
+        save_chimera_snapshot(file_name, 5)
+
+        sites, couplers = chimera_graph(5)
+        assert(load_chimera_snapshot(file_name) == (5, 8))
+        assert(chimera_graph(5)[0].tolist() == sites.tolist())
+        assert(chimera_graph(5)[1].tolist() == couplers.tolist())